@@ -0,0 +1,118 @@
+"""Benchmark the library scans on a synthetic movie library.
+
+Run from the repository root with::
+
+    PYTHONPATH=src python benchmarks/bench.py --dirs 10000 --latency-ms 0.5
+
+The library and all caches are created in a temporary dir, unless ``--root`` is given.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import click
+
+BENCHMARKS_DIR = Path(__file__).parent
+
+
+@contextmanager
+def timed(results: Dict[str, float], name: str) -> Iterator[None]:
+    """Measure the wall time of a block and print it."""
+    start = time.perf_counter()
+    yield
+    results[name] = elapsed = time.perf_counter() - start
+    click.echo(f"{name:.<50} {elapsed:8.3f}s")
+
+
+def run_benchmarks(root: Path, dirs: int, latency: float, workers: int) -> Dict[str, float]:
+    """Generate the library if needed, and time each stage."""
+    # The root dir and the cache dir are read from env vars when vidsub is imported
+    os.environ["VIDSUB_ROOT_DIR"] = str(root)
+    os.environ["XDG_CACHE_HOME"] = str(root / "cache")
+    sys.path.insert(0, str(BENCHMARKS_DIR))
+    from click.testing import CliRunner
+    from synthetic import FakeIMDb, generate_library, syscall_latency
+
+    from vidsub import FileManager, MovieManager
+    from vidsub.cache import SqliteCache
+    from vidsub.cli import main
+    from vidsub.constants import MOVIES_DIR
+    from vidsub.library import LibraryIndex
+
+    results: Dict[str, float] = {}
+    if not MOVIES_DIR.exists():
+        with timed(results, f"generate {dirs} dirs"):
+            generate_library(root, dirs)
+
+    cwd = os.getcwd()
+    with syscall_latency(latency):
+        with timed(results, "iter_movie_dirs (no index)"):
+            movie_dirs = list(MovieManager(False).iter_movie_dirs())
+        db_path = root / "cache" / "benchmark-library.sqlite"
+        with timed(results, "iter_movie_dirs (index, cold)"):
+            list(MovieManager(False, LibraryIndex(MOVIES_DIR, db_path)).iter_movie_dirs())
+        with timed(results, "iter_movie_dirs (index, warm)"):
+            list(MovieManager(False, LibraryIndex(MOVIES_DIR, db_path)).iter_movie_dirs())
+
+        with timed(results, "iter_movies_in_dir (1 worker)"):
+            manager = MovieManager(False, workers=1)
+            for movie_dir in movie_dirs:
+                manager.iter_movies_in_dir(movie_dir)
+        with timed(results, f"iter_classified_dirs ({workers} workers)"):
+            manager = MovieManager(False, workers=workers)
+            for _, classifications in manager.iter_classified_dirs(movie_dirs):
+                manager.select_movies(classifications)
+        cache_path = root / "cache" / "benchmark-classification.sqlite"
+        for label in ("cold", "warm"):
+            with timed(results, f"iter_classified_dirs (cache, {label})"):
+                cache = SqliteCache(cache_path, "classification", 10 * len(movie_dirs) + 1000)
+                manager = MovieManager(False, workers=workers, classification_cache=cache)
+                for _, classifications in manager.iter_classified_dirs(movie_dirs):
+                    manager.select_movies(classifications)
+                cache.close()
+
+        try:
+            with timed(results, "FileManager.videos"):
+                FileManager(MOVIES_DIR).videos()
+        finally:
+            os.chdir(cwd)
+        with timed(results, "validate_root"):
+            MovieManager(False).validate_root()
+
+        runner = CliRunner()
+        with timed(results, "vd validate --auto (fake IMDb)"):
+            result = runner.invoke(
+                main, ["validate", "--auto", "-w", str(workers)], obj={"imdb_backend": FakeIMDb()}
+            )
+        if result.exit_code != 0:
+            click.secho(f"validate failed:\n{result.output}", fg="red", err=True)
+    return results
+
+
+@click.command()
+@click.option("--dirs", default=10_000, show_default=True, help="Movie dirs in the synthetic library")
+@click.option(
+    "--latency-ms", default=0.0, show_default=True, help="Latency added to each stat, listing and open"
+)
+@click.option("--workers", "-w", default=8, show_default=True, help="Threads used to classify files")
+@click.option(
+    "--root",
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Reuse a library under this dir (generated on the first run); validate writes files in it",
+)
+@click.option("--json", "json_file", type=click.File("w"), help="Also write the timings as JSON")
+def bench(dirs: int, latency_ms: float, workers: int, root: Optional[Path], json_file):
+    """Benchmark the library scans on a synthetic movie library."""
+    with tempfile.TemporaryDirectory(prefix="vidsub-bench-") as temp_dir:
+        results = run_benchmarks((root or Path(temp_dir)).absolute(), dirs, latency_ms / 1000, workers)
+    if json_file:
+        json.dump({"dirs": dirs, "latency_ms": latency_ms, "workers": workers, "seconds": results}, json_file)
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,174 @@
+"""Synthetic movie library, and helpers to simulate a slow network mount."""
+import builtins
+import os
+import random
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+
+from imdb.Movie import Movie
+
+from vidsub.constants import IGNORE_EXTENSIONS, MOVIE_EXTENSIONS
+
+WORDS = (
+    "alien amazing american black blue city dark day dead death deep dream earth eternal fast final "
+    "ghost girl god golden great green heart hidden house island king last life light lost man "
+    "midnight moon night ocean red return river road secret shadow silent star storm story summer "
+    "sun time war water white wild wind winter woman world"
+).split()
+RELEASES = ("1080p.BluRay.x264", "720p.WEB-DL", "DVDRip.XviD", "2160p.HDR.x265", "")
+SUBTITLE_EXTENSIONS = (".srt", ".sub")
+EXTRA_EXTENSIONS = sorted(IGNORE_EXTENSIONS - set(SUBTITLE_EXTENSIONS) - {".nfo", ".part"})
+
+# Sparse files: big sizes on disk listings, without using disk space
+MIN_MOVIE_SIZE = 700 * 1024**2
+MAX_MOVIE_SIZE = 8 * 1024**3
+
+
+def write_binary(path: Path, size: int, rng: random.Random) -> None:
+    """Write a binary header and extend the file sparsely to the size."""
+    with open(path, "wb") as file:
+        file.write(b"\0" + rng.randbytes(1023))
+        file.truncate(size)
+
+
+def movie_title(index: int, rng: random.Random) -> str:
+    """Return a unique title like ``Lost.Ocean.Story.1987``."""
+    words = ".".join(word.capitalize() for word in rng.sample(WORDS, rng.randint(1, 4)))
+    return f"{words}.{index}.{rng.randint(1950, 2022)}"
+
+
+def generate_library(root: Path, dirs: int, seed: int = 0) -> List[Path]:
+    """Generate a movies dir and an empty completed dir under the root, and return the movie dirs.
+
+    The mix mimics a real library: most dirs have a movie (some with a .nfo file),
+    and some have subtitles, RAR parts, extras, a sample, or no movie at all.
+    """
+    rng = random.Random(seed)
+    movies_dir = root / "movies"
+    movies_dir.mkdir(parents=True, exist_ok=True)
+    (root / "completed").mkdir(exist_ok=True)
+    now = time.time()
+
+    movie_dirs = []
+    for index in range(dirs):
+        title = movie_title(index, rng)
+        release = rng.choice(RELEASES)
+        movie_dir = movies_dir / (f"{title}.{release}" if release else title)
+        movie_dir.mkdir()
+        movie_dirs.append(movie_dir)
+
+        kind = rng.random()
+        if kind < 0.85:
+            extension = rng.choice(sorted(MOVIE_EXTENSIONS))
+            movie = movie_dir / f"{title}{extension}"
+            write_binary(movie, rng.randint(MIN_MOVIE_SIZE, MAX_MOVIE_SIZE), rng)
+            if rng.random() < 0.7 or kind < 0.1:
+                movie.with_suffix(".nfo").write_text(f"https://www.imdb.com/title/tt{index:07}\n")
+            if kind < 0.1:
+                write_binary(movie_dir / f"sample-{title}{extension}", 50 * 1024**2, rng)
+        elif kind < 0.95:
+            for part in range(rng.randint(1, 6)):
+                suffix = ".rar" if part == 0 else f".r{part - 1:02}"
+                write_binary(movie_dir / f"{title}{suffix}", 100 * 1024**2, rng)
+        elif rng.random() < 0.5:
+            (movie_dir / "missing.txt").write_text(f"{title}\n")
+
+        if rng.random() < 0.4:
+            subtitle = movie_dir / f"{title}{rng.choice(SUBTITLE_EXTENSIONS)}"
+            subtitle.write_text("1\n00:00:01,000 --> 00:00:02,000\nHello\n")
+        if rng.random() < 0.3:
+            write_binary(movie_dir / f"cover{rng.choice(EXTRA_EXTENSIONS)}", 2048, rng)
+
+        mtime = now - rng.randint(0, 5 * 365 * 24 * 60 * 60)
+        os.utime(movie_dir, (mtime, mtime))
+    return movie_dirs
+
+
+class FakeIMDb:
+    """IMDb backend that answers locally, with the title and year of the query."""
+
+    def search_movie(self, query: str) -> List[Movie]:
+        words = query.split()
+        year = int(words[-1]) if words and words[-1].isdigit() and len(words[-1]) == 4 else None
+        title = " ".join(words[:-1] if year else words)
+        movie_id = f"{zlib.crc32(query.encode()) % 10**7:07}"
+        return [Movie(movieID=movie_id, data={"title": title, "year": year, "kind": "movie"})]
+
+    def get_movie(self, movie_id: str) -> Movie:
+        return Movie(movieID=movie_id, data={"title": "Fake", "year": 2000, "rating": 7.0})
+
+
+class SlowDirEntry:
+    """Dir entry whose stat() waits, like an uncached stat over sshfs."""
+
+    def __init__(self, entry: os.DirEntry, latency: float) -> None:
+        self._entry = entry
+        self._latency = latency
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def __fspath__(self) -> str:
+        return self._entry.path
+
+    def stat(self, *, follow_symlinks=True):
+        time.sleep(self._latency)
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+
+class SlowScandir:
+    """Context manager and iterator like the one returned by os.scandir()."""
+
+    def __init__(self, iterator, latency: float) -> None:
+        self._iterator = iterator
+        self._latency = latency
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._iterator.close()
+
+    def __iter__(self):
+        return (SlowDirEntry(entry, self._latency) for entry in self._iterator)
+
+    def close(self):
+        self._iterator.close()
+
+
+@contextmanager
+def syscall_latency(seconds: float) -> Iterator[None]:
+    """Add latency to each stat, directory listing and file open, to simulate a network mount."""
+    if seconds <= 0:
+        yield
+        return
+
+    originals = {
+        "stat": os.stat,
+        "lstat": os.lstat,
+        "listdir": os.listdir,
+        "scandir": os.scandir,
+    }
+    original_open = builtins.open
+
+    def slow(function):
+        def wrapper(*args, **kwargs):
+            time.sleep(seconds)
+            return function(*args, **kwargs)
+
+        return wrapper
+
+    os.stat = slow(originals["stat"])
+    os.lstat = slow(originals["lstat"])
+    os.listdir = slow(originals["listdir"])
+    os.scandir = lambda *args: SlowScandir(slow(originals["scandir"])(*args), seconds)
+    builtins.open = slow(original_open)
+    try:
+        yield
+    finally:
+        for name, function in originals.items():
+            setattr(os, name, function)
+        builtins.open = original_open
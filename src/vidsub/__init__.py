@@ -1,29 +1,48 @@
 """Tools for movie files and directories on Kodi."""
+from __future__ import annotations
+
 __version__ = "0.0.0"
 
 import os
-import re
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import click
-import imdb
-import magic
-from clib.files import fzf, shell
+from clib.files import fzf
 from clib.iter import roundrobin
 from clib.ui import failure, success
-from identify import identify
-from slugify import slugify
 
+from vidsub.cache import SqliteCache
+from vidsub.classify import Classification, classify_file
 from vidsub.constants import (
     COMPLETED_DIR,
+    DEFAULT_WORKERS,
     IGNORE_EXTENSIONS,
+    IMDB_PREFETCH_DIRS,
     IMDB_URL,
+    IMDB_WORKERS,
+    MISSING_TXT,
     MOVIE_EXTENSIONS,
     MOVIES_DIR,
     UNIQUE_SEPARATOR,
     VIDEO_EXTENSIONS,
 )
+from vidsub.imdb_cache import CachedIMDb
+from vidsub.library import MEMORY_DB, LibraryIndex, ValidationState
+from vidsub.matching import create_matcher
+from vidsub.probe import ProbeResult, choose_main_movie, probe_file
+from vidsub.scanner import find_files, scandir_newest_first
+from vidsub.search import LibrarySearch, create_entry
+from vidsub.snapshot import Snapshot
+from vidsub.timing import PhaseTimer
+from vidsub.titles import best_match, parse_dir_name
+
+if TYPE_CHECKING:
+    import imdb
+
+    from vidsub.transmission import TransmissionClient
 
 
 class FileManager:
@@ -32,22 +51,46 @@ class FileManager:
 
     def videos(self, *partial_names: str) -> List[str]:
         """List videos in the current dir."""
-        if not partial_names:
-            partial_names = [""]
-        return sorted(
-            file_name
-            for name in partial_names
-            for file_name in shell(f"fd {name}", quiet=True, return_lines=True)
-            if Path(file_name).suffix in VIDEO_EXTENSIONS
-        )
+        return find_files(".", partial_names, VIDEO_EXTENSIONS)
 
 
 class MovieManager:
     """Helper to manage movies."""
 
-    def __init__(self, verbose: bool):
-        self.ia = imdb.IMDb()
+    def __init__(
+        self,
+        verbose: bool,
+        index: Optional[LibraryIndex] = None,
+        workers: int = DEFAULT_WORKERS,
+        classification_cache: Optional[SqliteCache] = None,
+        ia: Optional[CachedIMDb] = None,
+        probe_cache: Optional[SqliteCache] = None,
+    ):
+        self.ia = ia if ia is not None else CachedIMDb()
         self.verbose = verbose
+        self.index = index
+        self.workers = max(workers, 1)
+        self.classification_cache = classification_cache
+        self.probe_cache = probe_cache
+        # Listings made once per manager: the root newest first, and the movie dirs that were read without the index
+        self.listings: Dict[str, List[os.DirEntry]] = {}
+        # Dir mtimes already known from the index or from a listing
+        self.mtimes: Dict[Path, int] = {}
+        self.transmission: Optional[TransmissionClient] = None
+        self.timer = PhaseTimer()
+        self._library_index: Optional[LibraryIndex] = None
+        # Read from a snapshot made where the disk is, instead of from the mount; the dirs are in the index
+        self.snapshot: Optional[Snapshot] = None
+
+    def close(self) -> None:
+        """Save and close the caches."""
+        if self.classification_cache:
+            self.classification_cache.close()
+        if self.probe_cache:
+            self.probe_cache.close()
+        self.ia.close()
+        if self.transmission:
+            self.transmission.close()
 
     def format_imdb_url(self, movie: imdb.Movie.Movie) -> str:
         """Format IMDb URL."""
@@ -74,10 +117,18 @@ class MovieManager:
         rating = movie.get("rating", "Not rated")
         return f"{title} ({year})\nRating: {rating}\n{url}"
 
-    @staticmethod
-    def validate_root() -> bool:
+    def validate_root(self) -> bool:
         """Validate if both root dirs doen't have single files."""
-        root_files = [str(path) for path in MOVIES_DIR.iterdir() if not path.is_dir()]
+        if self.snapshot:
+            root_files = [str(MOVIES_DIR / name) for name in self.snapshot.root_files]
+        elif self.index:
+            # The refresh of the index lists the root: the files it found there are kept, without listing it again
+            if not self.index.refreshed:
+                self.index.refresh()
+            root_files = self.index.root_files
+        else:
+            # Reuse the listing of the movie dirs: the type of each entry comes with it, without a stat
+            root_files = [entry.path for entry in self.scandir(MOVIES_DIR) if not entry.is_dir()]
         if root_files:
             failure("There are files in the root dir! Move them to subdirectories.")
             failure("  " + "\n  ".join(root_files))
@@ -85,32 +136,90 @@ class MovieManager:
         success(f"No single files under {MOVIES_DIR}")
         return True
 
-    @staticmethod
-    def validate_completed() -> bool:
+    def validate_completed(self) -> bool:
         """Validate if the completed dir is empty."""
-        wrong: List[Path] = list(COMPLETED_DIR.iterdir())
+        if self.snapshot:
+            wrong: List[Path] = [COMPLETED_DIR / name for name in self.snapshot.completed]
+        else:
+            wrong = list(COMPLETED_DIR.iterdir())
         if not wrong:
             success(f"No item under {COMPLETED_DIR}")
             return True
 
         failure(
-            f"Files/directories found under {COMPLETED_DIR}. Move them to the correct directory."
+            f"Files/directories found under {COMPLETED_DIR}. Move them to movie dirs with: vd ingest"
         )
         for item in wrong:
             failure(f"  {item}")
         return False
 
+    @staticmethod
+    def imdb_query_parts(movie_dir: Path) -> List[str]:
+        """Split the dir name into parts of the first IMDb query."""
+        from slugify import slugify
+
+        slugged: str = slugify(movie_dir.name, separator=UNIQUE_SEPARATOR)
+        return slugged.split(UNIQUE_SEPARATOR)
+
+    @staticmethod
+    def needs_imdb_lookup(file_names: Set[str], force=False) -> bool:
+        """Tell if validating a dir will search IMDb, to write a .nfo or a missing.txt file."""
+        if force:
+            return True
+        if any(Path(name).suffix.lower() == ".nfo" for name in file_names):
+            return False
+        has_movie = any(Path(name).suffix.lower() in MOVIE_EXTENSIONS for name in file_names)
+        return has_movie or MISSING_TXT not in file_names
+
+    def prefetch_imdb(
+        self, movie_dirs: Iterable[Path], force=False, auto=False
+    ) -> Iterator[Path]:
+        """Iterate over movie dirs in order, searching IMDb in the background for the dirs ahead.
+
+        When the interactive search reaches a dir, the results of its first query are ready.
+        """
+        window: Deque[Path] = deque()
+        with ThreadPoolExecutor(max_workers=IMDB_WORKERS) as executor:
+            for movie_dir in movie_dirs:
+                if self.needs_imdb_lookup(self.file_names(movie_dir), force):
+                    if auto:
+                        query = parse_dir_name(movie_dir.name).query
+                    else:
+                        query = " ".join(self.imdb_query_parts(movie_dir))
+                    self.ia.prefetch(query, executor)
+                window.append(movie_dir)
+                if len(window) > IMDB_PREFETCH_DIRS:
+                    yield window.popleft()
+            yield from window
+
+    def auto_match_imdb(
+        self, movie_dir: Path, threshold: float
+    ) -> Optional[imdb.Movie.Movie]:
+        """Search IMDb without asking; return the best title only if it clearly matches the dir name."""
+        parsed = parse_dir_name(movie_dir.name)
+        if self.verbose:
+            click.echo(f"Searching IMDb with: {parsed.query}")
+        with self.timer.phase("imdb"):
+            candidates = self.ia.search_movie(parsed.query)
+        movie, score = best_match(parsed, candidates, threshold)
+        if self.verbose:
+            if movie:
+                click.echo(f"  Matched {self.format_info(movie)} (score {score:.2f})")
+            else:
+                click.echo(f"  No clear match (best score {score:.2f})")
+        return movie
+
     def search_imdb(self, movie_dir: Path, verbose=False) -> Optional[imdb.Movie.Movie]:
         """Search the movie directory on IMDb."""
-        slugged: str = slugify(movie_dir.name, separator=UNIQUE_SEPARATOR)
-        parts = slugged.split(UNIQUE_SEPARATOR)
+        parts = self.imdb_query_parts(movie_dir)
         movies: Optional[imdb.Movie.Movie] = None
         chosen_line: Optional[str] = None
         choices: List[str] = []
         while parts:
             query = " ".join(parts)
             click.echo(f"Searching IMDb with: {query}")
-            movies = self.ia.search_movie(query)
+            with self.timer.phase("imdb"):
+                movies = self.ia.search_movie(query)
             if movies:
                 choices = [self.format_info(movie) for movie in movies]
                 if not verbose:
@@ -136,53 +245,187 @@ class MovieManager:
                 return movie
         return None
 
-    @staticmethod
-    def iterdir_newest_first(*dirs):
+    def scandir(self, dir_: Union[Path, str]) -> List[os.DirEntry]:
+        """List a dir newest first, only once per manager."""
+        key = str(dir_)
+        if key not in self.listings:
+            self.listings[key] = scandir_newest_first(dir_)
+        return self.listings[key]
+
+    def list_dir(self, movie_dir: Path) -> List[os.DirEntry]:
+        """List a movie dir once per manager: the IMDb prefetch, the classification and the validation all read it."""
+        key = str(movie_dir)
+        if key not in self.listings:
+            with os.scandir(movie_dir) as iterator:
+                self.listings[key] = list(iterator)
+        return self.listings[key]
+
+    def iterdir_newest_first(self, *dirs) -> Iterator[os.DirEntry]:
         """Iterate over dirs sorting by newest first."""
-        iterables = [
-            [
-                Path(dir_) / item
-                # TODO: ls -1 -t on Linux
-                for item in shell(f"exa -1s age {dir_}", quiet=True, return_lines=True)
-            ]
-            for dir_ in dirs
-        ]
-        yield from roundrobin(*iterables)
-
-    @classmethod
-    def iter_movie_dirs(cls, patterns: Tuple[str] = None):
-        """Iterate over movie directories."""
-        regex = re.compile(".*".join(patterns), re.IGNORECASE) if patterns else None
-        for movie_path in cls.iterdir_newest_first(MOVIES_DIR):
-            if not movie_path.is_dir():
+        yield from roundrobin(*[self.scandir(dir_) for dir_ in dirs])
+
+    def iter_movie_dirs(self, patterns: Tuple[str] = None, since_ns: int = 0):
+        """Iterate over movie directories, newest first.
+
+        With ``since_ns``, dirs modified before then are pruned by their mtime alone, without listing them.
+        """
+        matcher = create_matcher(patterns)
+        if self.index:
+            # Dirs in the index are already known to be dirs: no need to stat them again
+            for record in self.index.iter_dirs(since_ns):
+                if matcher.match(record.path.name):
+                    self.mtimes[record.path] = record.mtime_ns
+                    yield record.path
+            return
+
+        for entry in self.iterdir_newest_first(MOVIES_DIR):
+            mtime_ns = entry.stat().st_mtime_ns
+            if mtime_ns < since_ns:
+                # Entries are sorted newest first: all the next ones are older
+                break
+            if not entry.is_dir():
                 continue
-            if not regex or (regex and regex.findall(movie_path.name)):
+            if matcher.match(entry.name):
+                movie_path = Path(entry.path)
+                self.mtimes[movie_path] = mtime_ns
                 yield movie_path
 
-    @staticmethod
-    def count_movies() -> int:
-        """Return the count of movies in both dirs."""
-        return int(
-            shell(
-                f"ls -1 {MOVIES_DIR} | wc -l | xargs",
-                quiet=True,
-                return_lines=True,
-            )[0]
-        )
+    def recent_movies(self, movie_dir: Path, since_ns: int) -> List[Path]:
+        """Return the movies in a dir that were modified since a time.
+
+        Files come from the index when it knows the dir, otherwise from one scandir with the stat of each entry.
+        """
+        files = self.index.files(movie_dir) if self.index else []
+        if files or self.snapshot:
+            return [
+                movie_dir / file.name
+                for file in files
+                if Path(file.name).suffix.lower() in MOVIE_EXTENSIONS and file.mtime_ns > since_ns
+            ]
+        with os.scandir(movie_dir) as entries:
+            return [
+                Path(entry.path)
+                for entry in entries
+                if Path(entry.name).suffix.lower() in MOVIE_EXTENSIONS and entry.stat().st_mtime_ns > since_ns
+            ]
+
+    @property
+    def read_only(self) -> bool:
+        """Tell if the library is read from a snapshot, without the mount to write files in it."""
+        return self.snapshot is not None and not MOVIES_DIR.exists()
+
+    def dir_exists(self, movie_dir: Path) -> bool:
+        """Tell if a movie dir exists, from the snapshot when there is one."""
+        if self.snapshot and self.index:
+            return self.index.record(movie_dir) is not None
+        return movie_dir.exists()
+
+    def library_index(self) -> LibraryIndex:
+        """Return the library index; with --no-index, one in memory, filled by walking the whole movies dir."""
+        if self.index:
+            return self.index
+        if not self._library_index:
+            self._library_index = LibraryIndex(MOVIES_DIR, MEMORY_DB)
+        return self._library_index
+
+    def library_search(self) -> LibrarySearch:
+        """Load the in-memory search over the library, updated with the dirs that changed in the library index.
+
+        With --no-index, the search is built from the walk of the movies dir, without its snapshot.
+        """
+        if not self.index:
+            index = self.library_index()
+            return LibrarySearch([create_entry(index, record, self.ia.movie_cache) for record in index.iter_dirs()])
+        return LibrarySearch.load(self.index, self.ia.movie_cache)
+
+    def skip_validated(
+        self, movie_dirs: Iterable[Path], state: ValidationState
+    ) -> Iterator[Path]:
+        """Skip dirs that passed the last validation and didn't change since then."""
+        for movie_dir in movie_dirs:
+            mtime_ns = self.mtimes.get(movie_dir) or movie_dir.stat().st_mtime_ns
+            if state.passed(movie_dir, mtime_ns):
+                if self.verbose:
+                    click.echo(f"\nUnchanged since the last validation: '{movie_dir}'")
+                continue
+            yield movie_dir
+
+    def file_names(self, movie_dir: Path) -> Set[str]:
+        """Return the names of the files in a movie dir, from the index when available."""
+        if self.index:
+            return {file.name for file in self.index.files(movie_dir)}
+        return {entry.name for entry in self.list_dir(movie_dir)}
+
+    def list_files(self, movie_dir: Path) -> List[Path]:
+        """List the files in a movie dir, from the index when available."""
+        if self.index:
+            return [
+                movie_dir / record.name
+                for record in self.index.files(movie_dir)
+                if not record.is_dir
+            ]
+        return [Path(entry.path) for entry in self.list_dir(movie_dir)]
+
+    def iter_classified_dirs(
+        self, movie_dirs: Iterable[Path], use_magic=False
+    ) -> Iterator[Tuple[Path, List[Classification]]]:
+        """Iterate over movie dirs and the classified files of each one.
+
+        Files are classified in a thread pool, a few dirs ahead of the one being yielded,
+        so the slow reads of file headers overlap. Dirs are yielded in their original order.
+        """
+        pending: Deque[Tuple[Path, List[Future]]] = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for movie_dir in movie_dirs:
+                with self.timer.phase("scan"):
+                    files = self.list_files(movie_dir)
+                futures = [
+                    self._snapshot_classification(file)
+                    if self.snapshot
+                    else executor.submit(classify_file, file, use_magic, self.classification_cache)
+                    for file in files
+                ]
+                pending.append((movie_dir, futures))
+                if len(pending) > self.workers:
+                    yield self._pop_classified(pending)
+            while pending:
+                yield self._pop_classified(pending)
+
+    def _snapshot_classification(self, file: Path) -> Future:
+        """Return the classification made where the disk is, as a finished future."""
+        future: Future = Future()
+        future.set_result(Classification(file, bool(self.snapshot and str(file) in self.snapshot.binary)))
+        return future
+
+    def _pop_classified(
+        self, pending: Deque[Tuple[Path, List[Future]]]
+    ) -> Tuple[Path, List[Classification]]:
+        movie_dir, futures = pending.popleft()
+        # Only the time waiting for the results counts: the rest overlaps with the other phases
+        with self.timer.phase("classify"):
+            return movie_dir, [future.result() for future in futures]
 
-    @staticmethod
     def iter_movies_in_dir(
-        movie_dir: Path, verbose=False, use_magic=False
+        self, movie_dir: Path, verbose=False, use_magic=False
     ) -> List[Path]:
         """Iterate over movies in a dir."""
+        for _, classifications in self.iter_classified_dirs([movie_dir], use_magic):
+            return self.select_movies(classifications, verbose, use_magic)
+        return []
+
+    @staticmethod
+    def select_movies(
+        classifications: List[Classification], verbose=False, use_magic=False
+    ) -> List[Path]:
+        """Select movies among the classified files of a dir."""
         found_movies: List[Path] = []
-        for file in movie_dir.iterdir():
-            tags = identify.tags_from_path(str(file))
-            if "binary" not in tags:
+        for classification in classifications:
+            if not classification.binary:
                 continue
 
+            file = classification.path
             if use_magic:
-                mime_type = magic.from_file(str(file), mime=True)
+                mime_type = classification.mime_type or ""
                 if (
                     mime_type.startswith("video")
                     and file.suffix.lower() not in IGNORE_EXTENSIONS
@@ -211,25 +454,50 @@ class MovieManager:
 
         return found_movies
 
-    @staticmethod
-    def iter_torrent_dirs(patterns: Tuple[str] = None):
-        """Iterate over torrent directories."""
-        import transmissionrpc
+    def choose_main_movie(self, found_movies: List[Path]) -> Optional[Path]:
+        """Choose the main movie by the duration in the headers of the videos (or by size), skipping samples.
+
+        With a snapshot, the videos were probed where the disk is: they are not read again.
+        """
+        with self.timer.phase("probe"):
+            if self.snapshot:
+                # Movies are the binary files of the snapshot, which all have a probe result
+                probes = self.snapshot.probes
+                results = [probes.get(str(movie)) or ProbeResult(movie, 0) for movie in found_movies]
+            else:
+                results = [probe_file(movie, self.probe_cache) for movie in found_movies]
+        if self.verbose:
+            for result in results:
+                duration = f"{result.duration / 60:.0f} min" if result.duration else "unknown duration"
+                resolution = f", {result.width}x{result.height}" if result.width else ""
+                extra = f" ({result.extra})" if result.extra else ""
+                click.echo(f"  Probed: {result.path.name}: {duration}{resolution}{extra}")
+        main_movie = choose_main_movie(results)
+        return main_movie.path if main_movie else None
+
+    def iter_torrent_dirs(self, patterns: Tuple[str] = None, recently_active=False):
+        """Iterate over torrent directories.
+
+        All torrents are fetched in one request, on a connection kept for the lifetime of the manager.
+        """
+        matcher = create_matcher(patterns)
 
-        regex = re.compile(".*".join(patterns), re.IGNORECASE) if patterns else None
+        if not self.transmission:
+            # Imported here: http.client and ssl are slow to load, and only needed for torrents
+            from vidsub.transmission import TransmissionClient
 
-        tc = transmissionrpc.Client("localhost", port=9091)
+            self.transmission = TransmissionClient()
 
-        for torrent in tc.get_torrents():
-            files = torrent.files().values()
+        for torrent in self.transmission.get_torrents(recently_active=recently_active):
+            files = torrent["files"]
             if not files:
                 # Recently added torrents might not have files yet
                 continue
 
             paths = {
-                (Path("~" + torrent.downloadDir) / file["name"]).expanduser().parent
-                for file in torrent.files().values()
+                (Path("~" + torrent["downloadDir"]) / file["name"]).expanduser().parent
+                for file in files
             }
             movie_path = Path(sorted(paths)[0])
-            if not regex or (regex and regex.findall(movie_path.name)):
+            if matcher.match(movie_path.name):
                 yield movie_path
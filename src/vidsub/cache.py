@@ -0,0 +1,101 @@
+"""Persistent key-value caches stored in SQLite."""
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Access times are saved in batches instead of one write per lookup,
+# and the eviction of old entries runs once per batch of inserts
+FLUSH_EVERY = 500
+
+
+class SqliteCache:
+    """Key-value cache with JSON values, least-recently-used eviction and optional expiry.
+
+    It can be shared by threads; access to the connection is serialized by a lock.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        table: str,
+        max_entries: int,
+        ttl: Optional[float] = None,
+    ) -> None:
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._accessed: Dict[str, float] = {}
+        self._inserted = 0
+        self._lock = threading.Lock()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Imported here: the module is slow to load, and commands like --help don't open a cache
+        import sqlite3
+
+        self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)"
+        )
+        self.connection.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a cached value, or None if it's missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if not row or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[key] = now
+            if len(self._accessed) >= FLUSH_EVERY:
+                self._flush()
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used ones when the cache is full."""
+        now = time.time()
+        with self._lock:
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._inserted += 1
+            if self._inserted >= FLUSH_EVERY:
+                self._flush()
+            else:
+                self.connection.commit()
+
+    def _flush(self) -> None:
+        """Save access times and evict the least recently used entries."""
+        self.connection.executemany(
+            f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in self._accessed.items()],
+        )
+        self.connection.execute(
+            f"DELETE FROM {self.table} WHERE key IN"
+            f" (SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self.connection.commit()
+        self._accessed.clear()
+        self._inserted = 0
+
+    def close(self) -> None:
+        """Save pending changes and close the database."""
+        with self._lock:
+            self._flush()
+            self.connection.close()
@@ -0,0 +1,84 @@
+"""Classification of files by content: binary check and MIME type."""
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from vidsub.cache import SqliteCache
+from vidsub.constants import CACHE_DIR
+
+CLASSIFICATION_DB = CACHE_DIR / "classification.sqlite"
+CLASSIFICATION_MAX_ENTRIES = 200_000
+
+if TYPE_CHECKING:
+    import magic
+
+_local = threading.local()
+
+
+@dataclass(frozen=True)
+class Classification:
+    """What was detected by reading the header of a file."""
+
+    path: Path
+    binary: bool
+    mime_type: Optional[str] = None
+
+
+def _mime_detector() -> "magic.Magic":
+    """Return a libmagic instance for the current thread.
+
+    The module-level ``magic.from_file()`` shares one instance behind a lock,
+    which would serialize all threads.
+    """
+    detector = getattr(_local, "detector", None)
+    if detector is None:
+        import magic
+
+        detector = _local.detector = magic.Magic(mime=True)
+    return detector
+
+
+def create_classification_cache() -> SqliteCache:
+    """Create the persistent cache of classification results."""
+    return SqliteCache(CLASSIFICATION_DB, "classification", CLASSIFICATION_MAX_ENTRIES)
+
+
+def classify_file(
+    path: Path, use_magic: bool = False, cache: Optional[SqliteCache] = None
+) -> Classification:
+    """Classify a file; the MIME type is only detected for binary files.
+
+    With a cache, the file is only read when its path, size, mtime or inode changed.
+    """
+    if cache is None:
+        return _classify(path, use_magic)
+
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+    cached = cache.get(str(path))
+    if cached and cached["signature"] == signature:
+        if not (use_magic and cached["binary"] and cached["mime_type"] is None):
+            return Classification(path, cached["binary"], cached["mime_type"])
+        classification = Classification(path, True, _mime_detector().from_file(str(path)))
+    else:
+        classification = _classify(path, use_magic)
+
+    cache.set(
+        str(path),
+        {
+            "signature": signature,
+            "binary": classification.binary,
+            "mime_type": classification.mime_type,
+        },
+    )
+    return classification
+
+
+def _classify(path: Path, use_magic: bool) -> Classification:
+    from identify import identify
+
+    binary = "binary" in identify.tags_from_path(str(path))
+    mime_type = _mime_detector().from_file(str(path)) if binary and use_magic else None
+    return Classification(path, binary, mime_type)
@@ -14,30 +14,152 @@ Why does this file exist, and why not put this in __main__?
 
   Also see (1) from http://click.pocoo.org/5/setuptools/#setuptools-integration
 """
+import codecs
+import os
 import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Tuple, Union
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, TextIO, Tuple, Union
 
 import click
 from clib import verbose_option
 from clib.files import fzf, shell
 from clib.ui import AliasedGroup, failure
-from slugify import slugify
 
 from vidsub import MOVIE_EXTENSIONS, FileManager, MovieManager
-from vidsub.constants import IMDB_SEARCH_URL, MISSING_TXT, MOVIES_DIR, TORRENT_SEARCH_COMMAND
+from vidsub.classify import create_classification_cache
+from vidsub.constants import (
+    AUTO_THRESHOLD,
+    COMPLETED_DIR,
+    DEFAULT_WORKERS,
+    IMDB_SEARCH_URL,
+    IMDB_URL,
+    INGEST_WORKERS,
+    MISSING_TXT,
+    MOVIES_DIR,
+    SUBTITLE_EXTENSIONS,
+    SUBTITLE_TIMEOUT,
+    SUBTITLE_WORKERS,
+    SUBTITLES_SCRIPT,
+    TORRENT_SEARCH_COMMAND,
+    WATCH_POLL_INTERVAL,
+    WATCH_SETTLE,
+)
+from vidsub.dupes import find_identical_files, group_by_imdb_id
+from vidsub.imdb_cache import CachedIMDb
+from vidsub.ingest import iter_file_moves, move_items, plan_items
+from vidsub.jobs import Job, JobResult, JobScheduler, echo_summary
+from vidsub.library import FileRecord, LibraryIndex, MovieDirRecord, ValidationState
+from vidsub.listing import human_size, iter_index_listing, iter_listings, list_existing
+from vidsub.matching import create_matcher
+from vidsub.probe import create_probe_cache
+from vidsub.profiling import Profiler
+from vidsub.snapshot import SnapshotError, iter_records, load_snapshot, write_ndjson
+from vidsub.subtitle import BACKUP_SUFFIX, DEFAULT_FPS, ENCODINGS, format_srt, read_srt, rewrite_subtitles
+from vidsub.sync import BIN_SIZE, align, apply, reference_timeline
+from vidsub.watch import InotifyWatcher, SettleQueue, create_watcher
+
+if TYPE_CHECKING:
+    from imdb.Movie import Movie
 
 
 @click.group(cls=AliasedGroup)
-def main():
+@click.option(
+    "--index/--no-index",
+    "use_index",
+    default=True,
+    help="Read movie dirs from the on-disk library index instead of walking the whole movies dir;"
+    " scan and watch always update the index",
+)
+@click.option(
+    "--profile",
+    "profile_file",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help="Write a JSON report with phase timings, syscall and subprocess counts, IMDb requests and cache hit rates",
+)
+@click.option(
+    "--pstats",
+    "pstats_file",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help="Write cProfile stats of the main thread, to read with pstats or snakeviz",
+)
+@click.option(
+    "--snapshot",
+    "snapshot_file",
+    type=click.File("r", encoding="utf-8"),
+    help="Read the library from a NDJSON snapshot made by 'vd scan --emit ndjson' (a file, a pipe or - for stdin)"
+    " instead of from the mount",
+)
+@click.pass_context
+def main(
+    ctx: click.Context,
+    use_index: bool,
+    profile_file: Optional[Path],
+    pstats_file: Optional[Path],
+    snapshot_file: Optional[TextIO],
+):
     """Tools for movie files and directories on Kodi."""
-    if not MOVIES_DIR.exists():
+    if not MOVIES_DIR.exists() and not snapshot_file:
         command = "sshfs osmc@styx:/mnt/wd/ ~/data"
         click.secho(
             f"SSH dir not mounted. Run this command:\n{command}", fg="bright_red"
         )
         sys.exit(1)
+    obj = ctx.ensure_object(dict)
+    obj["use_index"] = use_index
+    obj["snapshot_file"] = snapshot_file
+    if profile_file or pstats_file:
+        profiler = Profiler(pstats_file)
+        profiler.start()
+        obj["profiler"] = profiler
+        # Called after the subcommand closed its managers
+        ctx.call_on_close(lambda: profiler.finish(profile_file))
+
+
+def create_manager(
+    obj: dict,
+    verbose: bool = False,
+    workers: int = DEFAULT_WORKERS,
+    use_cache: bool = True,
+) -> MovieManager:
+    """Create a movie manager with the options of the main group.
+
+    Its caches are saved when the command ends.
+    """
+    snapshot_file = obj.get("snapshot_file")
+    index = LibraryIndex(MOVIES_DIR) if obj.get("use_index") or snapshot_file else None
+    # A different IMDb backend can be passed on the context object, e.g. a fake one in benchmarks
+    imdb_backend = obj.get("imdb_backend")
+    if use_cache:
+        manager = MovieManager(
+            verbose,
+            index,
+            workers,
+            create_classification_cache(),
+            CachedIMDb.with_default_caches(imdb_backend),
+            create_probe_cache(),
+        )
+    else:
+        manager = MovieManager(verbose, index, workers, ia=CachedIMDb(imdb_backend))
+    click.get_current_context().call_on_close(manager.close)
+    if snapshot_file:
+        if "snapshot" not in obj:
+            try:
+                obj["snapshot"] = load_snapshot(snapshot_file, index)
+            except SnapshotError as error:
+                failure(f"Invalid snapshot {snapshot_file.name}: {error}", 1)
+        else:
+            # Loaded by a previous manager of the same command
+            index.refreshed = True
+        manager.snapshot = obj["snapshot"]
+    profiler: Optional[Profiler] = obj.get("profiler")
+    if profiler:
+        profiler.managers.append(manager)
+    return manager
 
 
 @main.command()
@@ -59,9 +181,62 @@ def ls_videos(dir_, partial_names):
     default=False,
     help=f"Force creation of {MISSING_TXT} and .nfo files",
 )
+@click.option(
+    "--workers",
+    "-w",
+    default=DEFAULT_WORKERS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Threads used to read file headers",
+)
+@click.option(
+    "--use-magic",
+    is_flag=True,
+    default=False,
+    help="Detect movies by MIME type with libmagic, not only by extension",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Read file headers and query IMDb again, instead of using cached results",
+)
+@click.option(
+    "--auto",
+    "-a",
+    is_flag=True,
+    default=False,
+    help="Choose IMDb titles that clearly match the dir name without asking; review the others at the end",
+)
+@click.option(
+    "--threshold",
+    default=AUTO_THRESHOLD,
+    show_default=True,
+    type=click.FloatRange(0, 1),
+    help="Minimum score to choose an IMDb title without asking",
+)
+@click.option(
+    "--changed-only",
+    "-c",
+    is_flag=True,
+    default=False,
+    help="Skip dirs that passed the last validation and didn't change since then",
+)
 @verbose_option
 @click.argument("movie_name", nargs=-1, required=False)
-def validate(force: bool, verbose: bool, movie_name: Tuple[str]):
+@click.pass_obj
+def validate(
+    obj: dict,
+    force: bool,
+    workers: int,
+    use_magic: bool,
+    no_cache: bool,
+    auto: bool,
+    threshold: float,
+    changed_only: bool,
+    verbose: bool,
+    movie_name: Tuple[str],
+):
     """Validate movie files and dirs.
 
     Check root and completed dirs, and missing movies (empty dirs).
@@ -69,112 +244,275 @@ def validate(force: bool, verbose: bool, movie_name: Tuple[str]):
     if force:
         click.echo(f"Force creation of {MISSING_TXT} and .nfo files")
 
-    manager = MovieManager(verbose)
+    manager = create_manager(obj, verbose, workers, not no_cache)
+    if use_magic and manager.snapshot:
+        failure("MIME types are not in snapshots: run without --use-magic", 2)
+    if force:
+        check_writable(manager, MOVIES_DIR)
     if not (manager.validate_root() and manager.validate_completed()):
         sys.exit(1)
 
+    state = ValidationState() if changed_only and not force else None
+    auto_stats = AutoStats()
+    processed = 0
+    start = time.monotonic()
+    timer = manager.timer
+    # The filtered dirs are collected in a list before the progress bar starts, so its length is exact;
+    # only the classification of their files is streamed, a few dirs ahead
+    with timer.phase("scan"):
+        movie_dirs: Iterable[Path] = manager.iter_movie_dirs(movie_name)
+        if state:
+            movie_dirs = manager.skip_validated(movie_dirs, state)
+        movie_dirs = list(movie_dirs)
     with click.progressbar(
-        MovieManager.iter_movie_dirs(movie_name),
-        length=MovieManager.count_movies(),
+        length=len(movie_dirs),
         label="Validating directories",
         item_show_func=lambda path: str(path) if path else "",
     ) as bar:
-        for movie_dir in bar:
+        movie_dirs = manager.prefetch_imdb(movie_dirs, force, auto)
+        for movie_dir, classifications in manager.iter_classified_dirs(
+            movie_dirs, use_magic
+        ):
+            bar.update(1, movie_dir)
+            processed += 1
             if verbose:
                 click.echo(f"\nMovie directory: '{movie_dir}'")
 
-            missing_txt = (
-                movie_dir / MISSING_TXT
-            )  # TODO feat: save file as json or toml
-
-            # TODO feat: remove .xml files and confirm each file
-            # TODO feat: add .nomedia to subdirs https://kodi.wiki/view/Update_Music_Library#Exclude_Folder
-            # TODO feat: check VIDEO_TS for movies
-
-            found_movies = manager.iter_movies_in_dir(movie_dir, verbose)
-            if found_movies:
-                # Remove it once a movie is found
-                if missing_txt.exists():
-                    missing_txt.unlink()
-
-                main_movie: Optional[Path] = None
-                for found_movie in found_movies:
-                    if found_movie.with_suffix(".nfo").exists():
-                        main_movie = found_movie
-                        break
-
-                if len(found_movies) == 1:
-                    main_movie = found_movies[0]
-                elif not main_movie:
-                    # If a .nfo file doesn't exist, select the main movie
-                    # A dir can have multiple movies; use fzf to select the main one
-                    click.echo("\nSelect the main movie:")
-                    chosen_movie = fzf(found_movies)
-                    if not chosen_movie:
-                        click.secho("No main movie selected", fg="red")
-                        continue
-                    main_movie = Path(chosen_movie)
-                if verbose:
-                    click.echo(f"  Main movie: {main_movie.name}")
-
-                # TODO feat: remove all other .nfo files, keep only this one
-                # https://kodi.wiki/view/NFO_files
-                nfo_file = main_movie.with_suffix(".nfo")
-                if nfo_file.exists() and not force:
-                    stat = nfo_file.stat()
-                    if verbose:
-                        click.echo(
-                            f"  NFO file..: {nfo_file.name} (size in bytes: {stat.st_size})"
-                        )
+            found_movies = manager.select_movies(classifications, verbose, use_magic)
+            valid = validate_movie_dir(
+                manager,
+                movie_dir,
+                found_movies,
+                force,
+                auto_stats if auto else None,
+                threshold,
+            )
+            if state:
+                with timer.phase("write"):
+                    state.record(movie_dir, valid, manager.mtimes.get(movie_dir) if manager.read_only else None)
+
+    if verbose:
+        timer.echo()
+    if not auto:
+        return
+
+    elapsed = time.monotonic() - start
+    click.echo(
+        f"\n{processed} dirs in {elapsed:.1f}s ({processed / max(elapsed, 1e-6):.1f} dirs/s)"
+    )
+    if auto_stats.attempted:
+        click.echo(
+            f"IMDb titles chosen automatically: {auto_stats.accepted} of {auto_stats.attempted}"
+            f" ({auto_stats.accepted / auto_stats.attempted:.0%})"
+        )
+    for movie_dir, nfo_file in auto_stats.review:
+        click.echo(f"\nReview the IMDb title of: '{movie_dir}'")
+        imdb_movie = manager.search_imdb(movie_dir, True)
+        if imdb_movie:
+            write_nfo(manager, imdb_movie, nfo_file, verbose)
+        if state:
+            state.record(movie_dir, bool(imdb_movie), manager.mtimes.get(movie_dir) if manager.read_only else None)
+
+
+@dataclass
+class AutoStats:
+    """Outcome of choosing IMDb titles automatically."""
+
+    attempted: int = 0
+    accepted: int = 0
+    # Dirs with an ambiguous IMDb title, and the .nfo file to write after the review
+    review: List[Tuple[Path, Path]] = field(default_factory=list)
+
+
+def check_writable(manager: MovieManager, path: Path) -> None:
+    """Exit when a file must be written in the library, but it was read from a snapshot without the mount."""
+    if manager.read_only:
+        failure(f"Snapshot mode is read-only: mount {MOVIES_DIR} to write {path}", 1)
+
+
+def validate_movie_dir(
+    manager: MovieManager,
+    movie_dir: Path,
+    found_movies: List[Path],
+    force: bool,
+    auto_stats: Optional[AutoStats],
+    threshold: float,
+) -> bool:
+    """Validate one movie dir, writing its .nfo or missing.txt file.
+
+    IMDb titles are chosen automatically when there are auto stats to update.
+    Return True if the dir has a main movie and a .nfo file.
+    """
+    verbose = manager.verbose
+    missing_txt = movie_dir / MISSING_TXT  # TODO feat: save file as json or toml
+
+    # TODO feat: remove .xml files and confirm each file
+    # TODO feat: add .nomedia to subdirs https://kodi.wiki/view/Update_Music_Library#Exclude_Folder
+    # TODO feat: check VIDEO_TS for movies
+
+    file_names = manager.file_names(movie_dir)
+    if found_movies:
+        # Remove it once a movie is found
+        if MISSING_TXT in file_names:
+            check_writable(manager, missing_txt)
+            with manager.timer.phase("write"):
+                missing_txt.unlink()
+
+        main_movie: Optional[Path] = None
+        for found_movie in found_movies:
+            if found_movie.with_suffix(".nfo").name in file_names:
+                main_movie = found_movie
+                break
+
+        if len(found_movies) == 1:
+            main_movie = found_movies[0]
+        elif not main_movie:
+            # If a .nfo file doesn't exist, select the main movie by probing the videos;
+            # if it's not clear (e.g. a movie in two parts), use fzf to select it
+            main_movie = manager.choose_main_movie(found_movies)
+            if not main_movie:
+                click.echo("\nSelect the main movie:")
+                chosen_movie = fzf(found_movies)
+                if not chosen_movie:
+                    click.secho("No main movie selected", fg="red")
+                    return False
+                main_movie = Path(chosen_movie)
+            if manager.index:
+                manager.index.set_main_movie(movie_dir, main_movie.name)
+        if verbose:
+            click.echo(f"  Main movie: {main_movie.name}")
+
+        # TODO feat: remove all other .nfo files, keep only this one
+        # https://kodi.wiki/view/NFO_files
+        nfo_file = main_movie.with_suffix(".nfo")
+        if nfo_file.name in file_names and not force:
+            if verbose:
+                if manager.index:
+                    size = next(file.size for file in manager.index.files(movie_dir) if file.name == nfo_file.name)
                 else:
-                    imdb_movie = manager.search_imdb(movie_dir, verbose)
-                    if imdb_movie:
-                        url = manager.format_imdb_url(imdb_movie)
-                        nfo_file.write_text(f"{url}\n")
-                        if verbose:
-                            click.echo(f"  Writing {url} on {nfo_file.name}")
-                continue
-
-            click.secho(f"\n{movie_dir}", fg="bright_red", err=True)
-            if not force and missing_txt.exists():
-                click.echo(missing_txt.read_text())
-                continue
-
-            lines = []
-            clean_movie_name = slugify(movie_dir.name, separator="+")
-            lines.append(f"{TORRENT_SEARCH_COMMAND}{clean_movie_name}")
-            lines.append(f"IMDB Search: {IMDB_SEARCH_URL}{clean_movie_name}")
+                    size = nfo_file.stat().st_size
+                click.echo(f"  NFO file..: {nfo_file.name} (size in bytes: {size})")
+            return True
 
+        # Checked before searching IMDb, so no answer is lost
+        check_writable(manager, nfo_file)
+        if auto_stats:
+            auto_stats.attempted += 1
+            imdb_movie = manager.auto_match_imdb(movie_dir, threshold)
+            if not imdb_movie:
+                auto_stats.review.append((movie_dir, nfo_file))
+                return False
+            auto_stats.accepted += 1
+        else:
             imdb_movie = manager.search_imdb(movie_dir, verbose)
-            if imdb_movie:
-                lines.append(manager.format_info(imdb_movie, full=True))
+            if not imdb_movie:
+                return False
+        write_nfo(manager, imdb_movie, nfo_file, verbose)
+        return True
+
+    click.secho(f"\n{movie_dir}", fg="bright_red", err=True)
+    if not force and MISSING_TXT in file_names:
+        click.echo(f"See {missing_txt}" if manager.read_only else missing_txt.read_text())
+        return False
+
+    check_writable(manager, missing_txt)
+    from slugify import slugify
 
-            content = "\n".join(lines)
-            missing_txt.write_text(content)
-            click.echo(content)
+    lines = []
+    clean_movie_name = slugify(movie_dir.name, separator="+")
+    lines.append(f"{TORRENT_SEARCH_COMMAND}{clean_movie_name}")
+    lines.append(f"IMDB Search: {IMDB_SEARCH_URL}{clean_movie_name}")
+
+    if auto_stats:
+        auto_stats.attempted += 1
+        imdb_movie = manager.auto_match_imdb(movie_dir, threshold)
+        auto_stats.accepted += bool(imdb_movie)
+    else:
+        imdb_movie = manager.search_imdb(movie_dir, verbose)
+    if imdb_movie:
+        lines.append(manager.format_info(imdb_movie, full=True))
+
+    content = "\n".join(lines)
+    with manager.timer.phase("write"):
+        missing_txt.write_text(content)
+    click.echo(content)
+    return False
+
+
+def write_nfo(
+    manager: MovieManager, imdb_movie: "Movie", nfo_file: Path, verbose: bool
+) -> None:
+    """Write the IMDb URL on the .nfo file."""
+    url = manager.format_imdb_url(imdb_movie)
+    with manager.timer.phase("write"):
+        nfo_file.write_text(f"{url}\n")
+    if verbose:
+        click.echo(f"  Writing {url} on {nfo_file.name}")
 
 
 def ls_movie(path: Union[Path, str]):
     """List movies."""
+    lines = list_existing(path)
+    if lines is None:
+        failure(f"Directory not found: {path}. Refresh the library index with: vd scan", 1)
     click.echo()
-    shell(f'exa -lhaRTF "{path}"')
+    click.echo("\n".join(lines))
 
 
 @main.command()
 @click.argument("movie_name", nargs=-1, required=True)
-def ls_movies(movie_name):
-    """List movies by a partial dir name."""
-    for movie_path in MovieManager.iter_movie_dirs(movie_name):
-        ls_movie(movie_path)
+@click.pass_obj
+def ls_movies(obj: dict, movie_name):
+    """List movies by partial words of the dir name, title, year or IMDb ID."""
+    manager = create_manager(obj)
+    entries = manager.library_search().search(movie_name)
+    if manager.snapshot:
+        index = manager.library_index()
+        for entry in entries:
+            click.echo()
+            for line in iter_index_listing(Path(entry.path), index.files(entry.path)):
+                click.echo(line)
+        return
+    # Dirs are listed concurrently, and printed in the order they were found
+    paths = [entry.path for entry in entries]
+    for path, lines in zip(paths, iter_listings(paths, DEFAULT_WORKERS)):
+        if lines is None:
+            failure(f"Directory not found: {path}. Refresh the library index with: vd scan")
+            continue
+        click.echo()
+        click.echo("\n".join(lines))
+
+
+@main.command()
+@click.option(
+    "--paths",
+    "-p",
+    "paths_only",
+    is_flag=True,
+    default=False,
+    help="Print only the paths, e.g. to pipe them to other commands",
+)
+@click.argument("query", nargs=-1)
+@click.pass_obj
+def find(obj: dict, paths_only: bool, query: Tuple[str]):
+    """Find movies by partial words of the dir name, title, year or IMDb ID."""
+    entries = create_manager(obj).library_search().search(query)
+    if not entries:
+        failure("No movie found", 1)
+    for entry in entries:
+        if paths_only:
+            click.echo(entry.path)
+            continue
+        details = " ".join(str(part) for part in (entry.title, entry.year, entry.imdb_id) if part)
+        click.echo(f"{entry.path}  {click.style(details, dim=True)}")
 
 
 @main.command()
 @click.argument("movie_name", nargs=-1, required=True)
-def rm(movie_name: Tuple[str]):
-    """Remove a movie directory by a partial dir name."""
-    movie_list = [
-        str(movie_path) for movie_path in MovieManager.iter_movie_dirs(movie_name)
-    ]
+@click.pass_obj
+def rm(obj: dict, movie_name: Tuple[str]):
+    """Remove a movie directory by partial words of the dir name, title, year or IMDb ID."""
+    movie_list = [entry.path for entry in create_manager(obj).library_search().search(movie_name)]
     if not movie_list:
         failure("No movie found", 1)
 
@@ -189,6 +527,262 @@ def rm(movie_name: Tuple[str]):
     click.secho(f"Directory removed: {chosen_dir}", fg="green")
 
 
+@main.command()
+@click.option(
+    "--workers",
+    "-w",
+    default=DEFAULT_WORKERS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Files hashed at the same time",
+)
+@click.option(
+    "--quick",
+    is_flag=True,
+    default=False,
+    help="Compare only the first and last chunks of files with the same size, without reading them whole",
+)
+@click.pass_obj
+def dupes(obj: dict, workers: int, quick: bool):
+    """Find duplicate movies: dirs with the same IMDb title, and identical movie files."""
+    manager = create_manager(obj)
+    for group in group_by_imdb_id(manager.library_search().search([])):
+        click.secho(f"\nSame IMDb title: {IMDB_URL}{group.key[2:]}", fg="yellow")
+        for path in group.paths:
+            click.echo(f"  {path}")
+
+    movie_files = (
+        (movie_dir / file.name, file.size)
+        for movie_dir, file in manager.library_index().iter_files()
+        if not file.is_dir and Path(file.name).suffix.lower() in MOVIE_EXTENSIONS
+    )
+    groups = find_identical_files(movie_files, workers, full=not quick)
+    for group in groups:
+        label = "Same first and last chunks" if quick else "Identical files"
+        click.secho(f"\n{label} ({human_size(group.size)} each):", fg="yellow")
+        for path in group.paths:
+            click.echo(f"  {path}")
+    if groups:
+        click.echo(f"\n{human_size(sum(group.wasted for group in groups))} can be freed")
+
+
+@main.command()
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write the synced subtitles to this file instead of overwriting the original",
+)
+@click.option(
+    "--max-offset",
+    default=60.0,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Seconds the subtitles can be ahead or behind the reference",
+)
+@click.option(
+    "--bin-size",
+    default=BIN_SIZE,
+    show_default=True,
+    type=click.FloatRange(min=0.01),
+    help="Seconds of each bin of the compared timelines",
+)
+@click.option("--dry-run", "-n", is_flag=True, default=False, help="Only show the offset and framerate ratio found")
+@click.argument("subtitle", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument("reference", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+def sync(subtitle: Path, reference: Path, output: Optional[Path], max_offset: float, bin_size: float, dry_run: bool):
+    """Sync a SRT subtitle with a reference: subtitles already in sync, a WAV file or a movie (decoded with ffmpeg).
+
+    Finds the offset and the framerate drift (e.g. subtitles made for 25 fps on a 23.976 fps movie).
+    """
+    cues = read_srt(subtitle)
+    if not cues:
+        failure(f"No subtitles found in {subtitle}", 1)
+    try:
+        result = align(cues, reference_timeline(reference, bin_size), max_offset, bin_size=bin_size)
+    except (ImportError, FileNotFoundError, ValueError) as error:
+        failure(str(error), 1)
+    if result.score <= 0:
+        failure(f"Could not align {subtitle} with {reference}", 1)
+    click.echo(f"Offset: {result.offset:+.2f}s, framerate ratio: {result.ratio:.5f}, score: {result.score:.3f}")
+    if dry_run:
+        return
+
+    target = output or subtitle
+    temp_file = target.with_name(f".{target.name}.tmp")
+    temp_file.write_text(format_srt(apply(cues, result)), encoding="utf-8")
+    temp_file.replace(target)
+    click.secho(f"Synced subtitles written to {target}", fg="green")
+
+
+@main.command()
+@click.option("--shift", default=0.0, show_default=True, type=float, help="Seconds added to all times")
+@click.option(
+    "--scale",
+    default=1.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Ratio applied to all times before the shift, e.g. 1.04271 (25/23.976) for another framerate",
+)
+@click.option(
+    "--fps",
+    default=DEFAULT_FPS,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Frames per second of MicroDVD files that don't declare it",
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=os.cpu_count() or 1,
+    show_default="number of CPUs",
+    type=click.IntRange(min=1),
+    help="Subtitle files rewritten at the same time",
+)
+@click.option(
+    "--encoding",
+    "-e",
+    help=f"Encoding of the files that aren't UTF-8, e.g. cp1251; by default {'/'.join(ENCODINGS[1:])} is guessed",
+)
+@click.option(
+    "--backup/--no-backup",
+    default=True,
+    show_default=True,
+    help=f"Keep the original of each rewritten file with a {BACKUP_SUFFIX} suffix",
+)
+@click.option("--dry-run", "-n", is_flag=True, default=False, help="Only show the files and encodings found")
+@verbose_option
+@click.argument("movie_name", nargs=-1, required=False)
+@click.pass_obj
+def fix_subtitles(
+    obj: dict,
+    shift: float,
+    scale: float,
+    fps: float,
+    workers: int,
+    encoding: Optional[str],
+    backup: bool,
+    dry_run: bool,
+    verbose: bool,
+    movie_name: Tuple[str],
+):
+    """Convert the SRT and SUB files of the library to UTF-8, shifting and scaling their times if asked."""
+    if encoding:
+        try:
+            encoding = codecs.lookup(encoding).name
+        except LookupError:
+            failure(f"Unknown encoding {encoding}", 1)
+    encodings = ("utf-8-sig", encoding) if encoding else ENCODINGS
+    manager = create_manager(obj, verbose)
+    movie_dirs = {Path(entry.path) for entry in manager.library_search().search(movie_name)} if movie_name else None
+    subtitle_files = (
+        movie_dir / file.name
+        for movie_dir, file in manager.library_index().iter_files()
+        if not file.is_dir
+        and Path(file.name).suffix.lower() in SUBTITLE_EXTENSIONS
+        and (movie_dirs is None or movie_dir in movie_dirs)
+    )
+    rewritten = 0
+    for result in rewrite_subtitles(subtitle_files, workers, shift, scale, fps, encodings, backup, dry_run):
+        if result.error:
+            failure(f"{result.path}: {result.error}")
+        elif result.rewritten:
+            rewritten += 1
+            if verbose or dry_run:
+                click.echo(f"{result.path} ({result.encoding}, {result.cues} cues)")
+    click.secho(f"{rewritten} subtitle files {'to rewrite' if dry_run else 'rewritten'}", fg="green")
+
+
+@main.command()
+@click.option(
+    "--workers",
+    "-w",
+    default=INGEST_WORKERS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Files copied at the same time, when the completed and movies dirs are on different filesystems",
+)
+@click.option("--dry-run", "-n", is_flag=True, default=False, help="Only show where each item would go")
+@click.argument("partial_names", nargs=-1)
+@click.pass_obj
+def ingest(obj: dict, workers: int, dry_run: bool, partial_names: Tuple[str]):
+    """Move completed downloads to movie dirs named after their titles; run it again to resume an interrupted copy."""
+    matcher = create_matcher(partial_names)
+    items = [item for item in plan_items(COMPLETED_DIR, MOVIES_DIR) if matcher.match(item.source.name)]
+    if not items:
+        click.secho(f"No item under {COMPLETED_DIR}", fg="green")
+        return
+    for item in items:
+        merge = " (merging into an existing dir)" if item.target_dir.exists() else ""
+        click.echo(f"{item.source.name} -> {item.target_dir}{merge}")
+    if dry_run:
+        return
+
+    total = sum(move.size for item in items for move in iter_file_moves(item))
+    lock = threading.Lock()
+    with click.progressbar(length=total, label="Moving", show_eta=True) as bar:
+
+        def progress(size: int) -> None:
+            with lock:
+                bar.update(size)
+
+        errors = move_items(items, workers, progress)
+    for path, error in errors:
+        failure(f"Could not move {path}: {error}")
+
+    if obj.get("use_index"):
+        # Only the target dirs are scanned again, without the IMDb backend and caches of a manager
+        index = LibraryIndex(MOVIES_DIR)
+        for item in items:
+            index.update(item.target_dir)
+    if errors:
+        sys.exit(1)
+    click.secho(f"{len(items)} items moved to {MOVIES_DIR}", fg="green")
+
+
+@main.command()
+@click.option(
+    "--emit",
+    type=click.Choice(["ndjson"]),
+    help="Stream a snapshot of the library instead of refreshing the library index",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.File("w", encoding="utf-8"),
+    default="-",
+    show_default=True,
+    help="File of the snapshot",
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=DEFAULT_WORKERS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Movie dirs scanned at the same time",
+)
+@click.pass_obj
+def scan(obj: dict, emit: Optional[str], output: TextIO, workers: int):
+    """Scan the library where the disk is: refresh the library index, or stream a snapshot for other hosts.
+
+    E.g.: ssh osmc@styx vd scan --emit ndjson | vd --snapshot - validate
+    """
+    if emit:
+        # The same caches as validate: files classified or probed by one are not read again by the other
+        cache = create_classification_cache()
+        probe_cache = create_probe_cache()
+        try:
+            write_ndjson(iter_records(MOVIES_DIR, COMPLETED_DIR, workers, cache, probe_cache), output)
+        finally:
+            cache.close()
+            probe_cache.close()
+        return
+    index = LibraryIndex(MOVIES_DIR)
+    changed = index.refresh()
+    click.echo(f"{index.count()} movie dirs, {changed} scanned again")
+
+
 @main.command()
 @click.option(
     "--torrent",
@@ -198,33 +792,253 @@ def rm(movie_name: Tuple[str]):
     default=False,
     help="Only for Transmission torrents",
 )
+@click.option(
+    "--active",
+    "-a",
+    "recently_active",
+    is_flag=True,
+    default=False,
+    help="Only for torrents active in the last minute (implies --torrent)",
+)
 @click.option("--days", "-d", default=2, type=int, help="Days to consider recent files")
+@click.option(
+    "--workers",
+    "-w",
+    default=SUBTITLE_WORKERS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Subtitle searches running at the same time",
+)
+@click.option(
+    "--timeout",
+    default=SUBTITLE_TIMEOUT,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Seconds before a subtitle search is stopped",
+)
+@click.option(
+    "--retries",
+    default=2,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Retries of a failed subtitle search, waiting longer each time",
+)
 @click.argument("movie_name", nargs=-1, required=False)
-def subtitles(for_torrents_only: bool, days: int, movie_name: Tuple[str]):
+@click.pass_obj
+def subtitles(
+    obj: dict,
+    for_torrents_only: bool,
+    recently_active: bool,
+    days: int,
+    workers: int,
+    timeout: int,
+    retries: int,
+    movie_name: Tuple[str],
+):
     """Search subtitles for recent movies."""
     recent_date = datetime.now() - timedelta(days=days)
+    since_ns = int(recent_date.timestamp() * 1_000_000_000)
 
-    found = False
-    function = (
-        MovieManager.iter_torrent_dirs
-        if for_torrents_only
-        else MovieManager.iter_movie_dirs
-    )
-    for movie_dir in function(movie_name):
-        if not movie_dir.exists():
+    jobs: List[Job] = []
+    manager = create_manager(obj)
+    if for_torrents_only or recently_active:
+        movie_dirs = manager.iter_torrent_dirs(movie_name, recently_active)
+    else:
+        # Adding a movie file to a dir updates the dir mtime: older dirs can't have recent movies
+        movie_dirs = manager.iter_movie_dirs(movie_name, since_ns)
+    for movie_dir in movie_dirs:
+        if not manager.dir_exists(movie_dir):
             failure(f"Recent torrent, movie dir doesn't exist yet: {movie_dir}")
             continue
 
-        recent_movies = {
-            item
-            for item in movie_dir.iterdir()
-            if item.suffix.lower() in MOVIE_EXTENSIONS
-            and datetime.fromtimestamp(item.stat().st_mtime) > recent_date
-        }
-        if recent_movies:
-            found = True
-            click.echo()
-            shell(f"~/container-apps-private/bin/subtitles.sh '{movie_dir}'")
+        if manager.recent_movies(movie_dir, since_ns):
+            jobs.append(Job(str(movie_dir), [str(SUBTITLES_SCRIPT), str(movie_dir)]))
 
-    if not found:
+    if not jobs:
         failure("No movies found", 1)
+
+    def echo_output(result: JobResult) -> None:
+        click.echo(f"\n{result.job.name}")
+        click.echo(result.output, nl=False)
+
+    results = JobScheduler(workers, timeout, retries).run(jobs, echo_output)
+    echo_summary(results)
+    if not all(result.success for result in results):
+        sys.exit(1)
+
+
+def process_changed_dir(
+    manager: MovieManager,
+    movie_dir: Path,
+    record: Optional[MovieDirRecord],
+    files: List[FileRecord],
+    threshold: float,
+) -> Optional[FileRecord]:
+    """Report the new state of a dir that changed, and write its .nfo file if the IMDb title is clear.
+
+    Return the main movie of the dir, if there is one.
+    """
+    if not record:
+        if manager.verbose:
+            click.echo(f"\nRemoved: '{movie_dir}'")
+        return None
+
+    click.echo(f"\nChanged: '{movie_dir}'")
+    main_movie = record.main_movie
+    if not main_movie:
+        movies = [movie_dir / file.name for file in files if Path(file.name).suffix.lower() in MOVIE_EXTENSIONS]
+        chosen_movie = manager.choose_main_movie(movies) if movies else None
+        if chosen_movie:
+            main_movie = chosen_movie.name
+            manager.library_index().set_main_movie(movie_dir, main_movie)
+        else:
+            if movies:
+                failure(f"Choose the main movie with: vd validate {movie_dir.name}")
+            elif manager.verbose:
+                click.echo("  No movie yet")
+            return None
+
+    main_file = next((file for file in files if file.name == main_movie), None)
+    if not main_file:
+        # Removed after the dir was indexed: its removal is another change, seen on the next event
+        failure(f"Main movie not found: {movie_dir / main_movie}")
+        return None
+
+    if not record.has_nfo:
+        imdb_movie = manager.auto_match_imdb(movie_dir, threshold)
+        if imdb_movie:
+            nfo_file = (movie_dir / main_movie).with_suffix(".nfo")
+            write_nfo(manager, imdb_movie, nfo_file, manager.verbose)
+        else:
+            failure(f"No clear IMDb title, choose one with: vd validate {movie_dir.name}")
+    return main_file
+
+
+@main.command()
+@click.option(
+    "--poll",
+    is_flag=True,
+    default=False,
+    help="Poll for changes instead of using inotify (automatic on sshfs and other network mounts)",
+)
+@click.option(
+    "--interval",
+    default=WATCH_POLL_INTERVAL,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Seconds between polls",
+)
+@click.option(
+    "--settle",
+    default=WATCH_SETTLE,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Seconds a dir must stay unchanged before it's processed",
+)
+@click.option(
+    "--threshold",
+    default=AUTO_THRESHOLD,
+    show_default=True,
+    type=click.FloatRange(0, 1),
+    help="Minimum score to write a .nfo file without asking",
+)
+@click.option(
+    "--subtitles/--no-subtitles",
+    "search_subtitles",
+    default=True,
+    help="Search subtitles for new movies",
+)
+@click.option("--days", "-d", default=2, type=int, help="Days to consider a movie new")
+@verbose_option
+@click.pass_obj
+def watch(
+    obj: dict,
+    poll: bool,
+    interval: int,
+    settle: int,
+    threshold: float,
+    search_subtitles: bool,
+    days: int,
+    verbose: bool,
+):
+    """Watch the movies and completed dirs, and process new movies as they arrive.
+
+    Keep the library index up to date, check the root and completed dirs on each change,
+    write .nfo files of clear IMDb titles and search subtitles of new movies.
+    """
+    # The library index is the state kept up to date, even with --no-index
+    manager = create_manager({**obj, "use_index": True}, verbose)
+    manager.index.refresh()
+    manager.validate_root()
+    manager.validate_completed()
+
+    watcher = create_watcher([MOVIES_DIR, COMPLETED_DIR], poll)
+    how = "inotify" if isinstance(watcher, InotifyWatcher) else f"polling every {interval}s"
+    click.echo(f"Watching {MOVIES_DIR} and {COMPLETED_DIR} with {how}")
+
+    queue = SettleQueue(settle)
+    # Files of each queued dir when it was queued or last checked: a dir is processed when they stop changing
+    signatures: Dict[Path, List[FileRecord]] = {}
+    searched: Set[Path] = set()
+    scheduler = JobScheduler(SUBTITLE_WORKERS, SUBTITLE_TIMEOUT, retries=2)
+    executor = ThreadPoolExecutor(max_workers=SUBTITLE_WORKERS)
+
+    def echo_subtitles(future: Future) -> None:
+        result = future.result()
+        click.echo(f"\n{result.job.name}")
+        click.echo(result.output, nl=False)
+        echo_summary([result])
+
+    try:
+        while True:
+            changes = watcher.changes(queue.timeout(interval))
+            if any(path.parent == COMPLETED_DIR for path in changes):
+                manager.validate_completed()
+            for path in sorted(changes):
+                if path.parent != MOVIES_DIR:
+                    continue
+                if path.is_file():
+                    failure(f"There is a file in the root dir! Move it to a subdirectory: {path}")
+                    continue
+                if path in queue:
+                    queue.push(path)
+                    continue
+                # Dirs are queued only if they changed since they were last indexed,
+                # so the .nfo files written below don't queue their dirs again
+                indexed = manager.index.record(path), manager.index.files(path)
+                record = manager.index.update(path)
+                files = manager.index.files(path) if record else []
+                if (record, files) != indexed:
+                    signatures[path] = files
+                    queue.push(path)
+
+            for movie_dir in queue.pop_due():
+                record = manager.index.update(movie_dir)
+                files = manager.index.files(movie_dir) if record else []
+                if signatures.get(movie_dir) != files:
+                    # Still changing, e.g. a download that is still writing: check again later
+                    signatures[movie_dir] = files
+                    queue.push(movie_dir)
+                    continue
+                signatures.pop(movie_dir, None)
+
+                try:
+                    main_movie = process_changed_dir(manager, movie_dir, record, files, threshold)
+                except Exception as error:
+                    # A failed IMDb search or a dir removed while processing must not stop the watch
+                    failure(f"Error while processing {movie_dir}: {error}")
+                    continue
+                finally:
+                    # Index the dir with the files written while processing it, e.g. its .nfo file
+                    manager.index.update(movie_dir)
+                since_ns = time.time_ns() - days * 86_400 * 1_000_000_000
+                path = movie_dir / main_movie.name if main_movie else None
+                if search_subtitles and path and path not in searched and main_movie.mtime_ns > since_ns:
+                    searched.add(path)
+                    job = Job(str(movie_dir), [str(SUBTITLES_SCRIPT), str(movie_dir)])
+                    executor.submit(scheduler.run_job, job).add_done_callback(echo_subtitles)
+    except KeyboardInterrupt:
+        click.echo("\nWaiting for subtitle searches to finish")
+    finally:
+        watcher.close()
+        executor.shutdown()
@@ -1,15 +1,33 @@
+import os
 from pathlib import Path
 
-# TODO: read from env var
-ROOT_DIR = Path("~/data").expanduser()
+ROOT_DIR = Path(os.environ.get("VIDSUB_ROOT_DIR") or "~/data").expanduser()
 MOVIES_DIR = ROOT_DIR / "movies"
 COMPLETED_DIR = ROOT_DIR / "completed"
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or "~/.cache").expanduser() / "vidsub"
 
 IMDB_URL = "https://www.imdb.com/title/tt"
 IMDB_SEARCH_URL = "https://www.imdb.com/find?q="
 TORRENT_SEARCH_COMMAND = "torrent-search -a -i on1337x "
 MISSING_TXT = "missing.txt"
 UNIQUE_SEPARATOR = "±"
+DEFAULT_WORKERS = 8
+# Concurrent IMDb searches, and how many dirs ahead of the current one they are made
+IMDB_WORKERS = 4
+IMDB_PREFETCH_DIRS = 16
+# Minimum score to accept an IMDb title without asking, in validate --auto
+AUTO_THRESHOLD = 0.85
+
+SUBTITLES_SCRIPT = Path("~/container-apps-private/bin/subtitles.sh").expanduser()
+SUBTITLE_WORKERS = 3
+SUBTITLE_TIMEOUT = 300
+
+# Files copied at the same time by vd ingest, when the completed and movies dirs are on different filesystems
+INGEST_WORKERS = 4
+
+# Seconds a dir must stay unchanged before vd watch processes it, and between polls when inotify can't be used
+WATCH_SETTLE = 30
+WATCH_POLL_INTERVAL = 60
 
 MOVIE_EXTENSIONS = {
     f".{item}" for item in {"avi", "divx", "iso", "mp4", "mpg", "mkv", "wmv", "mov"}
@@ -34,6 +52,8 @@ VIDEO_EXTENSIONS = {
         "wmv",
     }
 }
+# Not movies, but rewritten by vd fix-subtitles
+SUBTITLE_EXTENSIONS = {".srt", ".sub"}
 IGNORE_EXTENSIONS = {
     f".{item}"
     for item in {
@@ -0,0 +1,127 @@
+"""Find duplicate movies: dirs with the same IMDb title, and identical files.
+
+Candidates are narrowed down cheaply before any file is read:
+by IMDb ID, then by size, then by a hash of the first and last chunks, and only then by a hash of the whole file.
+"""
+import hashlib
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from vidsub.search import SearchEntry
+
+# Bytes read from the start and from the end of a file for the partial hash
+CHUNK_SIZE = 1024 * 1024
+# Files smaller than this are not worth comparing (e.g. .nfo files, subtitles)
+MIN_SIZE = 10 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class DuplicateGroup:
+    """Paths that are the same movie, found by IMDb ID or by content."""
+
+    key: str
+    paths: Tuple[Path, ...]
+    size: int = 0
+
+    @property
+    def wasted(self) -> int:
+        """Bytes that would be freed by keeping only one of the files."""
+        return self.size * (len(self.paths) - 1)
+
+
+def group_by_imdb_id(entries: Iterable[SearchEntry]) -> List[DuplicateGroup]:
+    """Group movie dirs whose .nfo files point to the same IMDb title."""
+    dirs: Dict[str, List[Path]] = defaultdict(list)
+    for entry in entries:
+        if entry.imdb_id:
+            dirs[entry.imdb_id].append(Path(entry.path))
+    return [DuplicateGroup(imdb_id, tuple(paths)) for imdb_id, paths in sorted(dirs.items()) if len(paths) > 1]
+
+
+def partial_hash(path: Path, size: int) -> str:
+    """Hash the size, the first and the last chunks of a file."""
+    digest = hashlib.blake2b(str(size).encode())
+    with open(path, "rb") as file:
+        digest.update(file.read(CHUNK_SIZE))
+        if size > 2 * CHUNK_SIZE:
+            file.seek(-CHUNK_SIZE, os.SEEK_END)
+        digest.update(file.read(CHUNK_SIZE))
+    return digest.hexdigest()
+
+
+def full_hash(path: Path, size: int) -> str:
+    """Hash the whole file."""
+    digest = hashlib.blake2b()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_or_none(hash_function: Callable[[Path, int], str], path: Path, size: int) -> Optional[str]:
+    try:
+        return hash_function(path, size)
+    except OSError:
+        # Removed or unreadable since the scan
+        return None
+
+
+def _split_by_hash(
+    groups: Iterable[Iterable[Path]],
+    size_of: Dict[Path, int],
+    hash_function: Callable[[Path, int], str],
+    workers: int,
+) -> Dict[str, List[Path]]:
+    """Hash the files of all groups in parallel, and split the groups by hash, keeping only duplicates."""
+    paths = [path for group in groups for path in group]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = list(executor.map(lambda path: _hash_or_none(hash_function, path, size_of[path]), paths))
+    by_hash: Dict[str, List[Path]] = defaultdict(list)
+    for path, hash_ in zip(paths, hashes):
+        if hash_:
+            by_hash[hash_].append(path)
+    return {hash_: group for hash_, group in by_hash.items() if len(group) > 1}
+
+
+def find_identical_files(
+    files: Iterable[Tuple[Path, int]], workers: int, full=True, min_size: int = MIN_SIZE
+) -> List[DuplicateGroup]:
+    """Find files with the same content, from their paths and sizes.
+
+    Only files with the same size are read; of those, only the ones with the same first and last chunks
+    are read whole, unless ``full`` is False.
+    """
+    by_size: Dict[int, List[Path]] = defaultdict(list)
+    for path, size in files:
+        if size >= min_size:
+            by_size[size].append(path)
+
+    size_of: Dict[Path, int] = {}
+    candidates: List[List[Path]] = []
+    for size, paths in by_size.items():
+        if len(paths) < 2:
+            continue
+        # Hard links to the same file are not duplicates
+        inodes: Dict[Tuple[int, int], Path] = {}
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            inodes.setdefault((stat.st_dev, stat.st_ino), path)
+        if len(inodes) > 1:
+            candidates.append(sorted(inodes.values()))
+            size_of.update((path, size) for path in inodes.values())
+
+    groups = _split_by_hash(candidates, size_of, partial_hash, workers)
+    if full:
+        groups = _split_by_hash(groups.values(), size_of, full_hash, workers)
+    return sorted(
+        (DuplicateGroup(hash_, tuple(sorted(group)), size_of[group[0]]) for hash_, group in groups.items()),
+        key=lambda group: group.wasted,
+        reverse=True,
+    )
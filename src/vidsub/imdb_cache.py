@@ -0,0 +1,123 @@
+"""Local cache of IMDb searches and movie details."""
+import time
+from collections import defaultdict
+from concurrent.futures import Executor, Future
+from typing import TYPE_CHECKING, Any, DefaultDict, Dict, List, Optional
+
+from vidsub.cache import SqliteCache
+from vidsub.constants import CACHE_DIR
+
+if TYPE_CHECKING:
+    from imdb.Movie import Movie
+
+IMDB_DB = CACHE_DIR / "imdb.sqlite"
+IMDB_MAX_ENTRIES = 20_000
+SEARCH_TTL = 30 * 24 * 60 * 60
+# Ratings change over time, details expire sooner than searches
+MOVIE_TTL = 7 * 24 * 60 * 60
+
+# Only these fields are kept in the cache; they are the ones displayed or written on files
+MOVIE_FIELDS = ("title", "year", "kind", "rating")
+
+
+def movie_to_dict(movie: "Movie") -> Dict[str, Any]:
+    """Convert a movie to a dict that can be stored as JSON."""
+    data = {field: movie.get(field) for field in MOVIE_FIELDS if movie.get(field) is not None}
+    return {"movieID": movie.movieID, "data": data}
+
+
+def movie_from_dict(value: Dict[str, Any]) -> "Movie":
+    """Rebuild a movie stored as a dict."""
+    from imdb.Movie import Movie
+
+    return Movie(movieID=value["movieID"], data=value["data"])
+
+
+class CachedIMDb:
+    """IMDb access with persistent caches in front of a backend.
+
+    The backend is anything with ``search_movie()`` and ``get_movie()``, like ``imdb.IMDb()``
+    or a fake one used in tests; the default one is only created when it's used.
+    Without caches, every call goes to the backend.
+    """
+
+    def __init__(
+        self,
+        backend: Any = None,
+        search_cache: Optional[SqliteCache] = None,
+        movie_cache: Optional[SqliteCache] = None,
+    ) -> None:
+        self._backend = backend
+        self.search_cache = search_cache
+        self.movie_cache = movie_cache
+        self._pending: Dict[str, Future] = {}
+        # Seconds taken by each backend request, by method name
+        self.latencies: DefaultDict[str, List[float]] = defaultdict(list)
+
+    @property
+    def backend(self) -> Any:
+        """The IMDb backend."""
+        if self._backend is None:
+            import imdb
+
+            self._backend = imdb.IMDb()
+        return self._backend
+
+    @classmethod
+    def with_default_caches(cls, backend: Any = None) -> "CachedIMDb":
+        """Create an instance with caches under the user cache dir."""
+        return cls(
+            backend,
+            SqliteCache(IMDB_DB, "search", IMDB_MAX_ENTRIES, SEARCH_TTL),
+            SqliteCache(IMDB_DB, "movie", IMDB_MAX_ENTRIES, MOVIE_TTL),
+        )
+
+    def prefetch(self, query: str, executor: Executor) -> None:
+        """Search movies in the background; ``search_movie()`` will wait for the result."""
+        key = query.lower()
+        if key not in self._pending:
+            self._pending[key] = executor.submit(self._search_movie, query)
+
+    def search_movie(self, query: str) -> List["Movie"]:
+        """Search movies by title."""
+        future = self._pending.pop(query.lower(), None)
+        if future:
+            return future.result()
+        return self._search_movie(query)
+
+    def _search_movie(self, query: str) -> List["Movie"]:
+        key = query.lower()
+        if self.search_cache:
+            cached = self.search_cache.get(key)
+            if cached is not None:
+                return [movie_from_dict(value) for value in cached]
+
+        movies = self._request("search_movie", query)
+        if self.search_cache:
+            self.search_cache.set(key, [movie_to_dict(movie) for movie in movies])
+        return movies
+
+    def get_movie(self, movie_id: str) -> "Movie":
+        """Get the details of a movie."""
+        if self.movie_cache:
+            cached = self.movie_cache.get(movie_id)
+            if cached is not None:
+                return movie_from_dict(cached)
+
+        movie = self._request("get_movie", movie_id)
+        if self.movie_cache:
+            self.movie_cache.set(movie_id, movie_to_dict(movie))
+        return movie
+
+    def _request(self, method: str, argument: str) -> Any:
+        start = time.perf_counter()
+        try:
+            return getattr(self.backend, method)(argument)
+        finally:
+            self.latencies[method].append(time.perf_counter() - start)
+
+    def close(self) -> None:
+        """Save and close the caches."""
+        for cache in (self.search_cache, self.movie_cache):
+            if cache:
+                cache.close()
@@ -0,0 +1,183 @@
+"""Move completed downloads into the movies dir: a rename when possible, otherwise a copy made by the kernel.
+
+Copies go to a ``.part`` file next to the target; an interrupted copy continues from the size of that file.
+"""
+import errno
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from vidsub.titles import parse_dir_name
+
+PART_SUFFIX = ".part"
+# Bytes copied by each system call, between progress updates
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+Progress = Callable[[int], None]
+
+
+@dataclass(frozen=True)
+class FileMove:
+    """A file to be moved, and its size."""
+
+    source: Path
+    target: Path
+    size: int
+
+
+@dataclass(frozen=True)
+class IngestItem:
+    """An item of the completed dir (a file or a dir), and the movie dir it goes to."""
+
+    source: Path
+    target_dir: Path
+
+
+def target_dir_name(source: Path) -> str:
+    """Name the movie dir of a completed item after its slugified title and year.
+
+    >>> target_dir_name(Path("The.Matrix.1999.1080p.BluRay.x264"))
+    'the-matrix-1999'
+    >>> target_dir_name(Path("Amélie [DVDRip].mkv"))
+    'amelie'
+    """
+    from slugify import slugify
+
+    parsed = parse_dir_name(source.name if source.is_dir() else source.stem)
+    return slugify(f"{parsed.title} {parsed.year or ''}") or slugify(source.name)
+
+
+def plan_items(completed_dir: Path, movies_dir: Path) -> List[IngestItem]:
+    """Plan where each item of the completed dir goes, skipping partial copies left behind."""
+    return [
+        IngestItem(source, movies_dir / target_dir_name(source))
+        for source in sorted(completed_dir.iterdir())
+        if not source.name.endswith(PART_SUFFIX)
+    ]
+
+
+def iter_file_moves(item: IngestItem) -> Iterator[FileMove]:
+    """Iterate over the files of an item, with their targets inside the movie dir."""
+    if not item.source.is_dir():
+        yield FileMove(item.source, item.target_dir / item.source.name, item.source.stat().st_size)
+        return
+    for dir_path, _, file_names in os.walk(item.source):
+        for file_name in sorted(file_names):
+            source = Path(dir_path) / file_name
+            yield FileMove(source, item.target_dir / source.relative_to(item.source), source.stat().st_size)
+
+
+def copy_range(source_fd: int, target_fd: int, offset: int, size: int, progress: Optional[Progress] = None) -> None:
+    """Copy a file from an offset without reading it in Python: with copy_file_range, or else with sendfile."""
+    use_copy_file_range = hasattr(os, "copy_file_range")
+    while offset < size:
+        count = min(COPY_CHUNK_SIZE, size - offset)
+        copied = 0
+        if use_copy_file_range:
+            try:
+                copied = os.copy_file_range(source_fd, target_fd, count, offset, offset)
+            except OSError as error:
+                # Kernels before 5.3 don't copy across filesystems
+                if error.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                use_copy_file_range = False
+                continue
+        else:
+            os.lseek(target_fd, offset, os.SEEK_SET)
+            copied = os.sendfile(target_fd, source_fd, offset, count)
+        if copied == 0:
+            raise OSError(errno.EIO, "Source file is shorter than expected")
+        offset += copied
+        if progress:
+            progress(copied)
+
+
+def move_file(move: FileMove, progress: Optional[Progress] = None) -> None:
+    """Move a file with a rename, or else copy it to a ``.part`` file (continuing a previous copy) and remove it."""
+    move.target.parent.mkdir(parents=True, exist_ok=True)
+    if move.target.exists():
+        target_stat = move.target.stat()
+        # A finished copy has the size and the mtime of the source, set before the .part file was renamed
+        if target_stat.st_size != move.size or target_stat.st_mtime_ns != move.source.stat().st_mtime_ns:
+            raise FileExistsError(errno.EEXIST, "A different file already exists", str(move.target))
+        # Copied before an interruption, but not removed
+        move.source.unlink()
+        if progress:
+            progress(move.size)
+        return
+    try:
+        os.rename(move.source, move.target)
+        if progress:
+            progress(move.size)
+        return
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+
+    part_file = move.target.with_name(move.target.name + PART_SUFFIX)
+    # Not opened in append mode, which copy_file_range refuses, nor truncated, to continue a previous copy
+    part_fd = os.open(part_file, os.O_WRONLY | os.O_CREAT, 0o644)
+    with open(move.source, "rb") as source, open(part_fd, "wb") as target:
+        # The end of the part file might not have reached the disk before the interruption: copy it again
+        done = max(0, min(os.fstat(target.fileno()).st_size, move.size) - COPY_CHUNK_SIZE)
+        target.truncate(done)
+        if progress and done:
+            progress(done)
+        copy_range(source.fileno(), target.fileno(), done, move.size, progress)
+        os.fsync(target.fileno())
+    shutil.copystat(move.source, part_file)
+    part_file.replace(move.target)
+    move.source.unlink()
+
+
+def remove_empty_dirs(path: Path) -> None:
+    """Remove a dir and its subdirs, bottom up, if they are empty."""
+    for dir_path, _, _ in sorted(os.walk(path), key=lambda walked: len(walked[0]), reverse=True):
+        try:
+            os.rmdir(dir_path)
+        except OSError:
+            # Not empty: something was not moved
+            pass
+
+
+def move_items(items: List[IngestItem], workers: int, progress: Optional[Progress] = None) -> List[Tuple[Path, str]]:
+    """Move items to their movie dirs: whole dirs are renamed when possible, other files are moved in parallel.
+
+    Return the files that couldn't be moved, and why.
+    """
+    moves: List[FileMove] = []
+    errors: List[Tuple[Path, str]] = []
+    for item in items:
+        item_moves = list(iter_file_moves(item))
+        if item.source.is_dir() and not item.target_dir.exists():
+            try:
+                os.rename(item.source, item.target_dir)
+                if progress:
+                    progress(sum(move.size for move in item_moves))
+                continue
+            except OSError as error:
+                if error.errno != errno.EXDEV:
+                    errors.append((item.source, error.strerror or str(error)))
+                    continue
+        moves.extend(item_moves)
+
+    lock = threading.Lock()
+
+    def move_one(move: FileMove) -> None:
+        try:
+            move_file(move, progress)
+        except OSError as error:
+            with lock:
+                errors.append((move.source, error.strerror or str(error)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Bigger files first, so the last ones to finish are small
+        list(executor.map(move_one, sorted(moves, key=lambda move: move.size, reverse=True)))
+    for item in items:
+        if item.source.is_dir():
+            remove_empty_dirs(item.source)
+    return errors
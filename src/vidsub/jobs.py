@@ -0,0 +1,122 @@
+"""Scheduler that runs external commands concurrently, with timeouts and retries."""
+import os
+import signal
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import click
+
+
+@dataclass(frozen=True)
+class Job:
+    """A command to run, and a name to show in the output."""
+
+    name: str
+    args: Sequence[str]
+
+
+@dataclass(frozen=True)
+class JobResult:
+    """Outcome of a job, after all its attempts."""
+
+    job: Job
+    success: bool
+    attempts: int
+    duration: float
+    output: str = ""
+    error: str = ""
+
+
+def run_once(args: Sequence[str], timeout: Optional[float]) -> subprocess.CompletedProcess:
+    """Run a command and capture its output; on timeout, kill it and all its child processes."""
+    process = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        start_new_session=True,
+    )
+    try:
+        output, _ = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        output, _ = process.communicate()
+        raise subprocess.TimeoutExpired(args, timeout, output)
+    return subprocess.CompletedProcess(args, process.returncode, output)
+
+
+class JobScheduler:
+    """Run jobs in a pool of workers, so one slow job doesn't block the others.
+
+    A failed or timed out job is retried with exponential backoff. A command that can't be started, e.g. a
+    missing or non-executable script, fails at once, since retrying it can't help.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        timeout: Optional[float] = None,
+        retries: int = 0,
+        backoff: float = 5,
+        runner: Callable[[Sequence[str], Optional[float]], subprocess.CompletedProcess] = run_once,
+    ) -> None:
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.runner = runner
+
+    def run_job(self, job: Job) -> JobResult:
+        """Run a job until it succeeds or there are no retries left."""
+        start = time.monotonic()
+        output = error = ""
+        for attempt in range(1, self.retries + 2):
+            if attempt > 1:
+                time.sleep(self.backoff * 2 ** (attempt - 2))
+            try:
+                completed = self.runner(job.args, self.timeout)
+            except subprocess.TimeoutExpired as timeout_expired:
+                output = timeout_expired.output or ""
+                error = f"timed out after {self.timeout:.0f}s"
+                continue
+            except OSError as os_error:
+                return JobResult(job, False, attempt, time.monotonic() - start, "", str(os_error))
+            output = completed.stdout or ""
+            if completed.returncode == 0:
+                return JobResult(job, True, attempt, time.monotonic() - start, output)
+            error = f"exit code {completed.returncode}"
+        return JobResult(job, False, self.retries + 1, time.monotonic() - start, output, error)
+
+    def run(
+        self, jobs: Sequence[Job], on_done: Optional[Callable[[JobResult], None]] = None
+    ) -> List[JobResult]:
+        """Run all jobs and return their results in the same order as the jobs.
+
+        ``on_done`` is called in the calling thread as each job finishes.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.run_job, job): index for index, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                result = results[futures[future]] = future.result()
+                if on_done:
+                    on_done(result)
+        return [results[index] for index in range(len(jobs))]
+
+
+def echo_summary(results: List[JobResult]) -> None:
+    """Print a table of successes, failures and durations."""
+    click.echo(f"\n{'Status':<8} {'Time':>8} {'Tries':>5}  Job")
+    for result in results:
+        status = click.style("ok", fg="green") if result.success else click.style("failed", fg="red")
+        # Pad the visible text, not the escape sequences added by the style
+        padding = " " * (8 - len("ok" if result.success else "failed"))
+        suffix = f" ({result.error})" if result.error and not result.success else ""
+        click.echo(f"{status}{padding} {result.duration:>7.1f}s {result.attempts:>5}  {result.job.name}{suffix}")
+
+    failed = sum(not result.success for result in results)
+    total = sum(result.duration for result in results)
+    click.echo(f"{len(results) - failed} succeeded, {failed} failed, {total:.1f}s of work")
@@ -0,0 +1,333 @@
+"""On-disk index of the movie library, refreshed incrementally by directory mtime."""
+import os
+import stat
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from vidsub.constants import CACHE_DIR, MISSING_TXT, MOVIE_EXTENSIONS
+
+LIBRARY_DB = CACHE_DIR / "library.sqlite"
+# A database that lives only as long as its connection, for an index that is filled by walking the whole root
+MEMORY_DB = Path(":memory:")
+
+if TYPE_CHECKING:
+    import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    main_movie TEXT,
+    has_nfo INTEGER NOT NULL DEFAULT 0,
+    has_missing_txt INTEGER NOT NULL DEFAULT 0,
+    scanned_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_root_mtime ON dirs (root, mtime_ns);
+CREATE TABLE IF NOT EXISTS validations (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    valid INTEGER NOT NULL,
+    validated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    dir_path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    is_dir INTEGER NOT NULL,
+    PRIMARY KEY (dir_path, name)
+);
+"""
+
+
+def connect(db_path: Path) -> "sqlite3.Connection":
+    """Open the library database, creating its tables if needed."""
+    # Imported here: the module is slow to load, and most commands read the library from a listing
+    import sqlite3
+
+    if db_path != MEMORY_DB:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(db_path))
+    connection.executescript(SCHEMA)
+    return connection
+
+
+@dataclass(frozen=True)
+class FileRecord:
+    """A file (or subdirectory) inside a movie directory."""
+
+    name: str
+    size: int
+    mtime_ns: int
+    is_dir: bool
+
+
+@dataclass(frozen=True)
+class MovieDirRecord:
+    """A movie directory as seen on the last scan."""
+
+    path: Path
+    mtime_ns: int
+    main_movie: Optional[str]
+    has_nfo: bool
+    has_missing_txt: bool
+
+
+def detect_main_movie(files: List[FileRecord]) -> Optional[str]:
+    """Detect the main movie by name: the one with a .nfo file, or the only movie in the dir."""
+    movies = [
+        file.name
+        for file in files
+        if not file.is_dir and Path(file.name).suffix.lower() in MOVIE_EXTENSIONS
+    ]
+    nfo_stems = {
+        Path(file.name).stem
+        for file in files
+        if Path(file.name).suffix.lower() == ".nfo"
+    }
+    for movie in movies:
+        if Path(movie).stem in nfo_stems:
+            return movie
+    if len(movies) == 1:
+        return movies[0]
+    return None
+
+
+class LibraryIndex:
+    """SQLite index of movie dirs and their files.
+
+    Only the root dir is listed on every refresh;
+    a movie dir is listed again only when its mtime changed since the last scan.
+    """
+
+    def __init__(self, root: Path, db_path: Path = LIBRARY_DB) -> None:
+        self.root = root
+        self.connection = connect(db_path)
+        self.refreshed = False
+        # Files directly under the root, seen on the last refresh: they are not movie dirs
+        self.root_files: List[str] = []
+
+    def refresh(self) -> int:
+        """Refresh the index and return the number of dirs that were scanned again.
+
+        Files under the root are kept in :attr:`root_files`, so the root is listed only once.
+        """
+        root = str(self.root)
+        known = dict(
+            self.connection.execute(
+                "SELECT path, mtime_ns FROM dirs WHERE root = ?", (root,)
+            )
+        )
+        seen: Set[str] = set()
+        root_files: List[str] = []
+        changed = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    root_files.append(entry.path)
+                    continue
+                mtime_ns = entry.stat().st_mtime_ns
+                seen.add(entry.path)
+                if known.get(entry.path) == mtime_ns:
+                    continue
+                self._scan_dir(entry.path, mtime_ns)
+                changed += 1
+
+        gone = [(path,) for path in set(known) - seen]
+        self.connection.executemany("DELETE FROM dirs WHERE path = ?", gone)
+        self.connection.executemany("DELETE FROM files WHERE dir_path = ?", gone)
+        self.connection.commit()
+        self.root_files = sorted(root_files)
+        self.refreshed = True
+        return changed
+
+    def replace_dirs(self, dirs: Iterable[Tuple[Path, int, List[FileRecord]]]) -> int:
+        """Replace the index with dirs listed elsewhere (e.g. from a snapshot) and return the number that changed.
+
+        Dirs that are not listed are removed only if all dirs were read: an error leaves the index as it was.
+        """
+        known = dict(
+            self.connection.execute(
+                "SELECT path, mtime_ns FROM dirs WHERE root = ?", (str(self.root),)
+            )
+        )
+        seen: Set[str] = set()
+        changed = 0
+        try:
+            for movie_dir, mtime_ns, files in dirs:
+                dir_path = str(movie_dir)
+                seen.add(dir_path)
+                if known.get(dir_path) != mtime_ns:
+                    self._store_dir(dir_path, mtime_ns, files)
+                    changed += 1
+        except BaseException:
+            self.connection.rollback()
+            raise
+
+        gone = [(path,) for path in set(known) - seen]
+        self.connection.executemany("DELETE FROM dirs WHERE path = ?", gone)
+        self.connection.executemany("DELETE FROM files WHERE dir_path = ?", gone)
+        self.connection.commit()
+        self.refreshed = True
+        return changed
+
+    def _scan_dir(self, dir_path: str, mtime_ns: int) -> None:
+        """List one movie dir and replace its rows."""
+        files: List[FileRecord] = []
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                files.append(
+                    FileRecord(entry.name, stat.st_size, stat.st_mtime_ns, entry.is_dir())
+                )
+        self._store_dir(dir_path, mtime_ns, files)
+
+    def _store_dir(self, dir_path: str, mtime_ns: int, files: List[FileRecord]) -> None:
+        """Replace the rows of one movie dir."""
+        names = {file.name for file in files}
+        main_movie = detect_main_movie(files)
+        if not main_movie:
+            # Keep a main movie chosen by the user, as long as the file is still there
+            row = self.connection.execute(
+                "SELECT main_movie FROM dirs WHERE path = ?", (dir_path,)
+            ).fetchone()
+            if row and row[0] in names:
+                main_movie = row[0]
+
+        self.connection.execute("DELETE FROM files WHERE dir_path = ?", (dir_path,))
+        self.connection.executemany(
+            "INSERT INTO files (dir_path, name, size, mtime_ns, is_dir) VALUES (?, ?, ?, ?, ?)",
+            [(dir_path, file.name, file.size, file.mtime_ns, file.is_dir) for file in files],
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO dirs"
+            " (path, root, mtime_ns, main_movie, has_nfo, has_missing_txt, scanned_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                dir_path,
+                str(self.root),
+                mtime_ns,
+                main_movie,
+                any(Path(name).suffix.lower() == ".nfo" for name in names),
+                MISSING_TXT in names,
+                time.time(),
+            ),
+        )
+
+    def iter_dirs(self, since_ns: int = 0) -> Iterator[MovieDirRecord]:
+        """Iterate over indexed movie dirs, newest first.
+
+        With ``since_ns``, only dirs modified since then are read from the index.
+        """
+        if not self.refreshed:
+            self.refresh()
+        rows = self.connection.execute(
+            "SELECT path, mtime_ns, main_movie, has_nfo, has_missing_txt"
+            " FROM dirs WHERE root = ? AND mtime_ns >= ? ORDER BY mtime_ns DESC",
+            (str(self.root), since_ns),
+        ).fetchall()
+        for path, mtime_ns, main_movie, has_nfo, has_missing_txt in rows:
+            yield MovieDirRecord(
+                Path(path), mtime_ns, main_movie, bool(has_nfo), bool(has_missing_txt)
+            )
+
+    def update(self, movie_dir: Union[Path, str]) -> Optional[MovieDirRecord]:
+        """Scan one movie dir again, e.g. after a change was seen on it.
+
+        A dir that is gone (or is not a dir) is removed from the index, and None is returned.
+        """
+        dir_path = str(movie_dir)
+        try:
+            dir_stat = os.stat(dir_path)
+        except FileNotFoundError:
+            dir_stat = None
+        if dir_stat and stat.S_ISDIR(dir_stat.st_mode):
+            self._scan_dir(dir_path, dir_stat.st_mtime_ns)
+        else:
+            self.connection.execute("DELETE FROM dirs WHERE path = ?", (dir_path,))
+            self.connection.execute("DELETE FROM files WHERE dir_path = ?", (dir_path,))
+        self.connection.commit()
+        return self.record(dir_path)
+
+    def record(self, movie_dir: Union[Path, str]) -> Optional[MovieDirRecord]:
+        """Return the indexed state of a movie dir."""
+        row = self.connection.execute(
+            "SELECT path, mtime_ns, main_movie, has_nfo, has_missing_txt FROM dirs WHERE path = ?",
+            (str(movie_dir),),
+        ).fetchone()
+        if not row:
+            return None
+        path, mtime_ns, main_movie, has_nfo, has_missing_txt = row
+        return MovieDirRecord(Path(path), mtime_ns, main_movie, bool(has_nfo), bool(has_missing_txt))
+
+    def files(self, movie_dir: Union[Path, str]) -> List[FileRecord]:
+        """Return the indexed files of a movie dir."""
+        if not self.refreshed:
+            self.refresh()
+        return [
+            FileRecord(name, size, mtime_ns, bool(is_dir))
+            for name, size, mtime_ns, is_dir in self.connection.execute(
+                "SELECT name, size, mtime_ns, is_dir FROM files WHERE dir_path = ? ORDER BY name",
+                (str(movie_dir),),
+            )
+        ]
+
+    def iter_files(self) -> Iterator[Tuple[Path, FileRecord]]:
+        """Iterate over the indexed files of all movie dirs, with one query."""
+        if not self.refreshed:
+            self.refresh()
+        rows = self.connection.execute(
+            "SELECT files.dir_path, files.name, files.size, files.mtime_ns, files.is_dir"
+            " FROM files JOIN dirs ON dirs.path = files.dir_path WHERE dirs.root = ? ORDER BY files.dir_path",
+            (str(self.root),),
+        ).fetchall()
+        for dir_path, name, size, mtime_ns, is_dir in rows:
+            yield Path(dir_path), FileRecord(name, size, mtime_ns, bool(is_dir))
+
+    def set_main_movie(self, movie_dir: Union[Path, str], main_movie: str) -> None:
+        """Remember the main movie chosen for a dir."""
+        self.connection.execute(
+            "UPDATE dirs SET main_movie = ? WHERE path = ?", (main_movie, str(movie_dir))
+        )
+        self.connection.commit()
+
+    def count(self) -> int:
+        """Return the count of indexed movie dirs."""
+        if not self.refreshed:
+            self.refresh()
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM dirs WHERE root = ?", (str(self.root),)
+        ).fetchone()[0]
+
+
+class ValidationState:
+    """Result of the last validation of each movie dir, and the dir mtime after it.
+
+    A dir that was renamed, or had files added, removed or renamed since then has a different mtime.
+    """
+
+    def __init__(self, db_path: Path = LIBRARY_DB) -> None:
+        self.connection = connect(db_path)
+
+    def passed(self, movie_dir: Union[Path, str], mtime_ns: int) -> bool:
+        """Tell if the dir passed the last validation and didn't change since then."""
+        row = self.connection.execute(
+            "SELECT mtime_ns, valid FROM validations WHERE path = ?", (str(movie_dir),)
+        ).fetchone()
+        return bool(row and row[0] == mtime_ns and row[1])
+
+    def record(self, movie_dir: Path, valid: bool, mtime_ns: Optional[int] = None) -> None:
+        """Record the result of a validation, with the dir mtime after files were written in it.
+
+        Pass ``mtime_ns`` when the dir can't be read, e.g. from a snapshot: nothing was written in it then.
+        """
+        if mtime_ns is None:
+            mtime_ns = movie_dir.stat().st_mtime_ns
+        self.connection.execute(
+            "INSERT OR REPLACE INTO validations (path, mtime_ns, valid, validated_at) VALUES (?, ?, ?, ?)",
+            (str(movie_dir), mtime_ns, valid, time.time()),
+        )
+        self.connection.commit()
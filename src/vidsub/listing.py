@@ -0,0 +1,146 @@
+"""Long listing of a dir as a tree, like ``exa -lhaRTF``, without running an external command."""
+import os
+import pwd
+import stat
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Deque, Iterable, Iterator, List, Optional, Union
+
+import click
+
+from vidsub.library import FileRecord
+
+SIZE_UNITS = ("k", "M", "G", "T", "P")
+HEADER = f"{'Permissions':<11} {'Size':>5} {'User':<8} {'Date Modified':<13} Name"
+
+
+def human_size(size: int) -> str:
+    """Format a size with decimal prefixes, like exa.
+
+    >>> [human_size(size) for size in (0, 999, 3_000, 12_345, 734_000_000, 1_200_000_000)]
+    ['0', '999', '3.0k', '12k', '734M', '1.2G']
+    """
+    if size < 1000:
+        return str(size)
+    value = float(size)
+    for unit in SIZE_UNITS:
+        value /= 1000
+        if value < 999.5 or unit == SIZE_UNITS[-1]:
+            return f"{value:.1f}{unit}" if value < 9.95 else f"{value:.0f}{unit}"
+    return str(size)
+
+
+@lru_cache(maxsize=None)
+def user_name(uid: int) -> str:
+    """Return the name of a user, or the uid of an unknown one (e.g. on a mount from another host)."""
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+def format_date(mtime: float) -> str:
+    """Format a date like exa: with the time for this year, otherwise with the year."""
+    modified = time.localtime(mtime)
+    if modified.tm_year == time.localtime().tm_year:
+        return time.strftime("%d %b %H:%M", modified)
+    return time.strftime("%d %b  %Y", modified)
+
+
+def type_marker(mode: int) -> str:
+    """Return the char appended to a name by ``ls -F``."""
+    if stat.S_ISDIR(mode):
+        return "/"
+    if stat.S_ISLNK(mode):
+        return "@"
+    if stat.S_ISFIFO(mode):
+        return "|"
+    if stat.S_ISSOCK(mode):
+        return "="
+    if mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+        return "*"
+    return ""
+
+
+def format_line(name: str, stat_result: os.stat_result, prefix: str = "") -> str:
+    """Format one line of the long listing."""
+    mode = stat_result.st_mode
+    size = "-" if stat.S_ISDIR(mode) else human_size(stat_result.st_size)
+    if stat.S_ISDIR(mode):
+        name = click.style(name, fg="blue", bold=True)
+    elif stat.S_ISLNK(mode):
+        name = click.style(name, fg="cyan")
+    elif mode & stat.S_IXUSR:
+        name = click.style(name, fg="green", bold=True)
+    return (
+        f"{stat.filemode(mode):<11} {size:>5} {user_name(stat_result.st_uid):<8}"
+        f" {format_date(stat_result.st_mtime):<13} {prefix}{name}{type_marker(mode)}"
+    )
+
+
+def iter_tree(path: Union[Path, str], prefix: str = "") -> Iterator[str]:
+    """Iterate over the lines of the entries under a dir, with one scandir per dir, sorted by name."""
+    try:
+        with os.scandir(path) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name.lower())
+    except OSError as error:
+        yield f"{prefix}└── [{error.strerror}]"
+        return
+    for position, entry in enumerate(entries):
+        last = position == len(entries) - 1
+        try:
+            stat_result = entry.stat(follow_symlinks=False)
+        except OSError:
+            # Removed while listing
+            continue
+        yield format_line(entry.name, stat_result, prefix + ("└── " if last else "├── "))
+        if stat.S_ISDIR(stat_result.st_mode):
+            yield from iter_tree(entry.path, prefix + ("    " if last else "│   "))
+
+
+def iter_listing(path: Union[Path, str]) -> Iterator[str]:
+    """Iterate over the lines of the listing of a dir: the header, the dir itself and its tree.
+
+    Raise FileNotFoundError before any line if the dir is gone, e.g. removed after the library index was refreshed.
+    """
+    stat_result = os.stat(path)
+    yield click.style(HEADER, underline=True)
+    yield format_line(str(path), stat_result)
+    yield from iter_tree(path)
+
+
+def list_existing(path: Union[Path, str]) -> Optional[List[str]]:
+    """Return the lines of the listing of a dir, or None if the dir is gone."""
+    try:
+        return list(iter_listing(path))
+    except FileNotFoundError:
+        return None
+
+
+def iter_index_listing(path: Path, files: List[FileRecord]) -> Iterator[str]:
+    """Iterate over the lines of the listing of a dir from the library index: sizes and dates, without the tree."""
+    yield click.style(HEADER, underline=True)
+    yield f"{'-':<11} {'-':>5} {'-':<8} {'':<13} {click.style(str(path), fg='blue', bold=True)}/"
+    for position, file in enumerate(files):
+        branch = "├── " if position < len(files) - 1 else "└── "
+        size = "-" if file.is_dir else human_size(file.size)
+        name = click.style(file.name, fg="blue", bold=True) + "/" if file.is_dir else file.name
+        yield f"{'-':<11} {size:>5} {'-':<8} {format_date(file.mtime_ns / 1e9):<13} {branch}{name}"
+
+
+def iter_listings(paths: Iterable[Union[Path, str]], workers: int) -> Iterator[Optional[List[str]]]:
+    """Iterate over the listings of many dirs, made in a thread pool a few dirs ahead, in the original order.
+
+    A dir that is gone has None instead of a listing.
+    """
+    pending: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path in paths:
+            pending.append(executor.submit(list_existing, path))
+            if len(pending) > workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
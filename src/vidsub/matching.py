@@ -0,0 +1,57 @@
+"""Match dir names against the partial names given on the command line."""
+import re
+from functools import lru_cache
+from typing import Iterable, Optional, Pattern, Tuple
+
+from vidsub.titles import normalize
+
+
+@lru_cache(maxsize=100_000)
+def normalize_name(name: str) -> str:
+    """Normalize a name only once: lowercase, without accents and punctuation."""
+    return normalize(name)
+
+
+class NameMatcher:
+    """Tell if a name contains all the tokens of a query, in any order or in the query order.
+
+    >>> compile_query(("1999", "matrix")).match("The.Matrix.1999.1080p")
+    True
+    >>> compile_query(("1999", "matrix"), ordered=True).match("The.Matrix.1999.1080p")
+    False
+    >>> compile_query(("amelie",)).match("Amélie (2001)")
+    True
+    >>> compile_query(("-",)).match("The.Matrix.1999.1080p")
+    False
+    """
+
+    def __init__(self, tokens: Tuple[str, ...], ordered=False, match_all=True) -> None:
+        self.tokens = tokens
+        self.match_all = match_all
+        self.regex: Optional[Pattern] = (
+            re.compile(".*".join(re.escape(token) for token in tokens)) if ordered and tokens else None
+        )
+
+    def match(self, name: str) -> bool:
+        """Tell if the name matches; a query without tokens matches everything, or nothing if ``match_all`` is False."""
+        if not self.tokens:
+            return self.match_all
+        normalized = normalize_name(name)
+        if self.regex:
+            return self.regex.search(normalized) is not None
+        return all(token in normalized for token in self.tokens)
+
+
+@lru_cache(maxsize=256)
+def compile_query(patterns: Tuple[str, ...], ordered=False) -> NameMatcher:
+    """Split partial names into normalized tokens, and compile a matcher only once per query.
+
+    Partial names without any token (e.g. only punctuation) match nothing, instead of the whole library.
+    """
+    tokens = tuple(token for pattern in patterns for token in normalize(pattern).split())
+    return NameMatcher(tokens, ordered, match_all=not any(pattern.strip() for pattern in patterns))
+
+
+def create_matcher(patterns: Optional[Iterable[str]], ordered=False) -> NameMatcher:
+    """Create a matcher from partial names given as any iterable, or None to match everything."""
+    return compile_query(tuple(patterns or ()), ordered)
@@ -0,0 +1,364 @@
+"""Probe the headers of MKV, MP4/MOV and AVI files: duration, resolution and streams, without ffprobe.
+
+Only the headers are read, with a few small reads at known offsets; the media data is never read.
+"""
+import os
+import re
+import struct
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from vidsub.cache import SqliteCache
+from vidsub.constants import CACHE_DIR
+
+PROBE_DB = CACHE_DIR / "probe.sqlite"
+PROBE_MAX_ENTRIES = 200_000
+# Header elements and atoms bigger than this are not read (a MP4 index of a long movie has a few MB)
+MAX_HEADER_SIZE = 16 * 1024 * 1024
+# Videos shorter than this are extras, even without "sample" or "trailer" in the name
+EXTRA_MAX_DURATION = 10 * 60
+# The main movie must be this many times longer (or bigger, if durations are unknown) than any other video
+MAIN_MOVIE_RATIO = 2.0
+EXTRA_REGEX = re.compile(r"(?<![a-z])(sample|trailer|teaser|featurette)(?![a-z])", re.IGNORECASE)
+
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_TRACKS = 0x1654AE6B
+MKV_CLUSTER = 0x1F43B675
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_TYPE = 0x83
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+MKV_TRACK_TYPES = {1: "video", 2: "audio", 17: "subtitle"}
+
+MP4_CONTAINERS = {b"moov", b"trak", b"mdia"}
+MP4_HANDLERS = {b"vide": "video", b"soun": "audio", b"sbtl": "subtitle", b"subt": "subtitle", b"text": "subtitle"}
+AVI_STREAM_TYPES = {b"vids": "video", b"auds": "audio", b"txts": "subtitle"}
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    """What the header of a video says about it; unknown values are None or 0."""
+
+    path: Path
+    size: int
+    container: str = "unknown"
+    duration: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    video_streams: int = 0
+    audio_streams: int = 0
+    subtitle_streams: int = 0
+
+    @property
+    def extra(self) -> Optional[str]:
+        """Return why this video is a sample or a trailer, or None if it looks like a movie."""
+        found = EXTRA_REGEX.search(self.path.stem)
+        if found:
+            return found.group(1).lower()
+        if self.duration is not None and self.duration < EXTRA_MAX_DURATION:
+            return "short"
+        return None
+
+
+class _Streams:
+    """Count streams by type while parsing."""
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = {"video": 0, "audio": 0, "subtitle": 0}
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+
+    def add(self, kind: Optional[str], width: Optional[int] = None, height: Optional[int] = None) -> None:
+        if kind in self.counts:
+            self.counts[kind] += 1
+        # The first video stream is the one that is played
+        if kind == "video" and self.width is None and width and height:
+            self.width, self.height = width, height
+
+    def result(self, path: Path, size: int, container: str, duration: Optional[float]) -> ProbeResult:
+        return ProbeResult(
+            path,
+            size,
+            container,
+            duration,
+            self.width,
+            self.height,
+            self.counts["video"],
+            self.counts["audio"],
+            self.counts["subtitle"],
+        )
+
+
+def read_at(file: BinaryIO, offset: int, size: int) -> bytes:
+    """Read a range of a file."""
+    file.seek(offset)
+    return file.read(size)
+
+
+def read_vint(data: bytes, position: int, keep_marker: bool = False) -> Tuple[int, int]:
+    """Read an EBML variable-length integer, returning it and the position after it.
+
+    >>> read_vint(b"\\x81", 0)
+    (1, 1)
+    >>> read_vint(b"\\x1a\\x45\\xdf\\xa3", 0, keep_marker=True)
+    (440786851, 4)
+    """
+    first = data[position]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or position + length > len(data):
+        raise ValueError("Invalid EBML integer")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[position + 1:position + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        # All ones: unknown size, e.g. a segment written while streaming
+        value = -1
+    return value, position + length
+
+
+def iter_ebml(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Iterate over the IDs and contents of the EBML elements in a buffer."""
+    position = start
+    end = len(data) if end is None else end
+    while position < end:
+        element_id, position = read_vint(data, position, keep_marker=True)
+        size, position = read_vint(data, position)
+        if size < 0:
+            size = end - position
+        yield element_id, data[position:position + size]
+        position += size
+
+
+def _unsigned(data: bytes) -> int:
+    return int.from_bytes(data, "big")
+
+
+def probe_mkv(file: BinaryIO, path: Path, size: int) -> ProbeResult:
+    """Read the Info and Tracks elements of a Matroska/WebM file, stopping at the first cluster."""
+    header = read_at(file, 0, 64)
+    _, position = read_vint(header, 0, keep_marker=True)
+    ebml_size, position = read_vint(header, position)
+    position += ebml_size
+
+    header = read_at(file, position, 16)
+    segment_id, offset = read_vint(header, 0, keep_marker=True)
+    if segment_id != MKV_SEGMENT:
+        raise ValueError("No Matroska segment")
+    segment_size, offset = read_vint(header, offset)
+    position += offset
+    segment_end = size if segment_size < 0 else min(size, position + segment_size)
+
+    streams = _Streams()
+    timecode_scale = 1_000_000
+    duration: Optional[float] = None
+    found = set()
+    while position < segment_end and found != {MKV_INFO, MKV_TRACKS}:
+        header = read_at(file, position, 16)
+        if len(header) < 2:
+            break
+        element_id, offset = read_vint(header, 0, keep_marker=True)
+        element_size, offset = read_vint(header, offset)
+        if element_id == MKV_CLUSTER or element_size < 0:
+            break
+        if element_id in (MKV_INFO, MKV_TRACKS) and element_size <= MAX_HEADER_SIZE:
+            found.add(element_id)
+            content = read_at(file, position + offset, element_size)
+            for child_id, child in iter_ebml(content):
+                if child_id == MKV_TIMECODE_SCALE:
+                    timecode_scale = _unsigned(child)
+                elif child_id == MKV_DURATION:
+                    duration = struct.unpack(">f" if len(child) == 4 else ">d", child)[0]
+                elif child_id == MKV_TRACK_ENTRY:
+                    _add_mkv_track(streams, child)
+        position += offset + element_size
+
+    seconds = duration * timecode_scale / 1e9 if duration is not None else None
+    return streams.result(path, size, "matroska", seconds)
+
+
+def _add_mkv_track(streams: _Streams, entry: bytes) -> None:
+    kind = None
+    width = height = None
+    for element_id, content in iter_ebml(entry):
+        if element_id == MKV_TRACK_TYPE:
+            kind = MKV_TRACK_TYPES.get(_unsigned(content))
+        elif element_id == MKV_VIDEO:
+            for video_id, value in iter_ebml(content):
+                if video_id == MKV_PIXEL_WIDTH:
+                    width = _unsigned(value)
+                elif video_id == MKV_PIXEL_HEIGHT:
+                    height = _unsigned(value)
+    streams.add(kind, width, height)
+
+
+def iter_atoms(data: bytes, start: int = 0) -> Iterator[Tuple[bytes, bytes]]:
+    """Iterate over the types and contents of the MP4 atoms in a buffer."""
+    position = start
+    while position + 8 <= len(data):
+        atom_size, atom_type = struct.unpack_from(">I4s", data, position)
+        header = 8
+        if atom_size == 1:
+            atom_size = struct.unpack_from(">Q", data, position + 8)[0]
+            header = 16
+        elif atom_size == 0:
+            atom_size = len(data) - position
+        if atom_size < header:
+            raise ValueError("Invalid MP4 atom")
+        yield atom_type, data[position + header:position + atom_size]
+        position += atom_size
+
+
+def probe_mp4(file: BinaryIO, path: Path, size: int) -> ProbeResult:
+    """Find the moov atom among the top-level atoms (at the start or at the end), and read only it."""
+    position = 0
+    moov = None
+    while position + 8 <= size:
+        header = read_at(file, position, 16)
+        atom_size, atom_type = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if atom_size == 1:
+            atom_size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif atom_size == 0:
+            atom_size = size - position
+        if atom_size < header_size:
+            break
+        if atom_type == b"moov":
+            if atom_size <= MAX_HEADER_SIZE:
+                moov = read_at(file, position + header_size, atom_size - header_size)
+            break
+        position += atom_size
+
+    streams = _Streams()
+    duration = None
+    if moov:
+        for atom_type, content in iter_atoms(moov):
+            if atom_type == b"mvhd":
+                duration = _mvhd_duration(content)
+            elif atom_type == b"trak":
+                _add_mp4_track(streams, content)
+    return streams.result(path, size, "mp4", duration)
+
+
+def _mvhd_duration(content: bytes) -> Optional[float]:
+    if content[0] == 1:
+        timescale, duration = struct.unpack_from(">IQ", content, 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", content, 12)
+    return duration / timescale if timescale else None
+
+
+def _add_mp4_track(streams: _Streams, trak: bytes) -> None:
+    kind = None
+    width = height = None
+    pending = list(iter_atoms(trak))
+    while pending:
+        atom_type, content = pending.pop()
+        if atom_type in MP4_CONTAINERS:
+            pending.extend(iter_atoms(content))
+        elif atom_type == b"hdlr":
+            kind = MP4_HANDLERS.get(content[8:12])
+        elif atom_type == b"tkhd" and len(content) >= 8:
+            # Fixed-point 16.16 numbers at the end of the track header
+            width, height = (value >> 16 for value in struct.unpack(">II", content[-8:]))
+    streams.add(kind, width, height)
+
+
+def probe_avi(file: BinaryIO, path: Path, size: int) -> ProbeResult:
+    """Read the hdrl list of an AVI file: the main header and the stream headers."""
+    header = read_at(file, 12, 12)
+    list_type, list_size, hdrl = struct.unpack("<4sI4s", header)
+    if list_type != b"LIST" or hdrl != b"hdrl" or list_size > MAX_HEADER_SIZE:
+        raise ValueError("No AVI header list")
+    data = read_at(file, 24, list_size - 4)
+
+    streams = _Streams()
+    micro_seconds_per_frame = total_frames = 0
+    width = height = None
+    for chunk_id, content in _iter_riff(data):
+        if chunk_id == b"avih":
+            micro_seconds_per_frame, _, _, _, total_frames = struct.unpack_from("<5I", content)
+            width, height = struct.unpack_from("<II", content, 32)
+        elif chunk_id == b"LIST" and content[:4] == b"strl":
+            for stream_chunk, stream_header in _iter_riff(content[4:]):
+                if stream_chunk == b"strh":
+                    streams.add(AVI_STREAM_TYPES.get(stream_header[:4]), width, height)
+        elif chunk_id == b"LIST" and content[:4] == b"odml":
+            # OpenDML files bigger than 1 GB have the real frame count here
+            for odml_chunk, odml_header in _iter_riff(content[4:]):
+                if odml_chunk == b"dmlh":
+                    total_frames = max(total_frames, struct.unpack_from("<I", odml_header)[0])
+    duration = total_frames * micro_seconds_per_frame / 1e6 if micro_seconds_per_frame else None
+    return streams.result(path, size, "avi", duration)
+
+
+def _iter_riff(data: bytes) -> Iterator[Tuple[bytes, bytes]]:
+    position = 0
+    while position + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, position)
+        yield chunk_id, data[position + 8:position + 8 + chunk_size]
+        # Chunks are padded to an even size
+        position += 8 + chunk_size + (chunk_size & 1)
+
+
+def probe(path: Path) -> ProbeResult:
+    """Probe a video by its header; a file with an unknown or broken header only has its size."""
+    size = os.stat(path).st_size
+    try:
+        with open(path, "rb") as file:
+            magic = file.read(12)
+            if magic.startswith(EBML_MAGIC):
+                return probe_mkv(file, path, size)
+            if magic[4:8] in (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip"):
+                return probe_mp4(file, path, size)
+            if magic[:4] == b"RIFF" and magic[8:12] == b"AVI ":
+                return probe_avi(file, path, size)
+    except (ValueError, IndexError, struct.error):
+        pass
+    return ProbeResult(path, size)
+
+
+def create_probe_cache() -> SqliteCache:
+    """Create the persistent cache of probe results."""
+    return SqliteCache(PROBE_DB, "probe", PROBE_MAX_ENTRIES)
+
+
+def probe_file(path: Path, cache: Optional[SqliteCache] = None) -> ProbeResult:
+    """Probe a video; with a cache, the file is only read when its size or mtime changed."""
+    if cache is None:
+        return probe(path)
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    cached = cache.get(str(path))
+    if cached and cached["signature"] == signature:
+        return ProbeResult(path, **cached["result"])
+    result = probe(path)
+    values = asdict(result)
+    del values["path"]
+    cache.set(str(path), {"signature": signature, "result": values})
+    return result
+
+
+def choose_main_movie(results: Iterable[ProbeResult]) -> Optional[ProbeResult]:
+    """Choose the main movie among the videos of a dir, ignoring samples and trailers.
+
+    Return None when it's not clear, e.g. a movie split in two parts.
+    """
+    candidates = [result for result in results if not result.extra]
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else None
+    if all(result.duration for result in candidates):
+        measures: List[Tuple[float, ProbeResult]] = [(result.duration or 0, result) for result in candidates]
+    else:
+        measures = [(result.size, result) for result in candidates]
+    measures.sort(key=lambda measure: measure[0], reverse=True)
+    (best, main_movie), (second, _) = measures[:2]
+    return main_movie if best >= second * MAIN_MOVIE_RATIO else None
@@ -0,0 +1,155 @@
+"""Metrics of a command run: phase timings, syscalls, subprocesses, IMDb requests and cache hit rates."""
+import builtins
+import io
+import json
+import os
+import pathlib
+import resource
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+import click
+
+from vidsub import __version__
+
+if TYPE_CHECKING:
+    from vidsub import MovieManager
+
+# Functions that hit the filesystem (or sshfs) on every call. Stats cached by os.DirEntry are not counted.
+COUNTED_OS_CALLS = ("stat", "lstat", "scandir", "listdir")
+NOTES = [
+    "Functions are patched process-wide: calls made by all threads and libraries while the command runs are counted",
+    "Calls made through references bound before the profiler started, e.g. by C extensions, are not counted",
+]
+
+
+class Profiler:
+    """Count syscalls and subprocesses, and collect the metrics of movie managers, while a command runs.
+
+    The counts are for the whole process, not for one thread: see :data:`NOTES`, which is added to the report.
+    """
+
+    def __init__(self, pstats_file: Optional[Path] = None) -> None:
+        self.pstats_file = pstats_file
+        self.counts: Counter = Counter()
+        self.managers: List["MovieManager"] = []
+        self._lock = threading.Lock()
+        self._originals: Dict[Any, Dict[str, Any]] = {}
+        self._profile: Any = None
+        self._start = self._end = 0.0
+        self._usage: Any = None
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _wrap(self, name: str, function: Callable) -> Callable:
+        def counted(*args, **kwargs):
+            self._count(name)
+            return function(*args, **kwargs)
+
+        return counted
+
+    def _patch(self, module: Any, name: str, replacement: Any) -> None:
+        self._originals.setdefault(module, {})[name] = getattr(module, name)
+        setattr(module, name, replacement)
+
+    def start(self) -> None:
+        """Start counting and timing."""
+        # Before Python 3.11, Path methods call the functions that pathlib's accessor bound when it was imported
+        accessor = getattr(pathlib, "_NormalAccessor", None)
+        if accessor:
+            for name, original in list(vars(accessor).items()):
+                if name in COUNTED_OS_CALLS or (name == "open" and original is io.open):
+                    self._patch(accessor, name, staticmethod(self._wrap(name, original)))
+        for name in COUNTED_OS_CALLS:
+            self._patch(os, name, self._wrap(name, getattr(os, name)))
+        # pathlib opens files with io.open, the rest of the code with the builtin
+        counted_open = self._wrap("open", builtins.open)
+        self._patch(builtins, "open", counted_open)
+        self._patch(io, "open", counted_open)
+
+        profiler = self
+
+        class CountedPopen(subprocess.Popen):
+            def __init__(self, *args, **kwargs) -> None:
+                profiler._count("subprocess")
+                super().__init__(*args, **kwargs)
+
+        self._patch(subprocess, "Popen", CountedPopen)
+
+        if self.pstats_file:
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._usage = resource.getrusage(resource.RUSAGE_SELF)
+        self._start = time.perf_counter()
+
+    def stop(self) -> None:
+        """Stop counting, and restore the patched functions."""
+        self._end = time.perf_counter()
+        if self._profile:
+            self._profile.disable()
+        for module, originals in self._originals.items():
+            for name, original in originals.items():
+                setattr(module, name, original)
+        self._originals.clear()
+
+    def report(self) -> Dict[str, Any]:
+        """Return the metrics collected so far."""
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        phases: Dict[str, Dict[str, float]] = {}
+        imdb: Dict[str, Dict[str, float]] = {}
+        caches: Dict[str, Dict[str, float]] = {}
+        for manager in self.managers:
+            for name, seconds in manager.timer.seconds.items():
+                phase = phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+                phase["seconds"] += seconds
+                phase["calls"] += manager.timer.calls[name]
+            for method, latencies in manager.ia.latencies.items():
+                requests = imdb.setdefault(method, {"requests": 0, "seconds": 0.0, "max_seconds": 0.0})
+                requests["requests"] += len(latencies)
+                requests["seconds"] += sum(latencies)
+                requests["max_seconds"] = max([requests["max_seconds"], *latencies])
+            for cache in (
+                manager.classification_cache,
+                manager.probe_cache,
+                manager.ia.search_cache,
+                manager.ia.movie_cache,
+            ):
+                if cache:
+                    stats = caches.setdefault(cache.table, {"hits": 0, "misses": 0})
+                    stats["hits"] += cache.hits
+                    stats["misses"] += cache.misses
+        for stats in caches.values():
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+
+        return {
+            "version": __version__,
+            "command": sys.argv[1:],
+            "wall_seconds": (self._end or time.perf_counter()) - self._start,
+            "cpu_seconds": (usage.ru_utime - self._usage.ru_utime) + (usage.ru_stime - self._usage.ru_stime),
+            "phases": phases,
+            "syscalls": {name: self.counts[name] for name in (*COUNTED_OS_CALLS, "open")},
+            "subprocesses": self.counts["subprocess"],
+            "imdb": imdb,
+            "caches": caches,
+            "notes": NOTES,
+        }
+
+    def finish(self, json_file: Optional[Path]) -> None:
+        """Stop, then write the JSON report and the cProfile stats."""
+        self.stop()
+        if json_file:
+            json_file.write_text(json.dumps(self.report(), indent=2) + "\n")
+            click.echo(f"Profile report written to {json_file}", err=True)
+        if self._profile:
+            self._profile.dump_stats(str(self.pstats_file))
+            click.echo(f"cProfile stats written to {self.pstats_file}", err=True)
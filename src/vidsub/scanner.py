@@ -0,0 +1,47 @@
+"""In-process directory scanning with os.scandir, without spawning external tools."""
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Iterator, List, Pattern, Set, Union
+
+
+def scandir_newest_first(dir_: Union[Path, str]) -> List[os.DirEntry]:
+    """List a dir sorted by newest first, using the stat cached on each entry."""
+    with os.scandir(dir_) as iterator:
+        entries = list(iterator)
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return entries
+
+
+def compile_smart_case(partial_name: str) -> Pattern:
+    """Compile a partial name like fd does: case insensitive unless it has uppercase chars."""
+    flags = 0 if any(char.isupper() for char in partial_name) else re.IGNORECASE
+    return re.compile(partial_name, flags)
+
+
+def walk_files(dir_: Union[Path, str]) -> Iterator[os.DirEntry]:
+    """Recursively iterate over non-hidden files, without following symlinks to dirs (like fd)."""
+    with os.scandir(dir_) as iterator:
+        for entry in iterator:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(entry.path)
+            else:
+                yield entry
+
+
+def find_files(
+    dir_: Union[Path, str], partial_names: Iterable[str], extensions: Set[str]
+) -> List[str]:
+    """Find files matching any of the partial names in a single walk.
+
+    Paths are relative to the dir; an empty partial name matches everything.
+    """
+    regexes = [compile_smart_case(name) for name in partial_names] or [re.compile("")]
+    return sorted(
+        os.path.relpath(entry.path, dir_)
+        for entry in walk_files(dir_)
+        if os.path.splitext(entry.name)[1] in extensions
+        and any(regex.search(entry.name) for regex in regexes)
+    )
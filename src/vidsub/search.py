@@ -0,0 +1,161 @@
+"""In-memory search over the library: dir names, titles, years and IMDb IDs."""
+import os
+import pickle
+import re
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from vidsub.cache import SqliteCache
+from vidsub.constants import CACHE_DIR
+from vidsub.library import LibraryIndex, MovieDirRecord
+from vidsub.titles import normalize, parse_dir_name
+
+SEARCH_SNAPSHOT = CACHE_DIR / "search.pickle"
+# Change it when the snapshot format changes, so old snapshots are rebuilt
+SNAPSHOT_VERSION = 1
+IMDB_ID_REGEX = re.compile(r"tt\d{7,}")
+TRIGRAM = 3
+EMPTY = array("I")
+
+# Path, mtime, title, year and IMDb ID
+EntryRow = Tuple[str, int, str, Optional[int], Optional[str]]
+
+
+@dataclass(frozen=True)
+class SearchEntry:
+    """A movie dir and what is known about its movie."""
+
+    path: str
+    mtime_ns: int
+    title: str
+    year: Optional[int]
+    imdb_id: Optional[str]
+
+
+def read_imdb_id(index: LibraryIndex, record: MovieDirRecord) -> Optional[str]:
+    """Read the IMDb ID from the .nfo file of the main movie, or from any .nfo file in the dir."""
+    if not record.has_nfo:
+        return None
+    names = [file.name for file in index.files(record.path) if file.name.lower().endswith(".nfo")]
+    if record.main_movie:
+        main_nfo = Path(record.main_movie).with_suffix(".nfo").name
+        names.sort(key=lambda name: name != main_nfo)
+    for name in names:
+        try:
+            found = IMDB_ID_REGEX.search((record.path / name).read_text(errors="replace"))
+        except OSError:
+            continue
+        if found:
+            return found.group()
+    return None
+
+
+def create_entry(
+    index: LibraryIndex, record: MovieDirRecord, movie_cache: Optional[SqliteCache] = None
+) -> SearchEntry:
+    """Describe a movie dir, with the IMDb title when it's in the cache, otherwise with the title of the dir name."""
+    imdb_id = read_imdb_id(index, record)
+    cached = movie_cache.get(imdb_id[2:]) if movie_cache and imdb_id else None
+    if cached:
+        data = cached["data"]
+        return SearchEntry(str(record.path), record.mtime_ns, data.get("title", ""), data.get("year"), imdb_id)
+    parsed = parse_dir_name(record.path.name)
+    return SearchEntry(str(record.path), record.mtime_ns, parsed.title, parsed.year, imdb_id)
+
+
+def trigrams_of(text: str) -> Iterator[str]:
+    """Iterate over the substrings of 3 chars of a text."""
+    for start in range(len(text) - TRIGRAM + 1):
+        yield text[start:start + TRIGRAM]
+
+
+class LibrarySearch:
+    """Search movie dirs by partial words, in any order, like :class:`vidsub.matching.NameMatcher`.
+
+    The longest token of a query is looked up in a trigram index; the candidates are then checked with all tokens.
+    Entries and postings are kept as plain tuples and arrays, so a snapshot loads fast.
+    """
+
+    def __init__(self, entries: List[SearchEntry]) -> None:
+        self.rows: List[EntryRow] = [
+            (entry.path, entry.mtime_ns, entry.title, entry.year, entry.imdb_id) for entry in entries
+        ]
+        self.texts = [
+            normalize(f"{os.path.basename(entry.path)} {entry.title} {entry.year or ''} {entry.imdb_id or ''}")
+            for entry in entries
+        ]
+        trigrams: Dict[str, List[int]] = defaultdict(list)
+        for position, text in enumerate(self.texts):
+            for trigram in set(trigrams_of(text)):
+                trigrams[trigram].append(position)
+        self.trigrams = {trigram: array("I", positions) for trigram, positions in trigrams.items()}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _candidates(self, token: str) -> Iterable[int]:
+        if len(token) < TRIGRAM:
+            return range(len(self.texts))
+        # The rarest trigram of the token has the fewest candidates
+        return min((self.trigrams.get(trigram, EMPTY) for trigram in trigrams_of(token)), key=len)
+
+    def search(self, query: Iterable[str]) -> List[SearchEntry]:
+        """Return the entries matching all tokens of the query, in the order of the library (newest first).
+
+        Like :func:`vidsub.matching.compile_query`, a query without any token (e.g. "-") matches nothing.
+        """
+        query = list(query)
+        tokens = sorted((token for part in query for token in normalize(part).split()), key=len, reverse=True)
+        if not tokens and any(part.strip() for part in query):
+            return []
+        texts = self.texts
+        positions = self._candidates(tokens[0] if tokens else "")
+        for token in tokens:
+            positions = [position for position in positions if token in texts[position]]
+        return [SearchEntry(*self.rows[position]) for position in positions]
+
+    @classmethod
+    def load(
+        cls,
+        index: LibraryIndex,
+        movie_cache: Optional[SqliteCache] = None,
+        snapshot: Path = SEARCH_SNAPSHOT,
+    ) -> "LibrarySearch":
+        """Load the search from its snapshot, and update it with the dirs that changed in the library index."""
+        try:
+            with open(snapshot, "rb") as file:
+                saved = pickle.load(file)
+            if saved["version"] != SNAPSHOT_VERSION or saved["root"] != str(index.root):
+                saved = None
+        # An old snapshot can refer to classes or attributes that changed since then: it's built again
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError, AttributeError, ImportError):
+            saved = None
+
+        known: Dict[str, int] = {row[0]: position for position, row in enumerate(saved["search"].rows)} if saved else {}
+        entries = []
+        changed = saved is None
+        for record in index.iter_dirs():
+            position = known.get(str(record.path))
+            entry = SearchEntry(*saved["search"].rows[position]) if position is not None else None
+            if not entry or entry.mtime_ns != record.mtime_ns:
+                entry = create_entry(index, record, movie_cache)
+                changed = True
+            entries.append(entry)
+        changed = changed or len(entries) != len(known)
+        if not changed:
+            return saved["search"]
+
+        search = cls(entries)
+        snapshot.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = snapshot.with_suffix(".tmp")
+        with open(temp_file, "wb") as file:
+            pickle.dump(
+                {"version": SNAPSHOT_VERSION, "root": str(index.root), "search": search},
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        temp_file.replace(snapshot)
+        return search
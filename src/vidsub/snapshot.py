@@ -0,0 +1,161 @@
+"""Snapshots of the library as NDJSON: one JSON record per line, streamed by ``vd scan --emit ndjson``.
+
+The scan runs where the disk is; commands on another host read the snapshot instead of the sshfs mount,
+so thousands of network round trips become one sequential transfer.
+Paths are relative to the movies dir, so both hosts can mount it anywhere.
+Binary files are probed where the disk is too, so the main movie of a dir can be chosen without reading it.
+"""
+import json
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from vidsub.cache import SqliteCache
+from vidsub.classify import classify_file
+from vidsub.library import FileRecord, LibraryIndex
+from vidsub.probe import ProbeResult, probe_file
+
+# Change it when the format changes; readers refuse other versions
+SNAPSHOT_VERSION = 2
+
+
+class SnapshotError(Exception):
+    """The snapshot is not valid: wrong version, broken line or truncated stream."""
+
+
+@dataclass
+class Snapshot:
+    """What a snapshot says besides the movie dirs, which are loaded into the library index."""
+
+    root_files: List[str] = field(default_factory=list)
+    completed: List[str] = field(default_factory=list)
+    # Paths of binary files (candidates to be movies), as classified where the disk is
+    binary: Set[str] = field(default_factory=set)
+    # Probe results of the binary files, by path
+    probes: Dict[str, ProbeResult] = field(default_factory=dict)
+    dirs: int = 0
+
+
+def _list(path: Path) -> List[os.DirEntry]:
+    with os.scandir(path) as iterator:
+        return sorted(iterator, key=lambda entry: entry.name)
+
+
+def _probe_values(result: ProbeResult) -> Dict[str, Any]:
+    values = asdict(result)
+    # Both are already in the record of the file
+    del values["path"], values["size"]
+    return values
+
+
+def scan_dir(
+    path: str, cache: Optional[SqliteCache] = None, probe_cache: Optional[SqliteCache] = None
+) -> Dict[str, Any]:
+    """Describe a movie dir and its files: name, size, mtime, if it's a dir, if it's binary and its probe result.
+
+    With caches, only files that changed since they were last classified or probed are read.
+    """
+    files = []
+    for entry in _list(Path(path)):
+        stat = entry.stat()
+        is_dir = entry.is_dir()
+        binary = not is_dir and classify_file(Path(entry.path), cache=cache).binary
+        probed = _probe_values(probe_file(Path(entry.path), probe_cache)) if binary else None
+        files.append([entry.name, stat.st_size, stat.st_mtime_ns, is_dir, binary, probed])
+    return {"type": "dir", "name": os.path.basename(path), "mtime_ns": os.stat(path).st_mtime_ns, "files": files}
+
+
+def iter_records(
+    movies_dir: Path,
+    completed_dir: Path,
+    workers: int,
+    cache: Optional[SqliteCache] = None,
+    probe_cache: Optional[SqliteCache] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Iterate over the records of a snapshot: a header, one record per movie dir and an end record.
+
+    Dirs are scanned in a thread pool a few dirs ahead, and yielded in order of name.
+    """
+    entries = _list(movies_dir)
+    yield {
+        "type": "header",
+        "version": SNAPSHOT_VERSION,
+        "root": str(movies_dir),
+        "root_files": [entry.name for entry in entries if not entry.is_dir()],
+        "completed": [entry.name for entry in _list(completed_dir)] if completed_dir.is_dir() else [],
+    }
+    count = 0
+    pending: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            pending.append(executor.submit(scan_dir, entry.path, cache, probe_cache))
+            if len(pending) > workers:
+                count += 1
+                yield pending.popleft().result()
+        while pending:
+            count += 1
+            yield pending.popleft().result()
+    yield {"type": "end", "dirs": count}
+
+
+def write_ndjson(records: Iterable[Dict[str, Any]], stream: TextIO) -> None:
+    """Write one compact JSON record per line."""
+    for record in records:
+        stream.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+        stream.write("\n")
+
+
+def iter_dirs(
+    lines: Iterable[str], movies_dir: Path, snapshot: Snapshot
+) -> Iterator[Tuple[Path, int, List[FileRecord]]]:
+    """Parse the movie dirs of a NDJSON snapshot, with paths under the local movies dir.
+
+    Raise :class:`SnapshotError` if the stream doesn't start with a header or doesn't end with an end record,
+    so an interrupted transfer is not mistaken for a library without the missing dirs.
+    """
+    ended = started = False
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind = record["type"]
+            if not started:
+                if kind != "header" or record.get("version") != SNAPSHOT_VERSION:
+                    raise SnapshotError(f"Not a snapshot of version {SNAPSHOT_VERSION}")
+                started = True
+                snapshot.root_files = record["root_files"]
+                snapshot.completed = record["completed"]
+                continue
+            if kind == "end":
+                ended = record["dirs"] == snapshot.dirs
+                break
+            if kind != "dir":
+                continue
+            movie_dir = movies_dir / record["name"]
+            files = []
+            for name, size, mtime_ns, is_dir, binary, probed in record["files"]:
+                files.append(FileRecord(name, size, mtime_ns, is_dir))
+                if binary:
+                    snapshot.binary.add(str(movie_dir / name))
+                if probed is not None:
+                    snapshot.probes[str(movie_dir / name)] = ProbeResult(movie_dir / name, size, **probed)
+            mtime_ns = record["mtime_ns"]
+        except (ValueError, KeyError, TypeError) as error:
+            raise SnapshotError(f"Line {number}: {error!r}") from error
+        snapshot.dirs += 1
+        yield movie_dir, mtime_ns, files
+    if not ended:
+        raise SnapshotError("The snapshot is truncated")
+
+
+def load_snapshot(stream: TextIO, index: LibraryIndex) -> Snapshot:
+    """Read a snapshot from a stream (a file, a pipe or stdin) into the library index."""
+    snapshot = Snapshot()
+    index.replace_dirs(iter_dirs(stream, index.root, snapshot))
+    return snapshot
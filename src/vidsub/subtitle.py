@@ -0,0 +1,262 @@
+"""Subtitle files: parse and write SRT cues, and rewrite SRT and SUB files line by line."""
+import codecs
+import re
+import shutil
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Deque, Iterable, Iterator, List, Optional, Sequence
+
+TIMESTAMP_REGEX = re.compile(
+    r"(\d+):(\d{2}):(\d{2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{2}):(\d{2})[,.](\d{1,3})"
+)
+# Tried in order; latin-1 decodes anything, so it's the last resort
+ENCODINGS = ("utf-8-sig", "cp1252", "latin-1")
+# Suffix of the copy of a subtitle file kept before it's rewritten
+BACKUP_SUFFIX = ".orig"
+# MicroDVD lines: {start frame}{end frame}text
+MICRODVD_REGEX = re.compile(r"\{(\d+)\}\{(\d*)\}")
+# SubViewer lines: 00:00:01.00,00:00:02.00
+SUBVIEWER_REGEX = re.compile(r"(\d+):(\d{2}):(\d{2})\.(\d{2}),(\d+):(\d{2}):(\d{2})\.(\d{2})\s*$")
+# VobSub .sub files are MPEG streams of images, not text
+MPEG_PACK_HEADER = b"\x00\x00\x01\xba"
+# Frames per second of MicroDVD files that don't declare it on their first line
+DEFAULT_FPS = 23.976
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class Cue:
+    """A subtitle shown between two times, in seconds."""
+
+    start: float
+    end: float
+    text: str
+
+
+def parse_timestamp(hours: str, minutes: str, seconds: str, millis: str) -> float:
+    """Convert the parts of a SRT timestamp to seconds."""
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis.ljust(3, "0")) / 1000
+
+
+def format_timestamp(seconds: float) -> str:
+    """Format seconds as a SRT timestamp.
+
+    >>> format_timestamp(3723.4567)
+    '01:02:03,457'
+    >>> format_timestamp(-1)
+    '00:00:00,000'
+    """
+    millis = max(0, round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    seconds, millis = divmod(millis, 1000)
+    return f"{hours:02}:{minutes:02}:{seconds:02},{millis:03}"
+
+
+def parse_srt(content: str) -> List[Cue]:
+    """Parse the cues of a SRT file, skipping blocks without a valid timestamp line.
+
+    >>> parse_srt("1\\n00:00:01,000 --> 00:00:02,500\\nHello\\nthere\\n\\n2\\n00:00:03,000 --> 00:00:04,000\\nBye\\n")
+    [Cue(start=1.0, end=2.5, text='Hello\\nthere'), Cue(start=3.0, end=4.0, text='Bye')]
+    """
+    cues = []
+    for block in re.split(r"\n\s*\n", content.replace("\r\n", "\n").replace("\r", "\n")):
+        lines = block.strip("\n").split("\n")
+        for position, line in enumerate(lines[:2]):
+            found = TIMESTAMP_REGEX.search(line)
+            if found:
+                parts = found.groups()
+                cues.append(
+                    Cue(parse_timestamp(*parts[:4]), parse_timestamp(*parts[4:]), "\n".join(lines[position + 1:]))
+                )
+                break
+    return cues
+
+
+def format_srt(cues: Iterable[Cue]) -> str:
+    """Format cues as the content of a SRT file, numbered from 1."""
+    return "".join(
+        f"{number}\n{format_timestamp(cue.start)} --> {format_timestamp(cue.end)}\n{cue.text}\n\n"
+        for number, cue in enumerate(cues, 1)
+    )
+
+
+def decode(data: bytes) -> str:
+    """Decode the bytes of a subtitle file with the first encoding that works."""
+    for encoding in ENCODINGS[:-1]:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode(ENCODINGS[-1])
+
+
+def read_srt(path: Path) -> List[Cue]:
+    """Read the cues of a SRT file in any of the usual encodings."""
+    return parse_srt(decode(path.read_bytes()))
+
+
+@dataclass(frozen=True)
+class RewriteResult:
+    """What happened to a subtitle file: its original encoding, how many cues it has and if it was rewritten."""
+
+    path: Path
+    encoding: str = ""
+    cues: int = 0
+    rewritten: bool = False
+    error: str = ""
+
+
+def is_utf8(path: Path) -> bool:
+    """Check if a file is UTF-8 without a BOM, reading it in chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as file:
+        if file.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+            return False
+        file.seek(0)
+        try:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return False
+    return True
+
+
+def shift_time(seconds: float, offset: float, ratio: float) -> float:
+    """Scale and shift a time, never before the start of the movie."""
+    return max(0.0, seconds * ratio + offset)
+
+
+class LineRewriter:
+    """Shift and scale the times of SRT, MicroDVD and SubViewer lines; other lines are kept as they are."""
+
+    def __init__(self, offset: float = 0.0, ratio: float = 1.0, fps: float = DEFAULT_FPS) -> None:
+        self.offset = offset
+        self.ratio = ratio
+        self.fps = fps
+        self.cues = 0
+
+    def _srt(self, found: "re.Match") -> str:
+        parts = found.groups()
+        start = shift_time(parse_timestamp(*parts[:4]), self.offset, self.ratio)
+        end = shift_time(parse_timestamp(*parts[4:]), self.offset, self.ratio)
+        return f"{format_timestamp(start)} --> {format_timestamp(end)}"
+
+    def _microdvd(self, line: str, found: "re.Match") -> Optional[str]:
+        text = line[found.end():]
+        if self.cues == 0 and found.group(1) in ("0", "1"):
+            # The first line can declare the frames per second: {1}{1}25.000
+            try:
+                self.fps = float(text.strip())
+                return None
+            except ValueError:
+                pass
+        frames = [
+            str(round(shift_time(int(frame) / self.fps, self.offset, self.ratio) * self.fps)) if frame else ""
+            for frame in found.groups()
+        ]
+        return f"{{{frames[0]}}}{{{frames[1]}}}{text}"
+
+    def _subviewer(self, found: "re.Match") -> str:
+        parts = found.groups()
+        times = [
+            format_timestamp(shift_time(parse_timestamp(*parts[index:index + 4]), self.offset, self.ratio))
+            for index in (0, 4)
+        ]
+        # 00:00:01,234 becomes 00:00:01.23
+        return ",".join(time[:-1].replace(",", ".") for time in times)
+
+    def __call__(self, line: str) -> str:
+        """Rewrite one line, counting the cues."""
+        found = TIMESTAMP_REGEX.match(line)
+        if found:
+            line = self._srt(found) + line[found.end():]
+        elif MICRODVD_REGEX.match(line):
+            rewritten = self._microdvd(line, MICRODVD_REGEX.match(line))
+            if rewritten is None:
+                return line
+            line = rewritten
+        elif SUBVIEWER_REGEX.match(line):
+            line = self._subviewer(SUBVIEWER_REGEX.match(line)) + "\n"
+        else:
+            return line
+        self.cues += 1
+        return line
+
+
+def _rewrite_with(path: Path, temp_file: Path, encoding: str, rewriter: LineRewriter) -> None:
+    with open(path, encoding=encoding, newline=None) as source, open(temp_file, "w", encoding="utf-8") as target:
+        for line in source:
+            target.write(rewriter(line))
+
+
+def rewrite_subtitle(
+    path: Path,
+    offset: float = 0.0,
+    ratio: float = 1.0,
+    fps: float = DEFAULT_FPS,
+    encodings: Sequence[str] = ENCODINGS,
+    backup: bool = True,
+    dry_run: bool = False,
+) -> RewriteResult:
+    """Convert a SRT or SUB file to UTF-8 and shift/scale its times, streaming it line by line.
+
+    The file is written to a temporary file, and replaced only when it was read whole;
+    files that are already UTF-8 and don't need new times are left untouched.
+    A single-byte encoding decodes any file, even one in another encoding, so the original is kept
+    as ``<name>.orig`` unless ``backup`` is false; pass ``encodings`` when the guess is wrong,
+    e.g. ``("cp1251",)`` for Cyrillic subtitles.
+    """
+    temp_file = path.with_name(f".{path.name}.tmp")
+    try:
+        with open(path, "rb") as file:
+            if file.read(len(MPEG_PACK_HEADER)) == MPEG_PACK_HEADER:
+                return RewriteResult(path, error="VobSub images, not text")
+        if offset == 0 and ratio == 1 and is_utf8(path):
+            return RewriteResult(path, "utf-8")
+        for encoding in encodings:
+            rewriter = LineRewriter(offset, ratio, fps)
+            try:
+                _rewrite_with(path, temp_file, encoding, rewriter)
+            except UnicodeDecodeError:
+                continue
+            if not dry_run:
+                backup_file = path.with_name(path.name + BACKUP_SUFFIX)
+                if backup and not backup_file.exists():
+                    shutil.copy2(path, backup_file)
+                shutil.copymode(path, temp_file)
+                temp_file.replace(path)
+            return RewriteResult(path, encoding, rewriter.cues, True)
+        # Only reached when latin-1 is not one of the encodings
+        return RewriteResult(path, error=f"not {'/'.join(encodings)}")
+    except OSError as error:
+        return RewriteResult(path, error=error.strerror or str(error))
+    finally:
+        temp_file.unlink(missing_ok=True)
+
+
+def rewrite_subtitles(
+    paths: Iterable[Path],
+    workers: int,
+    offset: float = 0.0,
+    ratio: float = 1.0,
+    fps: float = DEFAULT_FPS,
+    encodings: Sequence[str] = ENCODINGS,
+    backup: bool = True,
+    dry_run: bool = False,
+) -> Iterator[RewriteResult]:
+    """Rewrite many subtitle files in a process pool, with only a few files per worker submitted at a time."""
+    # Imported here: it loads multiprocessing, which the other commands don't need
+    from concurrent.futures import ProcessPoolExecutor
+
+    pending: Deque[Future] = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path in paths:
+            pending.append(executor.submit(rewrite_subtitle, path, offset, ratio, fps, encodings, backup, dry_run))
+            if len(pending) > 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
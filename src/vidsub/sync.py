@@ -0,0 +1,163 @@
+"""Align subtitles to a reference timeline by cross-correlation.
+
+NumPy is an optional dependency, only imported here: install it with ``pip install 'vidsub[sync]'``.
+"""
+import shutil
+import subprocess
+import wave
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, List, Sequence
+
+from vidsub.subtitle import Cue, read_srt
+
+if TYPE_CHECKING:
+    import numpy
+
+# Seconds of each bin of the timelines
+BIN_SIZE = 0.1
+# Subtitles made for a video with another framerate drift by these ratios
+FRAMERATE_RATIOS = tuple(
+    sorted(
+        {1.0}
+        | {
+            source / target
+            for source in (23.976, 24.0, 25.0, 29.97)
+            for target in (23.976, 24.0, 25.0, 29.97)
+            if source != target
+        }
+    )
+)
+# Audio decoded from a video for the speech activity: mono, 16-bit samples
+SAMPLE_RATE = 8000
+# Bins louder than this percentile of the whole track are considered speech
+SPEECH_PERCENTILE = 60
+SUBTITLE_SUFFIXES = (".srt",)
+
+
+@dataclass(frozen=True)
+class SyncResult:
+    """Times of the synced subtitles are ``time * ratio + offset``."""
+
+    offset: float
+    ratio: float
+    score: float
+
+
+def import_numpy() -> Any:
+    """Import NumPy, explaining how to install it if it's missing."""
+    try:
+        import numpy
+    except ImportError as error:
+        raise ImportError("Syncing subtitles needs NumPy. Install it with: pip install 'vidsub[sync]'") from error
+    return numpy
+
+
+def cue_timeline(cues: Sequence[Cue], ratio: float = 1.0, bin_size: float = BIN_SIZE) -> "numpy.ndarray":
+    """Return 1.0 in the bins where a subtitle is shown, 0.0 elsewhere."""
+    np = import_numpy()
+    if not cues:
+        return np.zeros(0)
+    times = np.array([(cue.start, cue.end) for cue in cues]) * ratio
+    starts = np.clip(np.floor(times[:, 0] / bin_size).astype(int), 0, None)
+    ends = np.clip(np.ceil(times[:, 1] / bin_size).astype(int), 0, None)
+    changes = np.zeros(int(ends.max()) + 1)
+    np.add.at(changes, starts, 1)
+    np.add.at(changes, ends, -1)
+    return (np.cumsum(changes)[:-1] > 0).astype(float)
+
+
+def speech_timeline(chunks: Iterable[bytes], sample_rate: int, bin_size: float = BIN_SIZE) -> "numpy.ndarray":
+    """Return 1.0 in the bins of 16-bit mono PCM audio that are loud enough to be speech, 0.0 elsewhere.
+
+    Audio is read in chunks, and only the energy of each bin is kept in memory.
+    """
+    np = import_numpy()
+    samples_per_bin = max(1, int(sample_rate * bin_size))
+    energies: List["numpy.ndarray"] = []
+    rest = np.zeros(0, dtype=np.int16)
+    for chunk in chunks:
+        samples = np.concatenate([rest, np.frombuffer(chunk[:len(chunk) // 2 * 2], dtype="<i2")])
+        whole = len(samples) // samples_per_bin * samples_per_bin
+        if whole:
+            bins = samples[:whole].astype(np.float64).reshape(-1, samples_per_bin)
+            energies.append(np.sqrt(np.mean(bins**2, axis=1)))
+        rest = samples[whole:]
+    if not energies:
+        return np.zeros(0)
+    energy = np.concatenate(energies)
+    return (energy > np.percentile(energy, SPEECH_PERCENTILE)).astype(float)
+
+
+def iter_wav_chunks(path: Path, frames_per_chunk: int = 1 << 16) -> Iterator[bytes]:
+    """Read a 16-bit mono WAV file in chunks."""
+    with wave.open(str(path), "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError(f"{path}: only 16-bit mono WAV files are supported")
+        while True:
+            chunk = wav.readframes(frames_per_chunk)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_decoded_chunks(path: Path, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """Decode the audio of a video with ffmpeg, as 16-bit mono PCM read in chunks."""
+    if not shutil.which("ffmpeg"):
+        raise FileNotFoundError("ffmpeg is needed to decode the audio of a video")
+    args = ["ffmpeg", "-nostdin", "-v", "error", "-i", str(path), "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE)]
+    with subprocess.Popen([*args, "-f", "s16le", "-"], stdout=subprocess.PIPE) as process:
+        assert process.stdout
+        yield from iter(lambda: process.stdout.read(chunk_size), b"")
+
+
+def reference_timeline(path: Path, bin_size: float = BIN_SIZE) -> "numpy.ndarray":
+    """Build the reference timeline from subtitles known to be in sync, a WAV file, or the audio of a video."""
+    if path.suffix.lower() in SUBTITLE_SUFFIXES:
+        return cue_timeline(read_srt(path), bin_size=bin_size)
+    if path.suffix.lower() == ".wav":
+        with wave.open(str(path), "rb") as wav:
+            sample_rate = wav.getframerate()
+        return speech_timeline(iter_wav_chunks(path), sample_rate, bin_size)
+    return speech_timeline(iter_decoded_chunks(path), SAMPLE_RATE, bin_size)
+
+
+def align(
+    cues: Sequence[Cue],
+    reference: "numpy.ndarray",
+    max_offset: float = 60.0,
+    ratios: Iterable[float] = FRAMERATE_RATIOS,
+    bin_size: float = BIN_SIZE,
+) -> SyncResult:
+    """Find the framerate ratio and the offset that best align the cues with the reference timeline.
+
+    For each ratio, all offsets are scored at once with a FFT cross-correlation.
+    """
+    np = import_numpy()
+    max_lag = int(max_offset / bin_size)
+    centered_reference = reference - reference.mean() if len(reference) else reference
+    best = SyncResult(0.0, 1.0, float("-inf"))
+    for ratio in ratios:
+        timeline = cue_timeline(cues, ratio, bin_size)
+        if not len(timeline) or not len(reference):
+            continue
+        centered = timeline - timeline.mean()
+        size = 1 << int(len(reference) + len(timeline)).bit_length()
+        correlation = np.fft.irfft(np.fft.rfft(centered_reference, size) * np.conj(np.fft.rfft(centered, size)), size)
+        # Index k is the score of shifting the cues k bins later; negative shifts are at the end
+        lags = np.concatenate([np.arange(0, max_lag + 1), np.arange(-max_lag, 0)])
+        scores = correlation[lags % size]
+        norm = np.sqrt(np.sum(centered**2) * np.sum(centered_reference**2)) or 1.0
+        position = int(np.argmax(scores))
+        score = float(scores[position] / norm)
+        if score > best.score:
+            best = SyncResult(float(lags[position] * bin_size), ratio, score)
+    return best
+
+
+def apply(cues: Iterable[Cue], result: SyncResult) -> List[Cue]:
+    """Move and stretch the cues with the result of an alignment."""
+    return [
+        Cue(cue.start * result.ratio + result.offset, cue.end * result.ratio + result.offset, cue.text)
+        for cue in cues
+    ]
@@ -0,0 +1,33 @@
+"""Wall time spent on each phase of a command."""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import DefaultDict, Iterator
+
+import click
+
+
+class PhaseTimer:
+    """Accumulate the wall time and the count of calls of named phases."""
+
+    def __init__(self) -> None:
+        self.seconds: DefaultDict[str, float] = defaultdict(float)
+        self.calls: DefaultDict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Add the time spent inside the block to a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def echo(self) -> None:
+        """Print the phases in the order they first ran."""
+        if not self.seconds:
+            return
+        click.echo(f"\n{'Phase':<10} {'Time':>8} {'Calls':>7}")
+        for name, seconds in self.seconds.items():
+            click.echo(f"{name:<10} {seconds:>7.2f}s {self.calls[name]:>7}")
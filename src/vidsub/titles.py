@@ -0,0 +1,126 @@
+"""Parsing of movie titles from dir names, and fuzzy scoring of IMDb candidates."""
+import re
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from imdb.Movie import Movie
+
+YEAR_REGEX = re.compile(r"^(19|20)\d\d$")
+
+# Tokens of release names that are not part of the title
+RELEASE_TOKENS = {
+    "1080p",
+    "2160p",
+    "480p",
+    "4k",
+    "720p",
+    "aac",
+    "ac3",
+    "bdrip",
+    "bluray",
+    "brrip",
+    "dts",
+    "dvdrip",
+    "extended",
+    "h264",
+    "h265",
+    "hdr",
+    "hdrip",
+    "hevc",
+    "proper",
+    "remastered",
+    "repack",
+    "unrated",
+    "web",
+    "webrip",
+    "x264",
+    "x265",
+    "xvid",
+    "yify",
+}
+
+# A candidate is accepted only if it beats the runner-up by this margin
+AMBIGUITY_MARGIN = 0.05
+
+
+@dataclass(frozen=True)
+class ParsedTitle:
+    """Title and year parsed from a dir name."""
+
+    title: str
+    year: Optional[int]
+
+    @property
+    def query(self) -> str:
+        """IMDb query for this title."""
+        return f"{self.title} {self.year}" if self.year else self.title
+
+
+def normalize(text: str) -> str:
+    """Lowercase the text, remove accents and punctuation."""
+    from slugify import slugify
+
+    return slugify(text, separator=" ")
+
+
+def parse_dir_name(name: str) -> ParsedTitle:
+    """Parse the title and year from a dir name like ``The.Matrix.1999.1080p.BluRay``.
+
+    >>> parse_dir_name("The.Matrix.1999.1080p.BluRay.x264")
+    ParsedTitle(title='the matrix', year=1999)
+    >>> parse_dir_name("2001 A Space Odyssey (1968)")
+    ParsedTitle(title='2001 a space odyssey', year=1968)
+    >>> parse_dir_name("Amélie [DVDRip]")
+    ParsedTitle(title='amelie', year=None)
+    """
+    tokens = normalize(name).split()
+    # The last year-like token is the year; a leading one can be part of the title
+    for position in range(len(tokens) - 1, 0, -1):
+        if YEAR_REGEX.match(tokens[position]):
+            return ParsedTitle(" ".join(tokens[:position]), int(tokens[position]))
+
+    title_tokens: List[str] = []
+    for token in tokens:
+        if token in RELEASE_TOKENS:
+            break
+        title_tokens.append(token)
+    return ParsedTitle(" ".join(title_tokens or tokens), None)
+
+
+def score_candidate(parsed: ParsedTitle, movie: "Movie") -> float:
+    """Score how well an IMDb candidate matches the parsed title, from 0 to 1."""
+    title = normalize(movie.get("title", ""))
+    score = SequenceMatcher(None, parsed.title, title).ratio()
+
+    year = movie.get("year")
+    if parsed.year and year:
+        difference = abs(parsed.year - int(year))
+        score *= 1.0 if difference == 0 else 0.9 if difference == 1 else 0.6
+    elif parsed.year or year:
+        score *= 0.85
+
+    if movie.get("kind") not in (None, "movie"):
+        score *= 0.9
+    return score
+
+
+def best_match(
+    parsed: ParsedTitle, candidates: Sequence["Movie"], threshold: float
+) -> Tuple[Optional["Movie"], float]:
+    """Return the best candidate if it is above the threshold and not ambiguous, and its score."""
+    scored = sorted(
+        ((score_candidate(parsed, movie), movie) for movie in candidates),
+        key=lambda pair: pair[0],
+        reverse=True,
+    )
+    if not scored:
+        return None, 0.0
+
+    best_score, best_movie = scored[0]
+    if best_score < threshold:
+        return None, best_score
+    if len(scored) > 1 and best_score - scored[1][0] < AMBIGUITY_MARGIN:
+        return None, best_score
+    return best_movie, best_score
@@ -0,0 +1,75 @@
+"""Minimal client for the Transmission RPC protocol."""
+import http.client
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+SESSION_ID_HEADER = "X-Transmission-Session-Id"
+
+# Fields needed to find the dir of each torrent
+TORRENT_FIELDS = ("name", "downloadDir", "files", "doneDate", "activityDate")
+
+
+class TransmissionError(Exception):
+    """The Transmission RPC server answered with an error."""
+
+
+class TransmissionClient:
+    """Transmission RPC client that keeps one HTTP connection open for all requests."""
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 9091,
+        path: str = "/transmission/rpc",
+        timeout: float = 30,
+    ) -> None:
+        self.path = path
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.session_id: Optional[str] = None
+
+    def request(self, method: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Call a RPC method and return the arguments of the response."""
+        body = json.dumps({"method": method, "arguments": arguments})
+        # The first request is answered with 409 and the session id to use in the next ones
+        for _ in range(2):
+            response = self._post(body)
+            data = response.read()
+            if response.status != http.client.CONFLICT:
+                break
+            self.session_id = response.getheader(SESSION_ID_HEADER)
+
+        if response.status != http.client.OK:
+            raise TransmissionError(f"{method}: HTTP {response.status} {response.reason}")
+        result = json.loads(data)
+        if result.get("result") != "success":
+            raise TransmissionError(f"{method}: {result.get('result')}")
+        return result.get("arguments", {})
+
+    def _post(self, body: str) -> http.client.HTTPResponse:
+        headers = {"Content-Type": "application/json"}
+        if self.session_id:
+            headers[SESSION_ID_HEADER] = self.session_id
+        try:
+            self.connection.request("POST", self.path, body, headers)
+            return self.connection.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            # The server closed the idle connection: open a new one and try once more
+            self.connection.close()
+            self.connection.request("POST", self.path, body, headers)
+            return self.connection.getresponse()
+
+    def get_torrents(
+        self, fields: Sequence[str] = TORRENT_FIELDS, recently_active=False
+    ) -> List[Dict[str, Any]]:
+        """Get all torrents in a single request, with only the fields that are needed.
+
+        With ``recently_active``, the server only returns torrents that were active in the last minute.
+        """
+        arguments: Dict[str, Any] = {"fields": list(fields)}
+        if recently_active:
+            arguments["ids"] = "recently-active"
+        return self.request("torrent-get", arguments)["torrents"]
+
+    def close(self) -> None:
+        """Close the connection."""
+        self.connection.close()
@@ -0,0 +1,230 @@
+"""Watch the library dirs for changes, with inotify or by polling."""
+import errno
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Union
+
+# Flags from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+# Content writes are not watched: a file being downloaded would send an event for every chunk
+WATCH_MASK = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+# Mounts where changes made on the other side don't send inotify events
+UNWATCHABLE_FS_TYPES = ("fuse", "nfs", "cifs", "smb")
+
+
+def mount_fs_type(path: Union[Path, str]) -> Optional[str]:
+    """Return the type of the filesystem a path is mounted on, from /proc/self/mounts."""
+    resolved = os.path.realpath(path)
+    best_mount, best_type = "", None
+    try:
+        with open("/proc/self/mounts") as mounts:
+            for line in mounts:
+                _, mount_point, fs_type, *_ = line.split()
+                # Spaces in mount points are escaped as octal
+                mount_point = mount_point.replace("\\040", " ")
+                inside = resolved == mount_point or resolved.startswith(mount_point.rstrip("/") + "/")
+                if inside and len(mount_point) >= len(best_mount):
+                    best_mount, best_type = mount_point, fs_type
+    except OSError:
+        return None
+    return best_type
+
+
+def inotify_works_on(path: Union[Path, str]) -> bool:
+    """Tell if inotify sees the changes on a path: not on network mounts like sshfs."""
+    fs_type = mount_fs_type(path) or ""
+    return not fs_type.startswith(UNWATCHABLE_FS_TYPES)
+
+
+class InotifyWatcher:
+    """Watch root dirs and their subdirs with inotify, through ctypes.
+
+    Changes are reported as the top-level entry of a root that contains them.
+    """
+
+    def __init__(self, roots: Iterable[Path]) -> None:
+        # Imported here: only needed when the watch command runs
+        import ctypes
+        import ctypes.util
+
+        self.roots = [Path(root) for root in roots]
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watched: Dict[int, Path] = {}
+        try:
+            for root in self.roots:
+                self._add_watch(root)
+                with os.scandir(root) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            self._add_watch(Path(entry.path))
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, path: Path) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.watched[wd] = path
+            return
+        import ctypes
+
+        error = ctypes.get_errno()
+        # The dir was removed or renamed before it could be watched: its parent event was already seen
+        if error not in (errno.ENOENT, errno.ENOTDIR):
+            raise OSError(error, f"Can't watch {path}: {os.strerror(error)}")
+
+    def _remove_watch(self, path: Path) -> None:
+        for wd, watched_path in list(self.watched.items()):
+            if watched_path == path:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watched[wd]
+
+    def _top_level(self, path: Path) -> Optional[Path]:
+        for root in self.roots:
+            if path.parent == root:
+                return path
+            if root in path.parents:
+                return root / path.relative_to(root).parts[0]
+        return None
+
+    def _all_entries(self) -> Set[Path]:
+        changed: Set[Path] = set()
+        for root in self.roots:
+            changed.update(Path(entry.path) for entry in os.scandir(root))
+        return changed
+
+    def changes(self, timeout: float) -> Set[Path]:
+        """Wait up to ``timeout`` seconds for events, and return the top-level entries that changed."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed: Set[Path] = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: report everything, so nothing is missed
+                return self._all_entries()
+            if mask & IN_IGNORED:
+                self.watched.pop(wd, None)
+                continue
+            watched_dir = self.watched.get(wd)
+            if watched_dir is None:
+                continue
+            path = watched_dir / os.fsdecode(name) if name else watched_dir
+            if watched_dir in self.roots and mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_watch(path)
+                elif mask & IN_MOVED_FROM:
+                    # The watch follows the renamed dir: remove it, the new name gets its own watch
+                    self._remove_watch(path)
+            top_level = self._top_level(path)
+            if top_level:
+                changed.add(top_level)
+        return changed
+
+    def close(self) -> None:
+        """Stop watching."""
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Detect changes by comparing the mtimes of the top-level entries of root dirs.
+
+    Adding, removing or renaming a file in a movie dir changes the mtime of the dir.
+    """
+
+    def __init__(self, roots: Iterable[Path]) -> None:
+        self.roots = [Path(root) for root in roots]
+        self.mtimes = self._snapshot()
+
+    def _snapshot(self) -> Dict[Path, int]:
+        mtimes: Dict[Path, int] = {}
+        for root in self.roots:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    mtimes[Path(entry.path)] = entry.stat(follow_symlinks=False).st_mtime_ns
+        return mtimes
+
+    def changes(self, timeout: float) -> Set[Path]:
+        """Wait ``timeout`` seconds, and return the top-level entries that changed since the last poll."""
+        time.sleep(timeout)
+        previous, self.mtimes = self.mtimes, self._snapshot()
+        return {
+            path
+            for path in previous.keys() | self.mtimes.keys()
+            if previous.get(path) != self.mtimes.get(path)
+        }
+
+    def close(self) -> None:
+        """Nothing to release."""
+
+
+def create_watcher(
+    roots: Iterable[Path], poll=False
+) -> Union[InotifyWatcher, PollingWatcher]:
+    """Watch with inotify when it works on all roots, otherwise by polling."""
+    roots = list(roots)
+    if not poll and all(inotify_works_on(root) for root in roots):
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError):
+            # Not Linux, or too many dirs for fs.inotify.max_user_watches
+            pass
+    return PollingWatcher(roots)
+
+
+class SettleQueue:
+    """Paths waiting until they stop changing for a while before being processed."""
+
+    def __init__(self, settle: float) -> None:
+        self.settle = settle
+        self.due: Dict[Path, float] = {}
+
+    def __contains__(self, path: Path) -> bool:
+        return path in self.due
+
+    def push(self, path: Path) -> None:
+        """Add a path, or wait longer for one that changed again."""
+        self.due[path] = time.monotonic() + self.settle
+
+    def pop_due(self) -> List[Path]:
+        """Remove and return the paths that didn't change during the settle time."""
+        now = time.monotonic()
+        ready = sorted(path for path, due in self.due.items() if due <= now)
+        for path in ready:
+            del self.due[path]
+        return ready
+
+    def timeout(self, default: float) -> float:
+        """Return how long to wait for changes before the next path is due."""
+        if not self.due:
+            return default
+        return max(0.0, min(min(self.due.values()) - time.monotonic(), default))
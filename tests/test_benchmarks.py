@@ -0,0 +1,47 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from vidsub.classify import classify_file
+from vidsub.constants import MOVIE_EXTENSIONS
+from vidsub.library import LibraryIndex
+
+
+@pytest.fixture
+def synthetic(monkeypatch):
+    monkeypatch.syspath_prepend(str(Path(__file__).parent.parent / "benchmarks"))
+    import synthetic
+
+    return synthetic
+
+
+def test_synthetic_library(tmp_path, synthetic):
+    movie_dirs = synthetic.generate_library(tmp_path / "first", 60)
+    assert sorted(movie_dirs) == sorted((tmp_path / "first" / "movies").iterdir())
+    assert list((tmp_path / "first" / "completed").iterdir()) == []
+    # The same seed generates the same library
+    assert [path.name for path in synthetic.generate_library(tmp_path / "second", 60)] == [
+        path.name for path in movie_dirs
+    ]
+
+    movies = [path for path in (tmp_path / "first" / "movies").glob("*/*") if path.suffix in MOVIE_EXTENSIONS]
+    assert len(movies) > 40
+    for movie in movies:
+        # Big on listings, but sparse on disk
+        assert movie.stat().st_size >= 50 * 1024**2
+        assert movie.stat().st_blocks * 512 < 1024**2
+        assert classify_file(movie).binary
+
+    index = LibraryIndex(tmp_path / "first" / "movies", tmp_path / "library.sqlite")
+    records = list(index.iter_dirs())
+    assert len(records) == 60
+    assert any(record.has_nfo for record in records) and any(not record.main_movie for record in records)
+
+
+def test_syscall_latency_is_removed_afterwards(tmp_path, synthetic):
+    originals = os.stat, os.scandir, os.listdir
+    with synthetic.syscall_latency(0.001):
+        with os.scandir(tmp_path) as entries:
+            assert list(entries) == []
+    assert (os.stat, os.scandir, os.listdir) == originals
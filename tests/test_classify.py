@@ -0,0 +1,52 @@
+import os
+
+from vidsub import cache as cache_module
+from vidsub.cache import SqliteCache
+from vidsub.classify import classify_file
+
+
+def test_a_file_is_classified_again_when_its_size_or_mtime_changes(tmp_path):
+    path = tmp_path / "movie.mkv"
+    path.write_text("x" * 300)
+    mtime_ns = path.stat().st_mtime_ns
+    cache = SqliteCache(tmp_path / "classification.sqlite", "classification", 10)
+    assert not classify_file(path, cache=cache).binary
+
+    # Same size and mtime: the cached result is used, without reading the file
+    path.write_bytes(b"\0\1\2" * 100)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    assert not classify_file(path, cache=cache).binary
+
+    # Same mtime, another size
+    path.write_bytes(b"\0\1\2" * 101)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    assert classify_file(path, cache=cache).binary
+
+    # Same size, another mtime
+    path.write_text("x" * 303)
+    os.utime(path, ns=(mtime_ns, mtime_ns + 1))
+    assert not classify_file(path, cache=cache).binary
+
+
+def test_the_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    class Clock:
+        now = 0.0
+
+        @classmethod
+        def time(cls):
+            cls.now += 1
+            return cls.now
+
+    monkeypatch.setattr(cache_module, "time", Clock)
+    paths = [tmp_path / name for name in ("a.mkv", "b.mkv", "c.mkv")]
+    for path in paths:
+        path.write_bytes(b"\0")
+    db_path = tmp_path / "classification.sqlite"
+    cache = SqliteCache(db_path, "classification", 2)
+    for path in paths:
+        classify_file(path, cache=cache)
+    classify_file(paths[0], cache=cache)
+    cache.close()
+
+    cache = SqliteCache(db_path, "classification", 2)
+    assert [cache.get(str(path)) is not None for path in paths] == [True, False, True]
@@ -0,0 +1,45 @@
+import os
+from pathlib import Path
+
+from vidsub import dupes
+from vidsub.dupes import find_identical_files, group_by_imdb_id
+from vidsub.search import SearchEntry
+
+
+def test_group_by_imdb_id():
+    entries = [
+        SearchEntry("/movies/Matrix.1080p", 2, "the matrix", 1999, "tt0133093"),
+        SearchEntry("/movies/Amelie", 1, "amelie", 2001, None),
+        SearchEntry("/movies/Matrix.720p", 0, "the matrix", 1999, "tt0133093"),
+    ]
+    [group] = group_by_imdb_id(entries)
+    assert group.paths == (Path("/movies/Matrix.1080p"), Path("/movies/Matrix.720p"))
+
+
+def test_only_files_with_the_same_size_and_chunks_are_read_whole(tmp_path, monkeypatch):
+    monkeypatch.setattr(dupes, "CHUNK_SIZE", 4)
+    contents = {
+        "a.mkv": b"head-same-tail",
+        "copy.mkv": b"head-same-tail",
+        "link.mkv": None,
+        "middle.mkv": b"head-diff-tail",
+        "other.mkv": b"other-content!",
+        "bigger.mkv": b"head-same-tail!",
+    }
+    for name, content in contents.items():
+        if content:
+            (tmp_path / name).write_bytes(content)
+    os.link(tmp_path / "a.mkv", tmp_path / "link.mkv")
+
+    fully_hashed = []
+    full_hash = dupes.full_hash
+    monkeypatch.setattr(dupes, "full_hash", lambda path, size: fully_hashed.append(path.name) or full_hash(path, size))
+    files = [(tmp_path / name, (tmp_path / name).stat().st_size) for name in contents]
+
+    [group] = find_identical_files(files, 2, min_size=0)
+    assert group.paths == (tmp_path / "a.mkv", tmp_path / "copy.mkv")
+    assert group.wasted == 14
+    assert sorted(fully_hashed) == ["a.mkv", "copy.mkv", "middle.mkv"]
+
+    [quick_group] = find_identical_files(files, 2, full=False, min_size=0)
+    assert set(quick_group.paths) == {tmp_path / "a.mkv", tmp_path / "copy.mkv", tmp_path / "middle.mkv"}
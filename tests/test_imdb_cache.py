@@ -0,0 +1,64 @@
+from imdb.Movie import Movie
+
+from vidsub import MovieManager
+from vidsub.cache import SqliteCache
+from vidsub.imdb_cache import CachedIMDb
+from vidsub.titles import parse_dir_name
+
+
+class FakeIMDb:
+    """Local IMDb backend that counts the calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def search_movie(self, query):
+        self.calls.append(("search", query))
+        return [Movie(movieID="0133093", data={"title": "The Matrix", "year": 1999})]
+
+    def get_movie(self, movie_id):
+        self.calls.append(("get", movie_id))
+        return Movie(movieID=movie_id, data={"title": "The Matrix", "year": 1999, "rating": 8.7})
+
+
+def test_cached_searches_and_movies(tmp_path):
+    backend = FakeIMDb()
+    db_path = tmp_path / "imdb.sqlite"
+    ia = CachedIMDb(
+        backend,
+        SqliteCache(db_path, "search", 10, ttl=60),
+        SqliteCache(db_path, "movie", 10, ttl=60),
+    )
+    for _ in range(3):
+        (movie,) = ia.search_movie("The Matrix")
+        assert (movie.movieID, movie["title"], movie.get("year")) == ("0133093", "The Matrix", 1999)
+        assert ia.get_movie("0133093").get("rating") == 8.7
+    ia.close()
+
+    assert backend.calls == [("search", "The Matrix"), ("get", "0133093")]
+
+
+def test_expired_entries_are_fetched_again(tmp_path):
+    backend = FakeIMDb()
+    ia = CachedIMDb(backend, SqliteCache(tmp_path / "imdb.sqlite", "search", 10, ttl=-1))
+    ia.search_movie("matrix")
+    ia.search_movie("matrix")
+
+    assert backend.calls == [("search", "matrix"), ("search", "matrix")]
+
+
+def test_prefetched_searches_reuse_cached_results(tmp_path):
+    movie_dirs = [tmp_path / name for name in ("The.Matrix.1999.1080p", "Alien.1979.DVDRip")]
+    for movie_dir in movie_dirs:
+        movie_dir.mkdir()
+        (movie_dir / "movie.mkv").write_bytes(b"\0")
+    backend = FakeIMDb()
+    for _ in range(2):
+        ia = CachedIMDb(backend, SqliteCache(tmp_path / "imdb.sqlite", "search", 10, ttl=60))
+        manager = MovieManager(False, ia=ia)
+        for movie_dir in manager.prefetch_imdb(movie_dirs, auto=True):
+            manager.auto_match_imdb(movie_dir, 0.5)
+        ia.close()
+
+    # Only the first run searched, once per dir
+    assert sorted(backend.calls) == sorted(("search", parse_dir_name(movie_dir.name).query) for movie_dir in movie_dirs)
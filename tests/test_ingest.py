@@ -0,0 +1,103 @@
+import errno
+import os
+
+import pytest
+
+from vidsub import ingest
+from vidsub.ingest import FileMove, move_file, move_items, plan_items
+
+
+@pytest.fixture
+def completed(tmp_path):
+    completed_dir = tmp_path / "completed"
+    (completed_dir / "The.Matrix.1999.1080p" / "Subs").mkdir(parents=True)
+    (completed_dir / "The.Matrix.1999.1080p" / "movie.mkv").write_bytes(b"m" * 1000)
+    (completed_dir / "The.Matrix.1999.1080p" / "Subs" / "en.srt").write_text("subtitle")
+    (completed_dir / "Amelie.2001.DVDRip.avi").write_bytes(b"a" * 500)
+    (tmp_path / "movies").mkdir()
+    return completed_dir
+
+
+@pytest.fixture
+def other_filesystem(monkeypatch):
+    """Make renames fail like they do across filesystems."""
+
+    def rename(source, target):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(ingest.os, "rename", rename)
+    monkeypatch.setattr(ingest, "COPY_CHUNK_SIZE", 300)
+
+
+def test_plan_items(completed, tmp_path):
+    assert [(item.source.name, item.target_dir.name) for item in plan_items(completed, tmp_path / "movies")] == [
+        ("Amelie.2001.DVDRip.avi", "amelie-2001"),
+        ("The.Matrix.1999.1080p", "the-matrix-1999"),
+    ]
+
+
+@pytest.mark.parametrize("rename", [True, False])
+def test_move_items(completed, tmp_path, request, rename):
+    if not rename:
+        request.getfixturevalue("other_filesystem")
+    moved = []
+    assert move_items(plan_items(completed, tmp_path / "movies"), 2, moved.append) == []
+    assert sum(moved) == 1508
+    assert list(completed.iterdir()) == []
+    movies = tmp_path / "movies"
+    assert (movies / "the-matrix-1999" / "movie.mkv").read_bytes() == b"m" * 1000
+    assert (movies / "the-matrix-1999" / "Subs" / "en.srt").read_text() == "subtitle"
+    assert (movies / "amelie-2001" / "Amelie.2001.DVDRip.avi").read_bytes() == b"a" * 500
+
+
+def test_resume_an_interrupted_copy(tmp_path, other_filesystem):
+    source = tmp_path / "movie.mkv"
+    source.write_bytes(os.urandom(1000))
+    target = tmp_path / "movie" / "movie.mkv"
+    target.parent.mkdir()
+    part_file = target.with_name("movie.mkv.part")
+    part_file.write_bytes(source.read_bytes()[:700] + b"garbage")
+    content = source.read_bytes()
+
+    move_file(FileMove(source, target, 1000))
+    assert target.read_bytes() == content
+    assert not source.exists() and not part_file.exists()
+
+
+def test_a_different_file_is_not_overwritten(tmp_path):
+    source = tmp_path / "movie.mkv"
+    source.write_bytes(b"new")
+    target = tmp_path / "movie" / "movie.mkv"
+    target.parent.mkdir()
+    target.write_bytes(b"older")
+    with pytest.raises(FileExistsError):
+        move_file(FileMove(source, target, 3))
+    assert source.exists()
+
+
+def test_a_file_of_the_same_size_is_not_overwritten(tmp_path):
+    source = tmp_path / "movie.mkv"
+    source.write_bytes(b"new")
+    target = tmp_path / "movie" / "movie.mkv"
+    target.parent.mkdir()
+    target.write_bytes(b"old")
+    os.utime(target, ns=(0, source.stat().st_mtime_ns - 1_000_000_000))
+    with pytest.raises(FileExistsError):
+        move_file(FileMove(source, target, 3))
+    assert source.exists()
+
+    # A finished copy that was not removed has the mtime of the source
+    target.write_bytes(b"new")
+    os.utime(target, ns=(0, source.stat().st_mtime_ns))
+    move_file(FileMove(source, target, 3))
+    assert not source.exists()
+
+
+def test_a_dir_that_cannot_be_renamed_is_reported(completed, tmp_path, monkeypatch):
+    def rename(source, target):
+        raise PermissionError(errno.EACCES, "Permission denied")
+
+    monkeypatch.setattr(ingest.os, "rename", rename)
+    items = [item for item in plan_items(completed, tmp_path / "movies") if item.source.is_dir()]
+    assert move_items(items, 2) == [(completed / "The.Matrix.1999.1080p", "Permission denied")]
+    assert (completed / "The.Matrix.1999.1080p" / "movie.mkv").exists()
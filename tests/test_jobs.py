@@ -0,0 +1,46 @@
+import subprocess
+import sys
+
+from vidsub.jobs import Job, JobScheduler, run_once
+
+
+def test_failed_jobs_are_retried_and_results_keep_the_job_order():
+    attempts = {}
+
+    def runner(args, timeout):
+        name = args[0]
+        attempts[name] = attempts.get(name, 0) + 1
+        if name == "flaky" and attempts[name] < 2:
+            return subprocess.CompletedProcess(args, 1, "error\n")
+        if name == "broken":
+            raise subprocess.TimeoutExpired(args, timeout)
+        return subprocess.CompletedProcess(args, 0, f"{name} done\n")
+
+    jobs = [Job(name, [name]) for name in ("flaky", "broken", "fine")]
+    results = JobScheduler(3, timeout=1, retries=2, backoff=0, runner=runner).run(jobs)
+
+    assert [(result.job.name, result.success, result.attempts) for result in results] == [
+        ("flaky", True, 2),
+        ("broken", False, 3),
+        ("fine", True, 1),
+    ]
+    assert results[1].error == "timed out after 1s"
+
+
+def test_run_once_kills_the_command_on_timeout():
+    result = JobScheduler(1, timeout=0.2).run_job(Job("sleep", [sys.executable, "-c", "import time; time.sleep(10)"]))
+    assert not result.success
+    assert result.duration < 5
+    assert run_once([sys.executable, "-c", "print('hi')"], 5).stdout == "hi\n"
+
+
+def test_a_command_that_cannot_start_is_not_retried(tmp_path):
+    script = tmp_path / "subtitles.sh"
+    script.write_text("#!/bin/sh\n")
+    jobs = [Job("missing", [str(tmp_path / "missing.sh")]), Job("not executable", [str(script)])]
+    results = JobScheduler(2, retries=2, backoff=10).run(jobs)
+
+    assert [(result.success, result.attempts) for result in results] == [(False, 1), (False, 1)]
+    assert all(result.duration < 5 for result in results)
+    assert "No such file" in results[0].error
+    assert "Permission denied" in results[1].error
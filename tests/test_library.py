@@ -0,0 +1,83 @@
+import os
+
+from vidsub import MovieManager
+from vidsub.library import LibraryIndex, ValidationState
+
+
+def test_refresh_only_rescans_changed_dirs(tmp_path):
+    root = tmp_path / "movies"
+    for name in ("old-movie", "new-movie"):
+        (root / name).mkdir(parents=True)
+        (root / name / f"{name}.mkv").write_bytes(b"\0")
+    (root / "old-movie" / "old-movie.nfo").write_text("url\n")
+    os.utime(root / "old-movie", ns=(1_000_000_000, 1_000_000_000))
+    (root / "stray.mkv").write_bytes(b"\0")
+
+    index = LibraryIndex(root, tmp_path / "library.sqlite")
+    assert index.refresh() == 2
+    assert index.root_files == [str(root / "stray.mkv")]
+    assert [record.path.name for record in index.iter_dirs()] == ["new-movie", "old-movie"]
+    old = next(record for record in index.iter_dirs() if record.path.name == "old-movie")
+    assert old.has_nfo
+    assert old.main_movie == "old-movie.mkv"
+
+    assert index.refresh() == 0
+
+    (root / "new-movie" / "extra.srt").write_text("")
+    assert index.refresh() == 1
+    assert [file.name for file in index.files(root / "new-movie")] == ["extra.srt", "new-movie.mkv"]
+
+
+def test_iter_dirs_since_only_reads_recent_dirs(tmp_path):
+    root = tmp_path / "movies"
+    for name in ("old-movie", "new-movie"):
+        (root / name).mkdir(parents=True)
+    os.utime(root / "old-movie", ns=(1_000_000_000, 1_000_000_000))
+
+    index = LibraryIndex(root, tmp_path / "library.sqlite")
+    assert [record.path.name for record in index.iter_dirs(since_ns=2_000_000_000)] == ["new-movie"]
+
+
+def test_update_rescans_or_forgets_one_dir(tmp_path):
+    root = tmp_path / "movies"
+    (root / "movie").mkdir(parents=True)
+    index = LibraryIndex(root, tmp_path / "library.sqlite")
+    index.refresh()
+
+    (root / "movie" / "movie.mkv").write_bytes(b"\0")
+    assert index.update(root / "movie").main_movie == "movie.mkv"
+    (root / "movie" / "movie.mkv").unlink()
+    (root / "movie").rmdir()
+    assert index.update(root / "movie") is None
+    assert index.count() == 0
+
+
+def test_changed_only_skips_dirs_that_passed_and_did_not_change(tmp_path):
+    root = tmp_path / "movies"
+    valid, invalid = root / "valid-movie", root / "invalid-movie"
+    for movie_dir in (valid, invalid):
+        movie_dir.mkdir(parents=True)
+        (movie_dir / "movie.mkv").write_bytes(b"\0")
+    (valid / "movie.nfo").write_text("url\n")
+    for movie_dir in (valid, invalid):
+        # Old mtimes, so the changes below are seen even on filesystems with coarse timestamps
+        os.utime(movie_dir, ns=(1_000_000_000, 1_000_000_000))
+    state = ValidationState(tmp_path / "library.sqlite")
+    state.record(valid, True)
+    state.record(invalid, False)
+
+    def not_skipped():
+        return [movie_dir.name for movie_dir in MovieManager(False).skip_validated([valid, invalid], state)]
+
+    # A failed validation is tried again, even if nothing changed
+    assert not_skipped() == ["invalid-movie"]
+
+    # Removing the .nfo file (or any other change of names) changes the dir mtime
+    (valid / "movie.nfo").unlink()
+    assert not_skipped() == ["valid-movie", "invalid-movie"]
+    (valid / "movie.nfo").write_text("url\n")
+    os.utime(valid, ns=(1_000_000_000, 1_000_000_000))
+    state.record(valid, True)
+    assert not_skipped() == ["invalid-movie"]
+    os.utime(valid, ns=(2_000_000_000, 2_000_000_000))
+    assert not_skipped() == ["valid-movie", "invalid-movie"]
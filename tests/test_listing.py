@@ -0,0 +1,39 @@
+import os
+
+import click
+
+from vidsub.listing import HEADER, iter_listing, iter_listings
+
+
+def test_tree_listing_with_sizes_and_type_markers(tmp_path):
+    movie_dir = tmp_path / "Movie.2001"
+    (movie_dir / "Subs").mkdir(parents=True)
+    (movie_dir / "Subs" / "en.srt").write_bytes(b"x" * 3000)
+    (movie_dir / "movie.mkv").write_bytes(b"x" * 12_345)
+    (movie_dir / "run.sh").write_text("")
+    os.chmod(movie_dir / "run.sh", 0o755)
+
+    lines = [click.unstyle(line) for line in iter_listing(movie_dir)]
+    assert lines[1].startswith("drwx") and lines[1].endswith(f"{movie_dir}/")
+    assert [line[HEADER.index("Name"):] for line in lines[2:]] == [
+        "├── movie.mkv",
+        "├── run.sh*",
+        "└── Subs/",
+        "    └── en.srt",
+    ]
+    assert [line.split()[1] for line in lines[2:]] == ["12k", "0", "-", "3.0k"]
+
+
+def test_listings_keep_the_order_of_the_dirs(tmp_path):
+    dirs = [tmp_path / str(number) for number in range(10)]
+    for dir_ in dirs:
+        dir_.mkdir()
+    listings = iter_listings(dirs, 3)
+    assert [click.unstyle(lines[1]).split()[-1] for lines in listings] == [f"{dir_}/" for dir_ in dirs]
+
+
+def test_a_dir_that_is_gone_has_no_listing(tmp_path):
+    (tmp_path / "kept").mkdir()
+    listings = list(iter_listings([tmp_path / "gone", tmp_path / "kept"], 2))
+    assert listings[0] is None
+    assert click.unstyle(listings[1][1]).endswith(f"{tmp_path / 'kept'}/")
@@ -0,0 +1,20 @@
+from vidsub.matching import create_matcher, normalize_name
+
+
+def test_queries_are_compiled_once_and_names_normalized_once():
+    assert create_matcher(["Matrix", "1999"]) is create_matcher(("Matrix", "1999"))
+    assert create_matcher(None).match("anything")
+
+    normalize_name.cache_clear()
+    matcher = create_matcher(("matrix.19",))
+    names = ["The.Matrix.1999", "The.Matrix.Reloaded.2003", "Matrix.1999.CAM"]
+    assert [name for name in names + names if matcher.match(name)] == [names[0], names[2]] * 2
+    assert normalize_name.cache_info().misses == len(names)
+
+
+def test_a_query_without_tokens_matches_nothing():
+    assert not create_matcher(["-"]).match("The.Matrix.1999")
+    assert not create_matcher(["...", "!"], ordered=True).match("The.Matrix.1999")
+    # No query at all still matches everything
+    assert create_matcher([]).match("The.Matrix.1999")
+    assert create_matcher([" "]).match("The.Matrix.1999")
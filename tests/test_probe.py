@@ -0,0 +1,101 @@
+import os
+import struct
+
+from vidsub.cache import SqliteCache
+from vidsub.probe import ProbeResult, choose_main_movie, probe, probe_file
+
+
+def ebml(element_id: int, content: bytes) -> bytes:
+    # Sizes as 8-byte integers: a 0x01 marker and 7 bytes
+    size = b"\x01" + len(content).to_bytes(7, "big")
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + size + content
+
+
+def atom(atom_type: bytes, content: bytes) -> bytes:
+    return struct.pack(">I4s", len(content) + 8, atom_type) + content
+
+
+def chunk(chunk_id: bytes, content: bytes) -> bytes:
+    return struct.pack("<4sI", chunk_id, len(content)) + content + b"\0" * (len(content) & 1)
+
+
+def mkv_track(track_type: int, video: bytes = b"") -> bytes:
+    return ebml(0xAE, ebml(0x83, bytes([track_type])) + (ebml(0xE0, video) if video else b""))
+
+
+def write_mkv(path, seconds: float) -> None:
+    info = ebml(0x2AD7B1, (1_000_000).to_bytes(3, "big")) + ebml(0x4489, struct.pack(">d", seconds * 1000))
+    tracks = (
+        mkv_track(1, ebml(0xB0, (1920).to_bytes(2, "big")) + ebml(0xBA, (1080).to_bytes(2, "big")))
+        + mkv_track(2)
+        + mkv_track(2)
+        + mkv_track(17)
+    )
+    segment = ebml(0x1549A966, info) + ebml(0x1654AE6B, tracks) + ebml(0x1F43B675, b"\xff" * 1000)
+    path.write_bytes(ebml(0x1A45DFA3, ebml(0x4282, b"matroska")) + ebml(0x18538067, segment))
+
+
+def test_mkv(tmp_path):
+    path = tmp_path / "movie.mkv"
+    write_mkv(path, 5400)
+    assert probe(path) == ProbeResult(path, path.stat().st_size, "matroska", 5400.0, 1920, 1080, 1, 2, 1)
+
+
+def test_mp4_with_the_index_at_the_end(tmp_path):
+    mvhd = b"\0" * 12 + struct.pack(">II", 1000, 7_200_000) + b"\0" * 80
+    video = atom(b"tkhd", b"\0" * 76 + struct.pack(">II", 1280 << 16, 720 << 16)) + atom(
+        b"mdia", atom(b"hdlr", b"\0" * 8 + b"vide" + b"\0" * 12)
+    )
+    audio = atom(b"tkhd", b"\0" * 84) + atom(b"mdia", atom(b"hdlr", b"\0" * 8 + b"soun" + b"\0" * 12))
+    moov = atom(b"moov", atom(b"mvhd", mvhd) + atom(b"trak", video) + atom(b"trak", audio))
+    path = tmp_path / "movie.mp4"
+    path.write_bytes(atom(b"ftyp", b"isom\0\0\0\0") + atom(b"mdat", b"\0" * 5000) + moov)
+    assert probe(path) == ProbeResult(path, path.stat().st_size, "mp4", 7200.0, 1280, 720, 1, 1, 0)
+
+
+def test_avi(tmp_path):
+    avih = struct.pack("<10I", 40_000, 0, 0, 0, 2500, 0, 2, 0, 640, 480) + b"\0" * 16
+    streams = chunk(b"LIST", b"strl" + chunk(b"strh", b"vids" + b"\0" * 52)) + chunk(
+        b"LIST", b"strl" + chunk(b"strh", b"auds" + b"\0" * 52)
+    )
+    hdrl = chunk(b"LIST", b"hdrl" + chunk(b"avih", avih) + streams)
+    path = tmp_path / "movie.avi"
+    body = b"AVI " + hdrl + chunk(b"LIST", b"movi" + b"\0" * 1000)
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+    assert probe(path) == ProbeResult(path, path.stat().st_size, "avi", 100.0, 640, 480, 1, 1, 0)
+
+
+def test_unknown_and_broken_files(tmp_path):
+    text = tmp_path / "movie.mkv"
+    text.write_text("not a video")
+    broken = tmp_path / "broken.mkv"
+    broken.write_bytes(b"\x1a\x45\xdf\xa3\x00")
+    assert probe(text) == ProbeResult(text, 11)
+    assert probe(broken) == ProbeResult(broken, 5)
+
+
+def test_probe_results_are_cached_by_size_and_mtime(tmp_path):
+    path = tmp_path / "movie.mkv"
+    write_mkv(path, 5400)
+    cache = SqliteCache(tmp_path / "probe.sqlite", "probe", 10)
+    first = probe_file(path, cache)
+    assert probe_file(path, cache) == first
+    assert (cache.hits, cache.misses) == (1, 1)
+    write_mkv(path, 60)
+    os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+    assert probe_file(path, cache).duration == 60
+
+
+def test_choose_main_movie(tmp_path):
+    movie = ProbeResult(tmp_path / "Movie.mkv", 4_000_000_000, duration=6000)
+    sample = ProbeResult(tmp_path / "Movie-sample.mkv", 50_000_000, duration=6000)
+    trailer = ProbeResult(tmp_path / "trailer.mp4", 90_000_000, duration=150)
+    extras = ProbeResult(tmp_path / "Making of.mkv", 900_000_000, duration=1500)
+    assert choose_main_movie([sample, trailer, movie, extras]) == movie
+    assert sample.extra == "sample" and trailer.extra == "trailer" and movie.extra is None
+
+    # A movie in two parts of the same length
+    part_two = ProbeResult(tmp_path / "Movie.CD2.mkv", 3_900_000_000, duration=5800)
+    assert choose_main_movie([movie, part_two]) is None
+    # Unknown durations: the size decides
+    assert choose_main_movie([ProbeResult(tmp_path / "a.avi", 700), ProbeResult(tmp_path / "b.avi", 100)]).size == 700
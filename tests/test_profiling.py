@@ -0,0 +1,44 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+from vidsub import MovieManager
+from vidsub.profiling import NOTES, Profiler
+
+
+def test_profiler_counts_calls_and_restores_the_patched_functions(tmp_path):
+    original_stat = os.stat
+    profiler = Profiler()
+    manager = MovieManager(False)
+    profiler.managers.append(manager)
+    profiler.start()
+    os.stat(tmp_path)
+    (tmp_path / "file.txt").write_text("")
+    subprocess.run([sys.executable, "-c", ""], check=True)
+    with manager.timer.phase("scan"):
+        os.listdir(tmp_path)
+    profiler.stop()
+
+    report = profiler.report()
+    assert report["syscalls"]["stat"] >= 1
+    assert report["syscalls"]["listdir"] == 1
+    assert report["syscalls"]["open"] == 1
+    assert report["subprocesses"] == 1
+    assert report["phases"]["scan"]["calls"] == 1
+    assert os.stat is original_stat
+    assert report["notes"] == NOTES
+
+
+def test_profiler_counts_the_calls_of_the_pathlib_accessor_of_older_pythons(tmp_path, monkeypatch):
+    class NormalAccessor:
+        stat = os.stat
+
+    monkeypatch.setattr(pathlib, "_NormalAccessor", NormalAccessor, raising=False)
+    profiler = Profiler()
+    profiler.start()
+    NormalAccessor().stat(tmp_path)
+    profiler.stop()
+
+    assert profiler.counts["stat"] == 1
+    assert NormalAccessor.stat is os.stat
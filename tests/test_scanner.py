@@ -0,0 +1,36 @@
+import os
+
+from vidsub.scanner import find_files, scandir_newest_first, walk_files
+
+
+def test_find_files_by_extension_and_smart_case(tmp_path):
+    (tmp_path / "Movie" / "Subs").mkdir(parents=True)
+    for name in ("Movie/The.Matrix.mkv", "Movie/the.matrix.srt", "Movie/Subs/MATRIX.avi", "Movie/notes.txt"):
+        (tmp_path / name).write_bytes(b"\0")
+    extensions = {".mkv", ".avi"}
+
+    assert find_files(tmp_path, [], extensions) == ["Movie/Subs/MATRIX.avi", "Movie/The.Matrix.mkv"]
+    # Lowercase ignores the case, like fd; uppercase makes it case sensitive
+    assert find_files(tmp_path, ["matrix"], extensions) == ["Movie/Subs/MATRIX.avi", "Movie/The.Matrix.mkv"]
+    assert find_files(tmp_path, ["Matrix"], extensions) == ["Movie/The.Matrix.mkv"]
+    assert find_files(tmp_path, ["MATRIX", "Matrix"], extensions) == ["Movie/Subs/MATRIX.avi", "Movie/The.Matrix.mkv"]
+
+
+def test_walk_files_skips_hidden_entries_and_symlinked_dirs(tmp_path):
+    (tmp_path / "movie" / ".hidden").mkdir(parents=True)
+    (tmp_path / "movie" / ".hidden" / "secret.mkv").write_bytes(b"\0")
+    (tmp_path / "movie" / ".partial.mkv").write_bytes(b"\0")
+    (tmp_path / "movie" / "movie.mkv").write_bytes(b"\0")
+    # A loop: following it would fail with ELOOP
+    os.symlink(tmp_path, tmp_path / "movie" / "loop")
+
+    assert sorted(entry.name for entry in walk_files(tmp_path)) == ["loop", "movie.mkv"]
+    assert find_files(tmp_path, [], {".mkv"}) == ["movie/movie.mkv"]
+
+
+def test_scandir_newest_first(tmp_path):
+    for name in ("old", "newest", "middle"):
+        (tmp_path / name).mkdir()
+    for mtime, name in ((1, "old"), (3, "newest"), (2, "middle")):
+        os.utime(tmp_path / name, (mtime, mtime))
+    assert [entry.name for entry in scandir_newest_first(tmp_path)] == ["newest", "middle", "old"]
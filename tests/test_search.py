@@ -0,0 +1,38 @@
+from vidsub.library import LibraryIndex
+from vidsub.search import LibrarySearch, SearchEntry
+
+
+def test_search_by_dir_name_title_year_and_imdb_id(tmp_path):
+    root = tmp_path / "movies"
+    matrix = root / "The.Matrix.1999.1080p"
+    amelie = root / "Amelie.2001.DVDRip"
+    for movie_dir in (matrix, amelie):
+        movie_dir.mkdir(parents=True)
+        (movie_dir / "movie.mkv").write_bytes(b"\0")
+    (matrix / "movie.nfo").write_text("https://www.imdb.com/title/tt0133093\n")
+    snapshot = tmp_path / "search.pickle"
+
+    search = LibrarySearch.load(LibraryIndex(root, tmp_path / "library.sqlite"), snapshot=snapshot)
+    assert [entry.path for entry in search.search(["1999", "matr"])] == [str(matrix)]
+    assert search.search(["tt0133093"]) == [
+        SearchEntry(str(matrix), matrix.stat().st_mtime_ns, "the matrix", 1999, "tt0133093")
+    ]
+    assert [entry.path for entry in search.search(["am", "01"])] == [str(amelie)]
+    assert len(search.search([])) == 2
+    assert search.search(["-"]) == []
+    assert search.search(["matrix", "2001"]) == []
+
+    # Nothing changed: the snapshot is loaded as it is
+    assert snapshot.exists()
+    reloaded = LibrarySearch.load(LibraryIndex(root, tmp_path / "library.sqlite"), snapshot=snapshot)
+    assert reloaded.rows == search.rows
+
+
+def test_a_snapshot_of_an_older_version_is_built_again(tmp_path):
+    root = tmp_path / "movies"
+    (root / "Alien.1979").mkdir(parents=True)
+    snapshot = tmp_path / "search.pickle"
+    for old_class in (b"vidsub.search\nRemovedClass", b"vidsub.removed_module\nSearch"):
+        snapshot.write_bytes(b"c" + old_class + b"\n.")
+        search = LibrarySearch.load(LibraryIndex(root, tmp_path / "library.sqlite"), snapshot=snapshot)
+        assert [entry.path for entry in search.search(["alien"])] == [str(root / "Alien.1979")]
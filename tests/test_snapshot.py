@@ -0,0 +1,81 @@
+import io
+import json
+
+import pytest
+
+from vidsub.cache import SqliteCache
+from vidsub.library import LibraryIndex
+from vidsub.snapshot import SnapshotError, iter_records, load_snapshot, write_ndjson
+
+
+@pytest.fixture
+def ndjson(tmp_path):
+    movies = tmp_path / "server" / "movies"
+    (movies / "The.Matrix.1999").mkdir(parents=True)
+    (movies / "The.Matrix.1999" / "matrix.mkv").write_bytes(b"\0\1\2" * 100)
+    (movies / "The.Matrix.1999" / "matrix.nfo").write_text("https://www.imdb.com/title/tt0133093\n")
+    (movies / "Amelie.2001" / "Subs").mkdir(parents=True)
+    (movies / "Amelie.2001" / "amelie.avi").write_bytes(b"\0" * 10)
+    (movies / "single-file.mkv").write_bytes(b"\0")
+    (tmp_path / "server" / "completed" / "New.Movie").mkdir(parents=True)
+
+    stream = io.StringIO()
+    write_ndjson(iter_records(movies, tmp_path / "server" / "completed", 2), stream)
+    return stream.getvalue()
+
+
+def test_load_a_snapshot_from_another_host(tmp_path, ndjson):
+    root = tmp_path / "client" / "movies"
+    index = LibraryIndex(root, tmp_path / "library.sqlite")
+    snapshot = load_snapshot(io.StringIO(ndjson), index)
+
+    assert (snapshot.root_files, snapshot.completed, snapshot.dirs) == (["single-file.mkv"], ["New.Movie"], 2)
+    assert snapshot.binary == {str(root / "Amelie.2001" / "amelie.avi"), str(root / "The.Matrix.1999" / "matrix.mkv")}
+    # Binary files were probed where the disk is, with their paths and sizes on the client
+    amelie = snapshot.probes[str(root / "Amelie.2001" / "amelie.avi")]
+    assert (amelie.path, amelie.size) == (root / "Amelie.2001" / "amelie.avi", 10)
+    assert set(snapshot.probes) == snapshot.binary
+    matrix = index.record(root / "The.Matrix.1999")
+    assert matrix.has_nfo and matrix.main_movie == "matrix.mkv"
+    assert [(file.name, file.is_dir) for file in index.files(root / "Amelie.2001")] == [
+        ("Subs", True),
+        ("amelie.avi", False),
+    ]
+    # The client never lists its own movies dir, which doesn't even exist
+    assert not root.exists()
+    assert len(list(index.iter_dirs())) == 2
+
+
+def test_a_truncated_snapshot_leaves_the_index_as_it_was(tmp_path, ndjson):
+    root = tmp_path / "client" / "movies"
+    index = LibraryIndex(root, tmp_path / "library.sqlite")
+    load_snapshot(io.StringIO(ndjson), index)
+    old_files = index.files(root / "Amelie.2001")
+
+    header, amelie, *_ = ndjson.splitlines(keepends=True)
+    # The first dir changed since the last snapshot, so it's stored before the stream ends
+    changed = json.loads(amelie)
+    changed["mtime_ns"] += 1
+    changed["files"] = [["other.mkv", 1, 0, False, True, {}]]
+    changed_amelie = json.dumps(changed) + "\n"
+    for broken in (header + changed_amelie, '{"type": "dir"}\n', header + changed_amelie + "{not json\n"):
+        with pytest.raises(SnapshotError):
+            load_snapshot(io.StringIO(broken), LibraryIndex(root, tmp_path / "library.sqlite"))
+
+    # Read what was committed, with a new connection that doesn't list the (missing) movies dir
+    index = LibraryIndex(root, tmp_path / "library.sqlite")
+    index.refreshed = True
+    assert len(list(index.iter_dirs())) == 2
+    assert index.files(root / "Amelie.2001") == old_files
+
+
+def test_scans_share_the_classification_cache(tmp_path, ndjson):
+    cache = SqliteCache(tmp_path / "classification.sqlite", "classification", 10)
+    scans = []
+    for _ in range(2):
+        stream = io.StringIO()
+        write_ndjson(iter_records(tmp_path / "server" / "movies", tmp_path / "server" / "completed", 2, cache), stream)
+        scans.append(stream.getvalue())
+    assert scans == [ndjson, ndjson]
+    # Both movies and the .nfo file were classified on the first scan only
+    assert (cache.misses, cache.hits) == (3, 3)
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+# vd is called from shell scripts in loops: importing the CLI must stay fast.
+# The baseline is the fastest import measured on a development machine; the budget leaves room for slower ones
+IMPORT_BASELINE_US = 150_000
+IMPORT_BUDGET_US = int(IMPORT_BASELINE_US * 1.5)
+HEAVY_MODULES = ("imdb", "magic", "identify", "slugify", "http.client", "ssl", "sqlite3", "ctypes", "numpy")
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True)
+
+
+def import_time_us() -> int:
+    """Return the cumulative time of importing the CLI in a new interpreter, from ``-X importtime``."""
+    result = run_python("-X", "importtime", "-c", "import vidsub.cli")
+    return next(
+        int(line.split("|")[1])
+        for line in result.stderr.splitlines()
+        if line.split("|")[-1].strip() == "vidsub.cli"
+    )
+
+
+def test_cli_import_does_not_load_heavy_dependencies():
+    result = run_python(
+        "-c", f"import sys, vidsub.cli; print([name for name in {HEAVY_MODULES} if name in sys.modules])"
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_cli_import_time_budget():
+    # Run once more than measured, so no run pays for writing bytecode files;
+    # the fastest run is kept, since other processes only make imports slower
+    run_python("-c", "import vidsub.cli")
+    assert min(import_time_us() for _ in range(3)) < IMPORT_BUDGET_US
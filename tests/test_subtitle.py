@@ -0,0 +1,59 @@
+from vidsub.subtitle import BACKUP_SUFFIX, MPEG_PACK_HEADER, read_srt, rewrite_subtitle, rewrite_subtitles
+
+SRT = "1\r\n00:00:01,000 --> 00:00:02,500\r\nJá é\r\n\r\n2\r\n00:00:03,000 --> 00:00:04,000\r\nFim\r\n"
+
+
+def test_convert_to_utf8_and_shift(tmp_path):
+    srt_file = tmp_path / "movie.srt"
+    srt_file.write_bytes(SRT.encode("cp1252"))
+    result = rewrite_subtitle(srt_file, offset=-1.5, ratio=2.0)
+    assert (result.encoding, result.cues, result.rewritten) == ("cp1252", 2, True)
+    assert srt_file.read_text(encoding="utf-8") == (
+        "1\n00:00:00,500 --> 00:00:03,500\nJá é\n\n2\n00:00:04,500 --> 00:00:06,500\nFim\n"
+    )
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["movie.srt", f"movie.srt{BACKUP_SUFFIX}"]
+
+
+def test_utf8_files_without_new_times_are_not_rewritten(tmp_path):
+    srt_file = tmp_path / "movie.srt"
+    srt_file.write_text(SRT, encoding="utf-8")
+    result = rewrite_subtitle(srt_file)
+    assert (result.encoding, result.rewritten) == ("utf-8", False)
+    assert [cue.text for cue in read_srt(srt_file)] == ["Já é", "Fim"]
+
+
+def test_sub_files(tmp_path):
+    microdvd = tmp_path / "microdvd.sub"
+    microdvd.write_text("{1}{1}25.000\n{25}{50}Hello|there\n{100}{}Bye\n")
+    subviewer = tmp_path / "subviewer.sub"
+    subviewer.write_text("[INFORMATION]\n00:00:01.00,00:00:02.50\nHello\n")
+    vobsub = tmp_path / "vobsub.sub"
+    vobsub.write_bytes(MPEG_PACK_HEADER + b"\xff" * 10)
+
+    results = {result.path.name: result for result in rewrite_subtitles([microdvd, subviewer, vobsub], 2, offset=1.0)}
+    assert results["microdvd.sub"].cues == 2
+    assert microdvd.read_text() == "{1}{1}25.000\n{50}{75}Hello|there\n{125}{}Bye\n"
+    assert subviewer.read_text() == "[INFORMATION]\n00:00:02.00,00:00:03.50\nHello\n"
+    assert results["vobsub.sub"].error
+    assert vobsub.read_bytes() == MPEG_PACK_HEADER + b"\xff" * 10
+
+
+def test_cp1251_files_keep_a_backup_and_can_be_converted_with_their_encoding(tmp_path):
+    original = "1\n00:00:01,000 --> 00:00:02,000\nПривет\n".encode("cp1251")
+    srt_file = tmp_path / "movie.srt"
+    srt_file.write_bytes(original)
+    backup_file = tmp_path / f"movie.srt{BACKUP_SUFFIX}"
+
+    assert rewrite_subtitle(srt_file, dry_run=True).encoding == "cp1252"
+    assert srt_file.read_bytes() == original
+    assert not backup_file.exists()
+
+    # The guess is wrong, but the original bytes are kept
+    rewrite_subtitle(srt_file)
+    assert backup_file.read_bytes() == original
+
+    backup_file.replace(srt_file)
+    result = rewrite_subtitle(srt_file, encodings=("utf-8-sig", "cp1251"), backup=False)
+    assert (result.encoding, result.rewritten) == ("cp1251", True)
+    assert read_srt(srt_file)[0].text == "Привет"
+    assert not backup_file.exists()
@@ -0,0 +1,66 @@
+import random
+import wave
+
+import pytest
+
+from vidsub.subtitle import Cue, format_srt, parse_srt
+from vidsub.sync import SyncResult, align, apply, cue_timeline, reference_timeline
+
+np = pytest.importorskip("numpy")
+
+
+def random_cues(count=300, seed=42):
+    generator = random.Random(seed)
+    cues = []
+    start = 5.0
+    for number in range(count):
+        start += generator.uniform(1.0, 8.0)
+        end = start + generator.uniform(0.8, 4.0)
+        cues.append(Cue(start, end, f"Line {number}"))
+        start = end
+    return cues
+
+
+def test_srt_round_trip():
+    cues = random_cues(5)
+    parsed = parse_srt(format_srt(cues))
+    assert [cue.text for cue in parsed] == [cue.text for cue in cues]
+    assert all(abs(a.start - b.start) < 0.001 and abs(a.end - b.end) < 0.001 for a, b in zip(parsed, cues))
+
+
+def test_cue_timeline():
+    timeline = cue_timeline([Cue(0.1, 0.3, "a"), Cue(0.5, 0.6, "b")], bin_size=0.1)
+    assert timeline.tolist() == [0, 1, 1, 0, 0, 1]
+
+
+@pytest.mark.parametrize("offset, ratio", [(0.0, 1.0), (-12.3, 1.0), (7.5, 25 / 23.976), (-3.0, 23.976 / 25)])
+def test_offset_and_framerate_drift_are_found(offset, ratio):
+    reference = random_cues()
+    # Subtitles out of sync: the inverse of the transformation the sync must find
+    shifted = apply(reference, SyncResult(-offset / ratio, 1 / ratio, 0))
+    result = align(shifted, cue_timeline(reference))
+    assert result.ratio == pytest.approx(ratio, rel=1e-4)
+    assert result.offset == pytest.approx(offset, abs=0.2)
+    synced = apply(shifted, result)
+    assert abs(synced[-1].start - reference[-1].start) < 0.3
+
+
+def test_speech_activity_of_a_wav_file(tmp_path):
+    sample_rate = 8000
+    reference = random_cues(40)
+    duration = reference[-1].end + 2
+    samples = np.random.default_rng(0).normal(0, 50, int(duration * sample_rate))
+    for cue in reference:
+        # Loud noise while someone speaks
+        samples[int(cue.start * sample_rate):int(cue.end * sample_rate)] *= 40
+    wav_file = tmp_path / "movie.wav"
+    with wave.open(str(wav_file), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.clip(samples, -32768, 32767).astype("<i2").tobytes())
+
+    shifted = apply(reference, SyncResult(4.2, 1.0, 0))
+    result = align(shifted, reference_timeline(wav_file))
+    assert result.ratio == 1.0
+    assert result.offset == pytest.approx(-4.2, abs=0.2)
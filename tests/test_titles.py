@@ -0,0 +1,23 @@
+from imdb.Movie import Movie
+
+from vidsub.titles import ParsedTitle, best_match, parse_dir_name
+
+
+def movie(movie_id, title, year, kind="movie"):
+    return Movie(movieID=movie_id, data={"title": title, "year": year, "kind": kind})
+
+
+def test_parse_dir_name():
+    assert parse_dir_name("The.Matrix.1999.1080p.BluRay.x264") == ParsedTitle("the matrix", 1999)
+    assert parse_dir_name("1917 (2019)") == ParsedTitle("1917", 2019)
+    assert parse_dir_name("Amélie.DVDRip.XviD") == ParsedTitle("amelie", None)
+
+
+def test_best_match_accepts_clear_matches_only():
+    parsed = parse_dir_name("The.Matrix.1999.720p")
+    candidates = [movie("0133093", "The Matrix", 1999), movie("0234215", "The Matrix Reloaded", 2003)]
+    assert best_match(parsed, candidates, 0.85)[0].movieID == "0133093"
+
+    remakes = [movie("1", "Solaris", 1972), movie("2", "Solaris", 2002)]
+    assert best_match(parse_dir_name("Solaris"), remakes, 0.5)[0] is None
+    assert best_match(parse_dir_name("Solaris 2002"), remakes, 0.5)[0].movieID == "2"
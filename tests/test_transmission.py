@@ -0,0 +1,79 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from vidsub import MovieManager
+from vidsub.transmission import SESSION_ID_HEADER, TORRENT_FIELDS, TransmissionClient
+
+TORRENTS = [
+    {"downloadDir": "/data/movies", "files": [{"name": "Movie.2001/movie.mkv"}, {"name": "Movie.2001/a.srt"}]},
+    {"downloadDir": "/data/movies", "files": []},
+    {"downloadDir": "/data/movies", "files": [{"name": "Other.1999/other.avi"}]},
+]
+
+
+class StubTransmissionHandler(BaseHTTPRequestHandler):
+    """Answers like Transmission: 409 without a session id, then torrent-get requests."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.headers.get(SESSION_ID_HEADER) != "abc":
+            self.reply(409, b"", {SESSION_ID_HEADER: "abc"})
+            return
+        self.server.requests.append(body)
+        self.server.ports.add(self.client_address[1])
+        torrents = TORRENTS[:1] if body["arguments"].get("ids") == "recently-active" else TORRENTS
+        self.reply(200, json.dumps({"result": "success", "arguments": {"torrents": torrents}}).encode())
+
+    def reply(self, status, data, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubTransmissionHandler)
+    server.requests = []
+    server.ports = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_torrents_are_fetched_in_one_request_on_one_connection(stub_server):
+    client = TransmissionClient("127.0.0.1", stub_server.server_port)
+    assert len(client.get_torrents()) == 3
+    assert len(client.get_torrents(recently_active=True)) == 1
+    client.close()
+
+    assert stub_server.requests == [
+        {"method": "torrent-get", "arguments": {"fields": list(TORRENT_FIELDS)}},
+        {"method": "torrent-get", "arguments": {"fields": list(TORRENT_FIELDS), "ids": "recently-active"}},
+    ]
+    assert len(stub_server.ports) == 1
+
+
+def test_iter_torrent_dirs(stub_server):
+    manager = MovieManager(False)
+    manager.transmission = TransmissionClient("127.0.0.1", stub_server.server_port)
+
+    assert list(manager.iter_torrent_dirs()) == [
+        Path("~/data/movies/Movie.2001").expanduser(),
+        Path("~/data/movies/Other.1999").expanduser(),
+    ]
+    assert list(manager.iter_torrent_dirs(("oth",))) == [Path("~/data/movies/Other.1999").expanduser()]
+    assert len(stub_server.requests) == 2
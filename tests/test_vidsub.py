@@ -1,6 +1,37 @@
+import os
+import threading
+import time
+
+import click
+import pytest
 from click.testing import CliRunner
 
-from vidsub.cli import main
+import vidsub
+from vidsub import MovieManager, classify, cli, imdb_cache, library, probe
+from vidsub.classify import Classification
+from vidsub.cli import main, process_changed_dir
+from vidsub.constants import IMDB_URL
+from vidsub.library import FileRecord, LibraryIndex, MovieDirRecord, ValidationState
+from vidsub.snapshot import iter_records, write_ndjson
+
+
+@pytest.fixture
+def movies_dir(tmp_path, monkeypatch):
+    """A library under a temporary dir, with the caches next to it: each movie dir has a movie and a .nfo file."""
+    root = tmp_path / "data"
+    for module in (vidsub, cli):
+        monkeypatch.setattr(module, "MOVIES_DIR", root / "movies")
+        monkeypatch.setattr(module, "COMPLETED_DIR", root / "completed")
+    monkeypatch.setattr(classify, "CLASSIFICATION_DB", tmp_path / "cache" / "classification.sqlite")
+    monkeypatch.setattr(probe, "PROBE_DB", tmp_path / "cache" / "probe.sqlite")
+    monkeypatch.setattr(imdb_cache, "IMDB_DB", tmp_path / "cache" / "imdb.sqlite")
+    (root / "completed").mkdir(parents=True)
+    for name in ("the-matrix-1999", "the-matrix-reloaded-2003", "alien-1979"):
+        movie_dir = root / "movies" / name
+        movie_dir.mkdir(parents=True)
+        (movie_dir / f"{name}.mkv").write_bytes(b"\0" * 100)
+        (movie_dir / f"{name}.nfo").write_text(f"{IMDB_URL}0133093\n")
+    return root / "movies"
 
 
 def test_main():
@@ -9,3 +40,172 @@ def test_main():
 
     assert result.output == ""
     assert result.exit_code == 0
+
+
+def test_validate_sizes_the_progress_bar_from_the_filtered_dirs(movies_dir, monkeypatch):
+    lengths = []
+    progressbar = click.progressbar
+
+    def recording_progressbar(**kwargs):
+        lengths.append(kwargs["length"])
+        return progressbar(**kwargs)
+
+    monkeypatch.setattr(click, "progressbar", recording_progressbar)
+    result = CliRunner().invoke(main, ["--no-index", "validate", "--verbose", "matrix"])
+    assert result.exit_code == 0, result.output
+    assert lengths == [2]
+
+    lines = result.output.splitlines()
+    header = next(number for number, line in enumerate(lines) if line.startswith("Phase"))
+    phases = {line.split()[0]: int(line.split()[-1]) for line in lines[header + 1:]}
+    # One listing of the root, then one of each dir; the classification is waited for once per dir
+    assert phases == {"scan": 3, "classify": 2}
+
+
+@pytest.mark.parametrize("no_cache", [False, True])
+def test_validate_no_cache_does_not_read_or_write_the_classification_cache(movies_dir, no_cache):
+    result = CliRunner().invoke(main, ["--no-index", "validate", *(["--no-cache"] if no_cache else [])])
+    assert result.exit_code == 0, result.output
+    assert classify.CLASSIFICATION_DB.exists() is not no_cache
+
+
+def test_dirs_are_classified_ahead_and_yielded_in_their_order(tmp_path, monkeypatch):
+    dirs = [tmp_path / f"movie-{number}" for number in range(6)]
+    for movie_dir in dirs:
+        movie_dir.mkdir()
+        (movie_dir / "movie.mkv").write_bytes(b"\0")
+    next_dir_started = threading.Event()
+
+    def classify_file(path, use_magic, cache):
+        if path.parent == dirs[1]:
+            next_dir_started.set()
+        elif path.parent == dirs[0]:
+            # The first dir finishes last: only after the next one started
+            assert next_dir_started.wait(5)
+        return Classification(path, True)
+
+    monkeypatch.setattr(vidsub, "classify_file", classify_file)
+    classified = list(MovieManager(False, workers=2).iter_classified_dirs(dirs))
+    assert [movie_dir for movie_dir, _ in classified] == dirs
+    assert [[item.path for item in items] for _, items in classified] == [[path / "movie.mkv"] for path in dirs]
+
+
+def test_each_movie_dir_is_listed_once_without_the_index(movies_dir, monkeypatch):
+    listed = []
+
+    def counting(function):
+        def wrapper(path):
+            listed.append(os.fspath(path))
+            return function(path)
+
+        return wrapper
+
+    # Path.iterdir() uses one or the other, depending on the Python version
+    for name in ("scandir", "listdir"):
+        monkeypatch.setattr(os, name, counting(getattr(os, name)))
+    result = CliRunner().invoke(main, ["--no-index", "validate", "--no-cache"])
+    assert result.exit_code == 0, result.output
+    movie_dirs = [path for path in listed if path.startswith(f"{movies_dir}/")]
+    assert sorted(movie_dirs) == sorted(str(path) for path in movies_dir.iterdir())
+
+
+def test_search_commands_walk_the_movies_dir_without_the_index(movies_dir, monkeypatch):
+    databases = []
+    connect = library.connect
+
+    def recording_connect(db_path):
+        databases.append(db_path)
+        return connect(db_path)
+
+    monkeypatch.setattr(library, "connect", recording_connect)
+    result = CliRunner().invoke(main, ["--no-index", "find", "--paths", "matrix"])
+    assert result.exit_code == 0, result.output
+    assert sorted(result.output.splitlines()) == [
+        str(movies_dir / "the-matrix-1999"),
+        str(movies_dir / "the-matrix-reloaded-2003"),
+    ]
+    assert databases == [library.MEMORY_DB]
+
+
+def test_recent_movies_are_the_same_with_and_without_the_index(tmp_path, monkeypatch):
+    day = 86_400 * 1_000_000_000
+    now = time.time_ns()
+    since_ns = now - 7 * day
+    movies_dir = tmp_path / "movies"
+    # Name, age of the files in days, age of the dir in days
+    layout = [
+        ("new-movie", {"new.mkv": 1, "old.avi": 30, "new.srt": 1}, 1),
+        ("only-subtitles", {"new.srt": 1}, 2),
+        ("old-dir-with-a-new-movie", {"new.mkv": 1}, 30),
+        ("old-movie", {"old.mkv": 30}, 60),
+    ]
+    for name, files, dir_age in layout:
+        movie_dir = movies_dir / name
+        movie_dir.mkdir(parents=True)
+        for file_name, age in files.items():
+            (movie_dir / file_name).write_bytes(b"")
+            os.utime(movie_dir / file_name, ns=(now - age * day, now - age * day))
+        os.utime(movie_dir, ns=(now - dir_age * day, now - dir_age * day))
+    # A new file under the root is not a movie dir
+    (movies_dir / "notes.txt").write_text("")
+    monkeypatch.setattr(vidsub, "MOVIES_DIR", movies_dir)
+
+    results = []
+    for index in (LibraryIndex(movies_dir, tmp_path / "library.sqlite"), None):
+        manager = MovieManager(False, index)
+        results.append(
+            {
+                movie_dir.name: sorted(path.name for path in manager.recent_movies(movie_dir, since_ns))
+                for movie_dir in manager.iter_movie_dirs(since_ns=since_ns)
+            }
+        )
+    assert results[0] == results[1] == {"new-movie": ["new.mkv"], "only-subtitles": []}
+
+
+class NoIMDb:
+    """IMDb backend that finds nothing, without a network."""
+
+    def search_movie(self, query):
+        return []
+
+
+def test_validate_a_snapshot_without_the_mount(movies_dir, tmp_path, monkeypatch):
+    client_dir = tmp_path / "client" / "movies"
+    for module in (vidsub, cli):
+        monkeypatch.setattr(module, "MOVIES_DIR", client_dir)
+    monkeypatch.setattr(cli, "LibraryIndex", lambda root: LibraryIndex(root, tmp_path / "library.sqlite"))
+    monkeypatch.setattr(cli, "ValidationState", lambda: ValidationState(tmp_path / "library.sqlite"))
+    snapshot_file = tmp_path / "snapshot.ndjson"
+
+    def validate(*args):
+        with open(snapshot_file, "w") as stream:
+            write_ndjson(iter_records(movies_dir, movies_dir.parent / "completed", 2), stream)
+        return CliRunner().invoke(
+            main, ["--snapshot", str(snapshot_file), "validate", *args], obj={"imdb_backend": NoIMDb()}
+        )
+
+    # Nothing to write: the snapshot is enough
+    for _ in range(2):
+        result = validate("--changed-only", "--verbose")
+        assert result.exit_code == 0, result.output
+    assert result.output.count("Unchanged since the last validation") == 3
+
+    # The main movie is chosen by the probes of the snapshot, but its .nfo file can't be written
+    two_movies = movies_dir / "two-movies-2010"
+    two_movies.mkdir()
+    (two_movies / "movie.mkv").write_bytes(b"\0" * 1000)
+    (two_movies / "other.mkv").write_bytes(b"\0" * 100)
+    result = validate("--auto", "--verbose")
+    assert result.exit_code == 1, result.output
+    assert "Main movie: movie.mkv" in result.output
+    nfo_file = client_dir / "two-movies-2010" / "movie.nfo"
+    assert f"Snapshot mode is read-only: mount {client_dir} to write {nfo_file}" in result.output
+    assert not isinstance(result.exception, OSError)
+    assert not client_dir.exists()
+
+
+def test_a_main_movie_removed_after_the_dir_was_indexed_is_skipped(tmp_path, capsys):
+    record = MovieDirRecord(tmp_path, 1, "movie.mkv", False, False)
+    files = [FileRecord("movie.srt", 10, 1, False)]
+    assert process_changed_dir(MovieManager(False), tmp_path, record, files, 0.9) is None
+    assert "Main movie not found" in capsys.readouterr().err
@@ -0,0 +1,56 @@
+import sys
+import time
+
+import pytest
+
+from vidsub.watch import InotifyWatcher, PollingWatcher, SettleQueue
+
+
+@pytest.fixture()
+def roots(tmp_path):
+    movies, completed = tmp_path / "movies", tmp_path / "completed"
+    (movies / "Old.Movie.1999").mkdir(parents=True)
+    completed.mkdir()
+    return movies, completed
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is only available on Linux")
+def test_inotify_reports_top_level_entries(roots):
+    movies, completed = roots
+    watcher = InotifyWatcher(roots)
+    (movies / "Old.Movie.1999" / "old.mkv").write_bytes(b"\0")
+    (movies / "New.Movie.2020").mkdir()
+    (completed / "download.part").write_bytes(b"\0")
+    assert watcher.changes(1) == {
+        movies / "Old.Movie.1999",
+        movies / "New.Movie.2020",
+        completed / "download.part",
+    }
+
+    # New dirs are watched too
+    (movies / "New.Movie.2020" / "new.mkv").write_bytes(b"\0")
+    assert watcher.changes(1) == {movies / "New.Movie.2020"}
+    assert watcher.changes(0) == set()
+    watcher.close()
+
+
+def test_polling_compares_mtimes(roots):
+    movies, completed = roots
+    watcher = PollingWatcher(roots)
+    time.sleep(0.01)
+    (movies / "Old.Movie.1999" / "old.mkv").write_bytes(b"\0")
+    (completed / "download.part").write_bytes(b"\0")
+    assert watcher.changes(0) == {movies / "Old.Movie.1999", completed / "download.part"}
+    assert watcher.changes(0) == set()
+
+
+def test_settle_queue_waits_for_paths_to_stop_changing(tmp_path):
+    queue = SettleQueue(0.05)
+    queue.push(tmp_path)
+    assert tmp_path in queue
+    assert queue.pop_due() == []
+    assert 0 < queue.timeout(10) <= 0.05
+    time.sleep(0.06)
+    assert queue.pop_due() == [tmp_path]
+    assert tmp_path not in queue
+    assert queue.timeout(10) == 10